@@ -0,0 +1,125 @@
+# core/adherence.py
+from collections import Counter, namedtuple
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q, Sum
+from django.utils import timezone
+
+from .models import DailyAdherence, DoseEvent
+
+WINDOWS = (30, 90, 365)
+
+# What the rollups need to know about a reminder.
+Dose = namedtuple("Dose", "reminder_id user_id medicine_id scheduled_at")
+
+ROLLUP_FIELDS = ("due", "taken", "taken_on_time", "skipped")
+
+
+def on_time_window():
+    return timedelta(minutes=getattr(settings, "ADHERENCE_ON_TIME_MINUTES", 60))
+
+
+def _day(dose):
+    return timezone.localdate(dose.scheduled_at)
+
+
+def _apply_rollups(deltas):
+    """Add ``deltas`` ({(user_id, medicine_id, day): Counter}) to the daily rows."""
+    for (user_id, medicine_id, day), delta in deltas.items():
+        changes = {name: F(name) + delta[name] for name in ROLLUP_FIELDS if delta[name]}
+        if not changes:
+            continue
+        rows = DailyAdherence.objects.filter(user_id=user_id, medicine_id=medicine_id, day=day)
+        if rows.update(**changes):
+            continue
+        try:
+            with transaction.atomic():
+                DailyAdherence.objects.create(
+                    user_id=user_id, medicine_id=medicine_id, day=day,
+                    **{name: delta[name] for name in ROLLUP_FIELDS},
+                )
+        except IntegrityError:
+            # Another writer created the row first.
+            rows.update(**changes)
+
+
+def record_dispatched(doses, notified=True):
+    """
+    Log that the dispatcher is done with these doses; each counts once
+    towards ``due``. Doses it gave up on are passed with ``notified=False``:
+    they are still due, but no NOTIFIED event is logged.
+    """
+    doses = [d for d in doses if d.user_id]
+    deltas = {}
+    for dose in doses:
+        deltas.setdefault((dose.user_id, dose.medicine_id, _day(dose)), Counter())["due"] += 1
+
+    with transaction.atomic():
+        if notified:
+            DoseEvent.objects.bulk_create([
+                DoseEvent(
+                    user_id=d.user_id, medicine_id=d.medicine_id, reminder_id=d.reminder_id,
+                    scheduled_at=d.scheduled_at, status=DoseEvent.NOTIFIED,
+                )
+                for d in doses
+            ])
+        _apply_rollups(deltas)
+
+
+def record_acks(acks):
+    """
+    Log first acknowledgements. ``acks`` holds (dose, status, acked_at,
+    was_dispatched) tuples; a dose the dispatcher never sent is counted
+    towards ``due`` here instead.
+    """
+    grace = on_time_window()
+    deltas = {}
+    events = []
+    for dose, status, acked_at, was_dispatched in acks:
+        delta = deltas.setdefault((dose.user_id, dose.medicine_id, _day(dose)), Counter())
+        if not was_dispatched:
+            delta["due"] += 1
+        if status == DoseEvent.TAKEN:
+            delta["taken"] += 1
+            if acked_at - dose.scheduled_at <= grace:
+                delta["taken_on_time"] += 1
+        else:
+            delta["skipped"] += 1
+        events.append(DoseEvent(
+            user_id=dose.user_id, medicine_id=dose.medicine_id, reminder_id=dose.reminder_id,
+            scheduled_at=dose.scheduled_at, acked_at=acked_at, status=status,
+        ))
+
+    with transaction.atomic():
+        DoseEvent.objects.bulk_create(events)
+        _apply_rollups(deltas)
+
+
+def adherence_summary(user, today=None):
+    """
+    Per medicine, the share of due doses taken on time over each of
+    ``WINDOWS`` days. Reads at most one rollup row per medicine per day, so
+    the cost does not grow with the number of raw dose events.
+    """
+    today = today or timezone.localdate()
+    annotations = {}
+    for days in WINDOWS:
+        in_window = Q(day__gt=today - timedelta(days=days))
+        annotations[f"due_{days}"] = Sum("due", filter=in_window)
+        annotations[f"on_time_{days}"] = Sum("taken_on_time", filter=in_window)
+
+    rows = DailyAdherence.objects.filter(
+        user=user, day__gt=today - timedelta(days=max(WINDOWS)), day__lte=today,
+    ).values("medicine_id", "medicine__name").annotate(**annotations).order_by("medicine__name")
+
+    summary = []
+    for row in rows:
+        windows = {}
+        for days in WINDOWS:
+            due = row[f"due_{days}"] or 0
+            on_time = row[f"on_time_{days}"] or 0
+            windows[days] = round(100 * on_time / due, 1) if due else None
+        summary.append({"medicine": row["medicine__name"], "windows": windows})
+    return summary
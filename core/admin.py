@@ -1,3 +1,61 @@
 from django.contrib import admin
 
-# Register your models here.
+from .models import ArchivedReminder, Medicine, MedicineSchedule, PushSubscription, Reminder
+
+
+class OwnedAdmin(admin.ModelAdmin):
+    """Staff who are not superusers only see, and can only pick, their own rows."""
+
+    owner_field = "user"
+
+    def get_queryset(self, request):
+        qs = super().get_queryset(request)
+        if request.user.is_superuser:
+            return qs
+        return qs.filter(**{self.owner_field: request.user})
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        if db_field.name == "medicine" and not request.user.is_superuser:
+            kwargs["queryset"] = Medicine.objects.filter(owner=request.user)
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
+
+
+@admin.register(Medicine)
+class MedicineAdmin(OwnedAdmin):
+    owner_field = "owner"
+    list_display = ("name", "dosage", "frequency", "start_date", "end_date", "owner")
+    list_select_related = ("owner",)
+    search_fields = ("name",)
+    raw_id_fields = ("owner",)
+
+
+@admin.register(Reminder)
+class ReminderAdmin(OwnedAdmin):
+    list_display = ("medicine", "reminder_time", "user", "delivered", "status")
+    list_filter = ("delivered", "status")
+    list_select_related = ("medicine", "user")
+    date_hierarchy = "reminder_time"
+    raw_id_fields = ("user", "schedule")
+
+
+@admin.register(ArchivedReminder)
+class ArchivedReminderAdmin(OwnedAdmin):
+    list_display = ("medicine", "reminder_time", "user", "status")
+    list_filter = ("status",)
+    list_select_related = ("medicine", "user")
+    date_hierarchy = "reminder_time"
+    raw_id_fields = ("user",)
+
+
+@admin.register(MedicineSchedule)
+class MedicineScheduleAdmin(OwnedAdmin):
+    list_display = ("medicine", "user", "interval_days", "weekdays")
+    list_select_related = ("medicine", "user")
+    raw_id_fields = ("user",)
+
+
+@admin.register(PushSubscription)
+class PushSubscriptionAdmin(OwnedAdmin):
+    list_display = ("user", "endpoint", "created_at")
+    list_select_related = ("user",)
+    raw_id_fields = ("user",)
@@ -0,0 +1,106 @@
+# core/archive.py
+"""
+Retention for delivered reminders. ``archive_delivered`` moves those older
+than the retention period into ArchivedReminder in short batches, so
+core_reminder only holds pending and recent history; ``history_page``
+reads the two tables back as one list.
+"""
+from dataclasses import dataclass
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+
+from .db import delete_rows
+from .models import ArchivedReminder, DoseEvent, Reminder
+from .pagination import encode_cursor, keyset_page
+
+DEFAULT_BATCH_SIZE = 1000
+# Newest first; "id" breaks ties. Both tables share the ids.
+HISTORY_ORDERING = ("-reminder_time", "-id")
+
+
+def retention_period():
+    return timedelta(days=getattr(settings, "REMINDER_RETENTION_DAYS", 90))
+
+
+@dataclass
+class ArchiveResult:
+    archived: int = 0
+    batches: int = 0
+
+
+def archivable(before):
+    return Reminder.objects.filter(delivered=True, reminder_time__lt=before)
+
+
+def archive_delivered(before, batch_size=DEFAULT_BATCH_SIZE, dry_run=False, progress=None):
+    """
+    Move delivered reminders due before ``before`` to the archive, oldest
+    first. Each batch is copied and deleted in its own short transaction,
+    so an interrupted run loses nothing and the next run carries on where
+    it stopped. With ``dry_run`` only counts what would move.
+    ``progress(result)`` is called after each batch.
+    """
+    result = ArchiveResult()
+    if dry_run:
+        result.archived = archivable(before).count()
+        result.batches = -(-result.archived // batch_size)
+        return result
+
+    while True:
+        with transaction.atomic():
+            batch = archivable(before).order_by("reminder_time", "id")[:batch_size]
+            # What delete() would do for the one relation, without its
+            # per-row signals: history is not a sync deletion and no
+            # dashboard figure counts delivered reminders. Writing first
+            # takes SQLite's write lock up front, so the transaction never
+            # has to upgrade from a read, which can fail at once as
+            # "database is locked".
+            DoseEvent.objects.filter(reminder__in=batch.values("id")).update(reminder=None)
+            rows = list(batch.values_list(
+                "id", "medicine_id", "user_id", "reminder_time", "status", "acknowledged_at"
+            ))
+            if not rows:
+                break
+            pks = [row[0] for row in rows]
+            ArchivedReminder.objects.bulk_create(
+                [
+                    ArchivedReminder(
+                        id=pk, medicine_id=medicine_id, user_id=user_id, reminder_time=reminder_time,
+                        status=status, acknowledged_at=acknowledged_at,
+                    )
+                    for pk, medicine_id, user_id, reminder_time, status, acknowledged_at in rows
+                ],
+                ignore_conflicts=True,
+            )
+            delete_rows(Reminder, pks)
+        result.archived += len(rows)
+        result.batches += 1
+        if progress is not None:
+            progress(result)
+    return result
+
+
+def history_page(user, cursor=None, page_size=20):
+    """
+    One page of the user's delivered reminders, newest first, merging the
+    live rows with the archived ones. Rows are dicts with id, reminder_time,
+    status and medicine_name; cursors are the same as for the live list.
+    """
+    columns = ("id", "reminder_time", "status")
+    live, live_next = keyset_page(
+        Reminder.objects.filter(user=user, delivered=True).values(*columns, medicine_name=F("medicine__name")),
+        HISTORY_ORDERING, cursor, page_size,
+    )
+    archived, archived_next = keyset_page(
+        ArchivedReminder.objects.filter(user=user).values(*columns, medicine_name=F("medicine__name")),
+        HISTORY_ORDERING, cursor, page_size,
+    )
+
+    rows = sorted(live + archived, key=lambda row: (row["reminder_time"], row["id"]), reverse=True)
+    page = rows[:page_size]
+    if not (live_next or archived_next or len(rows) > page_size):
+        return page, None
+    return page, encode_cursor([page[-1]["reminder_time"], page[-1]["id"]])
@@ -0,0 +1,176 @@
+# core/benchmarks.py
+import random
+import statistics
+import time
+from datetime import date, timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from .delivery import ReminderDispatcher
+from .models import Medicine, MedicineSchedule, Reminder, UserProfile
+from .schedules import generate_course
+
+SEED_BATCH_SIZE = 5000
+
+
+def seed(users=10, medicines_per_user=5, reminders_per_medicine=20, due=500, rng=None):
+    """
+    Fill the database with a synthetic dataset. Each medicine's reminders are
+    spread evenly over the 30 days either side of now; past ones are
+    delivered. ``due`` extra undelivered, past-due reminders are added for
+    the dispatcher benchmark. Returns the first user, used for the endpoint
+    benchmarks.
+    """
+    rng = rng or random.Random(0)
+    now = timezone.now()
+    today = date.today()
+    password = make_password("benchmark")
+
+    User.objects.bulk_create(
+        [User(username=f"bench{i}", email=f"bench{i}@example.com", password=password) for i in range(users)],
+        batch_size=SEED_BATCH_SIZE,
+    )
+    user_ids = list(User.objects.filter(username__startswith="bench").values_list("pk", flat=True))
+    UserProfile.objects.bulk_create([UserProfile(user_id=pk) for pk in user_ids], batch_size=SEED_BATCH_SIZE)
+
+    Medicine.objects.bulk_create(
+        [
+            Medicine(
+                name=f"Medicine {i}", dosage="10 mg", frequency="Daily", owner_id=user_id,
+                start_date=today - timedelta(days=30), end_date=today + timedelta(days=30),
+            )
+            for user_id in user_ids
+            for i in range(medicines_per_user)
+        ],
+        batch_size=SEED_BATCH_SIZE,
+    )
+    medicine_ids = list(Medicine.objects.order_by("pk").values_list("pk", flat=True))
+
+    span = timedelta(days=60)
+    step = span / max(reminders_per_medicine, 1)
+    first = now - span / 2
+
+    def reminders():
+        for u, user_id in enumerate(user_ids):
+            for medicine_id in medicine_ids[u * medicines_per_user:(u + 1) * medicines_per_user]:
+                for i in range(reminders_per_medicine):
+                    when = first + step * i
+                    yield Reminder(medicine_id=medicine_id, user_id=user_id,
+                                   reminder_time=when, delivered=when < now)
+        for _ in range(due):
+            u = rng.randrange(len(user_ids))
+            owned = medicine_ids[u * medicines_per_user:(u + 1) * medicines_per_user]
+            yield Reminder(medicine_id=rng.choice(owned), user_id=user_ids[u],
+                           reminder_time=now - timedelta(minutes=rng.randint(1, 60)))
+
+    batch = []
+    for reminder in reminders():
+        batch.append(reminder)
+        if len(batch) >= SEED_BATCH_SIZE:
+            Reminder.objects.bulk_create(batch)
+            batch = []
+    Reminder.objects.bulk_create(batch)
+
+    return User.objects.get(pk=user_ids[0])
+
+
+def _percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def measure(client, urls, repeat):
+    """Time ``repeat`` GETs, cycling through ``urls``; report latency percentiles and queries."""
+    timings, queries = [], []
+    for i in range(repeat):
+        url = urls[i % len(urls)]
+        with CaptureQueriesContext(connection) as ctx:
+            started = time.perf_counter()
+            response = client.get(url)
+            timings.append((time.perf_counter() - started) * 1000)
+        if response.status_code >= 400:
+            raise RuntimeError(f"GET {url} returned {response.status_code}")
+        queries.append(len(ctx.captured_queries))
+
+    return {
+        "p50_ms": round(_percentile(timings, 50), 3),
+        "p95_ms": round(_percentile(timings, 95), 3),
+        "p99_ms": round(_percentile(timings, 99), 3),
+        "mean_ms": round(statistics.fmean(timings), 3),
+        "queries": max(queries),
+    }
+
+
+def run_benchmarks(user, repeat=50, workers=8):
+    client = Client()
+    client.force_login(user)
+
+    results = {
+        "dashboard": measure(client, ["/"], repeat),
+        "reminders": measure(client, ["/reminders/"], repeat),
+        "api_get_reminders": measure(client, ["/api/get-reminders/"], repeat),
+    }
+
+    pending = list(
+        Reminder.objects.filter(user=user, delivered=False).values_list("pk", flat=True)[:repeat]
+    )
+    if pending:
+        results["api_mark_delivered"] = measure(
+            client, [f"/api/mark-delivered/{pk}/" for pk in pending], len(pending)
+        )
+
+    stats = ReminderDispatcher(workers=workers).run()
+    results["send_reminders"] = {
+        "delivered": stats.delivered,
+        "reminders_per_sec": round(stats.throughput, 1),
+    }
+
+    # A year-long course taken three times a day, generated in one go.
+    today = timezone.localdate()
+    medicine = Medicine.objects.create(
+        name="Benchmark course", dosage="10 mg", frequency="3x daily", owner=user,
+        start_date=today, end_date=today + timedelta(days=364),
+    )
+    schedule = MedicineSchedule(medicine=medicine, user=user, times_of_day=["08:00", "14:00", "20:00"])
+    # Only the course generation is timed, not the window the save stores.
+    schedule.save()
+    with CaptureQueriesContext(connection) as ctx:
+        started = time.perf_counter()
+        created = generate_course(schedule)
+        elapsed = (time.perf_counter() - started) * 1000
+    results["generate_course"] = {
+        "created": len(created),
+        "elapsed_ms": round(elapsed, 3),
+        "queries": len(ctx.captured_queries),
+    }
+    return results
+
+
+def compare(results, baseline, threshold):
+    """
+    List regressions of ``results`` against ``baseline``: latencies more than
+    ``threshold`` (a fraction) slower, throughput more than ``threshold``
+    lower, or any increase in query count.
+    """
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if not previous:
+            continue
+        for metric, value in current.items():
+            before = previous.get(metric)
+            if before is None:
+                continue
+            if metric.endswith("_ms") and value > before * (1 + threshold):
+                regressions.append(f"{name}.{metric}: {before} -> {value}")
+            elif metric == "reminders_per_sec" and value < before * (1 - threshold):
+                regressions.append(f"{name}.{metric}: {before} -> {value}")
+            elif metric == "queries" and value > before:
+                regressions.append(f"{name}.{metric}: {before} -> {value}")
+    return regressions
@@ -0,0 +1,204 @@
+# core/bulk.py
+import csv
+import json
+from dataclasses import dataclass, field
+
+from django import forms
+from django.db import transaction
+from django.utils import timezone
+
+from .dashboard import invalidate_dashboard
+from .forms import MedicineForm, ReminderForm
+from .changes import next_seqs
+from .models import Medicine, Reminder
+
+DEFAULT_CHUNK_SIZE = 500
+# Only the first few row errors are kept, so a bad file can't grow memory.
+MAX_REPORTED_ERRORS = 100
+
+FORMATS = ("csv", "jsonl")
+MEDICINE_FIELDS = ["name", "dosage", "frequency", "start_date", "end_date"]
+
+
+def guess_format(filename):
+    if filename.lower().endswith((".jsonl", ".ndjson")):
+        return "jsonl"
+    return "csv"
+
+
+def iter_rows(lines, fmt):
+    """Parse an iterable of text lines into dicts, one row at a time."""
+    if fmt == "csv":
+        yield from csv.DictReader(lines)
+        return
+    for line in lines:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+
+@dataclass
+class ImportResult:
+    created: int = 0
+    failed: int = 0
+    errors: list = field(default_factory=list)
+    # Set when the file stopped parsing part way; rows before it are
+    # imported as usual.
+    parse_error: str = ""
+
+    def add_error(self, line, errors):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"row": line, "errors": errors})
+
+
+NOT_AN_OBJECT = {"__all__": [{"message": "Expected an object.", "code": "invalid"}]}
+
+
+def _numbered(rows, result):
+    """
+    Yield (line, row) for each row that is an object. Anything else is a row
+    error; a parse error ends the input and is kept on ``result``.
+    """
+    line = 0
+    try:
+        for line, row in enumerate(rows, start=1):
+            if isinstance(row, dict):
+                yield line, row
+            else:
+                result.add_error(line, NOT_AN_OBJECT)
+    except (ValueError, csv.Error) as e:
+        result.parse_error = f"Row {line + 1}: {e}"
+
+
+class ReminderImportForm(ReminderForm):
+    """
+    ReminderForm rules without the per-row medicine lookup: the medicine is
+    validated as an id here and checked against the database once per chunk.
+    """
+    medicine = forms.IntegerField()
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields["reminder_time"].input_formats += ["%Y-%m-%dT%H:%M:%S", "%Y-%m-%d %H:%M"]
+
+    def _post_clean(self):
+        # Skip building a model instance; rows are bulk-created by the importer.
+        pass
+
+
+def _chunks(rows, size):
+    chunk = []
+    for item in rows:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def import_medicines(rows, user, chunk_size=DEFAULT_CHUNK_SIZE):
+    result = ImportResult()
+
+    def valid_rows():
+        for line, row in _numbered(rows, result):
+            form = MedicineForm(data=row)
+            if form.is_valid():
+                medicine = form.save(commit=False)
+                medicine.owner = user
+                yield medicine
+            else:
+                result.add_error(line, form.errors.get_json_data())
+
+    for chunk in _chunks(valid_rows(), chunk_size):
+        with transaction.atomic():
+            # bulk_create skips the post_save signals that record changes.
+            seq = next_seqs([user.pk]).get(user.pk, 0)
+            for medicine in chunk:
+                medicine.change_seq = seq
+            Medicine.objects.bulk_create(chunk)
+        result.created += len(chunk)
+
+    if result.created:
+        invalidate_dashboard([user.pk])
+    return result
+
+
+def import_reminders(rows, user, chunk_size=DEFAULT_CHUNK_SIZE):
+    result = ImportResult()
+    tz = timezone.get_current_timezone()
+
+    def valid_rows():
+        for line, row in _numbered(rows, result):
+            form = ReminderImportForm(data=row)
+            if not form.is_valid():
+                result.add_error(line, form.errors.get_json_data())
+                continue
+            reminder_time = form.cleaned_data["reminder_time"]
+            if timezone.is_naive(reminder_time):
+                reminder_time = timezone.make_aware(reminder_time, tz)
+            yield line, Reminder(
+                medicine_id=form.cleaned_data["medicine"],
+                reminder_time=reminder_time,
+                user=user,
+            )
+
+    for chunk in _chunks(valid_rows(), chunk_size):
+        known = set(
+            Medicine.objects.filter(
+                owner=user, pk__in={r.medicine_id for _, r in chunk}
+            ).values_list("pk", flat=True)
+        )
+        new = []
+        for line, reminder in chunk:
+            if reminder.medicine_id in known:
+                new.append(reminder)
+            else:
+                result.add_error(line, {"medicine": [{"message": "Unknown medicine.", "code": "invalid_choice"}]})
+        if new:
+            with transaction.atomic():
+                # bulk_create skips the post_save signals that record changes.
+                seq = next_seqs([user.pk]).get(user.pk, 0)
+                for reminder in new:
+                    reminder.change_seq = seq
+                Reminder.objects.bulk_create(new)
+        result.created += len(new)
+
+    if result.created:
+        invalidate_dashboard([user.pk])
+    return result
+
+
+class _Echo:
+    """File-like object whose write() just returns the value, for csv.writer."""
+
+    def write(self, value):
+        return value
+
+
+def _encode(rows, header, fmt):
+    if fmt == "csv":
+        writer = csv.writer(_Echo())
+        yield writer.writerow(header)
+        for row in rows:
+            yield writer.writerow(row)
+    else:
+        for row in rows:
+            yield json.dumps(dict(zip(header, row)), default=str) + "\n"
+
+
+def export_medicines(user, fmt):
+    rows = Medicine.objects.filter(owner=user).order_by("pk").values_list("pk", *MEDICINE_FIELDS)
+    return _encode(rows.iterator(chunk_size=2000), ["id"] + MEDICINE_FIELDS, fmt)
+
+
+def export_reminders(user, fmt):
+    rows = Reminder.objects.filter(user=user).order_by("reminder_time", "pk").values_list(
+        "pk", "medicine_id", "medicine__name", "reminder_time", "delivered"
+    )
+    rows = (
+        (pk, medicine_id, name, when.isoformat(), delivered)
+        for pk, medicine_id, name, when, delivered in rows.iterator(chunk_size=2000)
+    )
+    return _encode(rows, ["id", "medicine", "medicine_name", "reminder_time", "delivered"], fmt)
@@ -0,0 +1,129 @@
+# core/changes.py
+"""
+Change sequence for delta sync.
+
+Each user has one counter (UserProfile.reminders_version). Every change to
+their reminders or medicines bumps it and stamps the changed rows, or a
+Tombstone for deleted ones, with the new value in the same transaction. A
+client that has seen everything up to N then asks for rows and tombstones
+with change_seq > N, and its next cursor is the counter it was answered at.
+"""
+from django.db import transaction
+from django.db.models import OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import Medicine, Reminder, Tombstone, UserProfile
+
+
+def current_seq(user):
+    return UserProfile.objects.filter(user=user).values_list(
+        "reminders_version", flat=True
+    ).first() or 0
+
+
+def _seq_of(owner_field):
+    return Coalesce(
+        Subquery(
+            UserProfile.objects.filter(user_id=OuterRef(owner_field)).values("reminders_version")[:1]
+        ),
+        0,
+    )
+
+
+def next_seqs(user_ids):
+    """
+    Bump the users' counters and return {user_id: new value}, for stamping
+    rows before bulk_create. Call inside the transaction that writes them.
+    """
+    user_ids = [pk for pk in set(user_ids) if pk]
+    if not user_ids:
+        return {}
+    UserProfile.bump_reminders_version(user_ids)
+    return dict(
+        UserProfile.objects.filter(user_id__in=user_ids).values_list("user_id", "reminders_version")
+    )
+
+
+def record_changes(user_ids, reminders=None, medicines=None):
+    """
+    Bump the users' counters and stamp the ``reminders`` and ``medicines``
+    querysets with them, for writes that bypass post_save (update(),
+    bulk_create) and for the signal handlers themselves.
+    """
+    user_ids = [pk for pk in set(user_ids) if pk]
+    if not user_ids:
+        return
+    with transaction.atomic():
+        UserProfile.bump_reminders_version(user_ids)
+        if reminders is not None:
+            reminders.update(change_seq=_seq_of("user_id"))
+        if medicines is not None:
+            medicines.update(change_seq=_seq_of("owner_id"))
+
+
+def record_deletes(kind, rows):
+    """Leave a tombstone for each deleted (pk, user_id) row of ``kind``."""
+    rows = [(pk, user_id) for pk, user_id in rows if user_id]
+    if not rows:
+        return
+    with transaction.atomic():
+        seqs = next_seqs(user_id for _, user_id in rows)
+        Tombstone.objects.bulk_create([
+            Tombstone(user_id=user_id, kind=kind, object_id=pk, change_seq=seqs[user_id])
+            for pk, user_id in rows
+            if user_id in seqs
+        ])
+
+
+MEDICINE_FIELDS = ["id", "name", "dosage", "frequency", "start_date", "end_date"]
+REMINDER_FIELDS = ["id", "medicine", "time", "delivered", "status"]
+
+
+def changes_since(user, cursor=None):
+    """
+    Everything a client holding ``cursor`` is missing, as compact rows under
+    a field list: medicines, reminders (history included) and the ids
+    deleted since. Without a cursor every row is sent and nothing is
+    reported deleted. Returns None when nothing changed.
+    """
+    seq = current_seq(user)
+    if cursor is not None and cursor >= seq:
+        return None
+
+    medicines = Medicine.objects.filter(owner=user)
+    reminders = Reminder.objects.filter(user=user)
+    deleted = {Tombstone.MEDICINE: [], Tombstone.REMINDER: []}
+    if cursor is not None:
+        medicines = medicines.filter(change_seq__gt=cursor)
+        reminders = reminders.filter(change_seq__gt=cursor)
+        for kind, pk in Tombstone.objects.filter(user=user, change_seq__gt=cursor).values_list(
+            "kind", "object_id"
+        ):
+            deleted[kind].append(pk)
+
+    return {
+        "cursor": seq,
+        "full": cursor is None,
+        "medicines": {
+            "fields": MEDICINE_FIELDS,
+            "rows": [
+                [pk, name, dosage, frequency, start.isoformat(), end.isoformat()]
+                for pk, name, dosage, frequency, start, end in medicines.order_by("pk").values_list(
+                    "pk", "name", "dosage", "frequency", "start_date", "end_date"
+                )
+            ],
+        },
+        "reminders": {
+            "fields": REMINDER_FIELDS,
+            "rows": [
+                [pk, medicine_id, reminder_time.isoformat(), delivered, status]
+                for pk, medicine_id, reminder_time, delivered, status in reminders.order_by("pk").values_list(
+                    "pk", "medicine_id", "reminder_time", "delivered", "status"
+                )
+            ],
+        },
+        "deleted": {
+            "medicines": deleted[Tombstone.MEDICINE],
+            "reminders": deleted[Tombstone.REMINDER],
+        },
+    }
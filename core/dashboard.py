@@ -0,0 +1,61 @@
+# core/dashboard.py
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import Medicine, Reminder
+
+_counter_lock = threading.Lock()
+_counters = {"hits": 0, "misses": 0}
+
+
+def _cache_key(user_id):
+    return f"medcia:dashboard:{user_id}"
+
+
+def _count(name):
+    with _counter_lock:
+        _counters[name] += 1
+
+
+def cache_stats():
+    """Hit/miss counts of the dashboard cache in this process."""
+    with _counter_lock:
+        return dict(_counters)
+
+
+def compute_dashboard_summary(user):
+    pending = Reminder.objects.filter(user=user, delivered=False)
+    next_reminder = pending.order_by('reminder_time').values(
+        'reminder_time', 'medicine__name'
+    ).first()
+
+    return {
+        "total_medicines": Medicine.objects.filter(owner=user).count(),
+        "total_reminders": pending.count(),
+        "next_dose_time": next_reminder['reminder_time'] if next_reminder else None,
+        "next_dose_medicine": next_reminder['medicine__name'] if next_reminder else None,
+    }
+
+
+def get_dashboard_summary(user):
+    """
+    Per-user dashboard figures, served from the configured cache. Entries are
+    dropped by ``invalidate_dashboard`` whenever the user's medicines or
+    reminders change, so a hit never touches the database.
+    """
+    key = _cache_key(user.pk)
+    summary = cache.get(key)
+    if summary is not None:
+        _count("hits")
+        return summary
+
+    _count("misses")
+    summary = compute_dashboard_summary(user)
+    cache.set(key, summary, getattr(settings, "DASHBOARD_CACHE_TIMEOUT", 300))
+    return summary
+
+
+def invalidate_dashboard(user_ids):
+    cache.delete_many([_cache_key(user_id) for user_id in user_ids if user_id])
@@ -0,0 +1,53 @@
+# core/db.py
+"""
+SQLite connection setup. Every new connection gets the pragmas below:
+WAL, so readers keep reading their snapshot while the dispatcher or a
+request is writing; a busy timeout, so concurrent writers wait their turn
+instead of failing with "database is locked"; NORMAL sync, which is
+durable across application crashes in WAL mode and only fsyncs at
+checkpoints; and memory-mapped reads. Override or disable (None) any of
+them with the SQLITE_PRAGMAS setting.
+"""
+from django.conf import settings
+from django.db import connection
+
+DEFAULT_PRAGMAS = {
+    "journal_mode": "wal",
+    "synchronous": "normal",
+    "busy_timeout": 5000,
+    "mmap_size": 128 * 1024 * 1024,
+}
+
+
+def sqlite_pragmas():
+    pragmas = {**DEFAULT_PRAGMAS, **getattr(settings, "SQLITE_PRAGMAS", {})}
+    return {name: value for name, value in pragmas.items() if value is not None}
+
+
+def configure_connection(connection):
+    if connection.vendor != "sqlite":
+        return
+    with connection.cursor() as cursor:
+        for name, value in sqlite_pragmas().items():
+            cursor.execute(f"PRAGMA {name} = {value}")
+
+
+def delete_rows(model, pks):
+    """
+    DELETE the ``model`` rows with these pks in one statement. Unlike
+    QuerySet.delete(), which has no way to skip them, this sends no per-row
+    signals and does no on_delete handling: callers clear references to
+    the rows first and record the deletion themselves. Returns the number
+    of rows deleted.
+    """
+    pks = list(pks)
+    if not pks:
+        return 0
+    quote = connection.ops.quote_name
+    placeholders = ", ".join(["%s"] * len(pks))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"DELETE FROM {quote(model._meta.db_table)} WHERE {quote(model._meta.pk.column)} IN ({placeholders})",
+            pks,
+        )
+        return cursor.rowcount
@@ -0,0 +1,375 @@
+# core/delivery.py
+import logging
+import os
+import socket
+import time
+import uuid
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .adherence import Dose, record_dispatched
+from .changes import record_changes
+from .dashboard import invalidate_dashboard
+from .metrics import BUCKETS_SECONDS, registry as metrics_registry
+from .models import Reminder
+from .notifications import DEFERRED, SENT, Message, get_channels
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 200
+DEFAULT_WORKERS = 8
+# Most messages sent over one channel connection. Reminders are committed
+# as their chunk finishes, so this also bounds what a crash re-sends.
+DEFAULT_CHUNK_SIZE = 50
+
+
+def lease_duration():
+    """How long a claimed reminder is reserved for the worker that claimed it."""
+    return timedelta(seconds=getattr(settings, "DISPATCH_LEASE_SECONDS", 300))
+
+
+def max_attempts():
+    return getattr(settings, "DISPATCH_MAX_ATTEMPTS", 5)
+
+
+def retry_delay(attempts):
+    """Exponential backoff after the ``attempts``-th failed send, capped."""
+    base = getattr(settings, "DISPATCH_RETRY_BASE_SECONDS", 60)
+    cap = getattr(settings, "DISPATCH_RETRY_MAX_SECONDS", 3600)
+    return timedelta(seconds=min(base * 2 ** (attempts - 1), cap))
+
+
+def defer_delay():
+    """How long rate-limited reminders wait before they are tried again."""
+    return timedelta(seconds=getattr(settings, "DISPATCH_DEFER_SECONDS", 30))
+
+
+def digest_window():
+    """Reminders of one user due this close together go out as one message."""
+    return timedelta(minutes=getattr(settings, "DIGEST_WINDOW_MINUTES", 5))
+
+
+def default_worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"[-64:]
+
+
+def build_message(reminder):
+    med_name = reminder.medicine.name
+    time_str = timezone.localtime(reminder.reminder_time).strftime("%Y-%m-%d %H:%M")
+    subject = f"MedCia reminder: {med_name}"
+    body = f"Reminder for medicine: {med_name}\nTime: {time_str}\n\nThis is an automated reminder from MedCia."
+    return subject, body
+
+
+def build_digest(reminders):
+    """One message for several doses; a single reminder gets the usual text."""
+    if len(reminders) == 1:
+        return build_message(reminders[0])
+    lines = [
+        f"- {r.medicine.name} at {timezone.localtime(r.reminder_time).strftime('%Y-%m-%d %H:%M')}"
+        for r in reminders
+    ]
+    subject = f"MedCia reminder: {len(reminders)} doses due"
+    body = "Reminder for your medicines:\n" + "\n".join(lines) + "\n\nThis is an automated reminder from MedCia."
+    return subject, body
+
+
+def coalesce(reminders, window):
+    """
+    Split one user's reminders, in time order, into runs where every dose is
+    due within ``window`` of the first.
+    """
+    groups = []
+    for r in reminders:
+        if groups and r.reminder_time - groups[-1][0].reminder_time <= window:
+            groups[-1].append(r)
+        else:
+            groups.append([r])
+    return groups
+
+
+@dataclass
+class DeliveryStats:
+    delivered: int = 0
+    # Messages sent per channel name.
+    sent: Counter = field(default_factory=Counter)
+    failures: int = 0
+    deferred: int = 0
+    retried: int = 0
+    abandoned: int = 0
+    batches: int = 0
+    elapsed: float = 0.0
+    # Seconds between a reminder's time and its delivery, at worst.
+    max_lag: float = 0.0
+    # (retry time, pk) of reminders released for a later attempt.
+    retries: list = field(default_factory=list)
+
+    @property
+    def emails_sent(self):
+        return self.sent["email"]
+
+    @property
+    def sms_sent(self):
+        return self.sent["sms"]
+
+    @property
+    def throughput(self):
+        """Reminders delivered per second over the whole run."""
+        if self.elapsed <= 0:
+            return float(self.delivered)
+        return self.delivered / self.elapsed
+
+
+class ReminderDispatcher:
+    """
+    Delivers due reminders in bounded batches, safely alongside other
+    dispatchers.
+
+    A batch is claimed with one conditional UPDATE that stamps the rows with
+    this worker's id and a lease expiry; rows already leased elsewhere are
+    left alone, so concurrent runs split the due set instead of sending it
+    twice. Messages are sent on a thread pool, and the reminders a chunk
+    completes are marked delivered together in one short transaction as soon
+    as it finishes, so a crash only leaves the in-flight reminders to be
+    retried once their lease runs out. A reminder whose every channel failed is released with an
+    exponential backoff, and given up on after ``max_attempts()`` tries.
+
+    Messages go out through the ``channels`` backends (NOTIFICATION_CHANNELS
+    by default) in chunks of ``chunk_size``, each chunk over one reused
+    connection. A user's reminders due within ``digest_window()`` of each
+    other share one message per channel.
+    """
+
+    def __init__(self, batch_size=DEFAULT_BATCH_SIZE, workers=DEFAULT_WORKERS,
+                 channels=None, worker_id=None, chunk_size=DEFAULT_CHUNK_SIZE):
+        self.batch_size = batch_size
+        self.workers = workers
+        self.channels = get_channels() if channels is None else channels
+        self.worker_id = worker_id or default_worker_id()
+        self.chunk_size = chunk_size
+
+    def due_queryset(self, now, pks=None):
+        """Undelivered reminders due at ``now`` that nobody holds a lease on."""
+        qs = Reminder.objects.filter(
+            Q(claim_expires__isnull=True) | Q(claim_expires__lte=now),
+            delivered=False, reminder_time__lte=now,
+        )
+        if pks is not None:
+            qs = qs.filter(pk__in=pks)
+        return qs
+
+    def claim_batch(self, now, pks=None):
+        """
+        Lease up to ``batch_size`` due reminders to this worker. Returns the
+        pks that looked due and the reminders actually claimed; the two
+        differ when another worker got to some of them first.
+        """
+        candidates = list(
+            self.due_queryset(now, pks).order_by("reminder_time", "pk")
+            .values_list("pk", flat=True)[:self.batch_size]
+        )
+        if not candidates:
+            return [], []
+
+        # The due conditions are re-checked by the UPDATE itself, so of two
+        # workers racing for a row only one matches it.
+        self.due_queryset(now, candidates).update(
+            claimed_by=self.worker_id,
+            claim_expires=timezone.now() + lease_duration(),
+            attempts=F("attempts") + 1,
+        )
+        claimed = Reminder.objects.filter(pk__in=candidates, claimed_by=self.worker_id, delivered=False)
+
+        # Pull forward the same users' doses due within the digest window, so
+        # they share a message instead of following a few minutes later.
+        window = digest_window()
+        if window:
+            user_ids = set(claimed.exclude(user=None).values_list("user_id", flat=True))
+            early = Reminder.objects.filter(
+                Q(claim_expires__isnull=True) | Q(claim_expires__lte=now),
+                user_id__in=user_ids, delivered=False,
+                reminder_time__gt=now, reminder_time__lte=now + window,
+            )
+            if user_ids and early.update(
+                claimed_by=self.worker_id,
+                claim_expires=timezone.now() + lease_duration(),
+                attempts=F("attempts") + 1,
+            ):
+                claimed = Reminder.objects.filter(
+                    Q(pk__in=candidates) | Q(user_id__in=user_ids, reminder_time__gt=now),
+                    claimed_by=self.worker_id, delivered=False,
+                )
+
+        batch = list(
+            claimed.select_related("medicine", "user", "user__userprofile").order_by("reminder_time", "pk")
+        )
+        return candidates, batch
+
+    def run(self, now=None, pks=None):
+        """
+        Deliver everything due at ``now``. When ``pks`` is given only those
+        reminders are considered; rows that were delivered, deleted, moved
+        into the future or claimed by another worker in the meantime are
+        skipped.
+        """
+        now = now or timezone.now()
+        stats = DeliveryStats()
+        started = time.monotonic()
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            while True:
+                metrics_registry.set_gauge("dispatch", "queue_depth", self.due_queryset(now).count())
+                candidates, batch = self.claim_batch(now, pks)
+                if not candidates:
+                    break
+                if batch:
+                    self.deliver_batch(batch, pool, stats)
+                    stats.batches += 1
+
+        stats.elapsed = time.monotonic() - started
+        return stats
+
+    def deliver_batch(self, batch, pool, stats):
+        # Everything the worker threads need is resolved here, so no
+        # database access happens off the main thread.
+        by_pk = {r.pk: r for r in batch}
+        prepared = {channel: channel.prepare(batch) for channel in self.channels}
+
+        # A user's doses due close together are coalesced into one message
+        # per channel and recipient; each reminder is still settled on its own.
+        by_user = defaultdict(list)
+        for r in batch:
+            by_user[r.user_id or ("reminder", r.pk)].append(r)
+        window = digest_window()
+        outgoing = defaultdict(list)
+        for reminders in by_user.values():
+            for group in coalesce(reminders, window):
+                subject, body = build_digest(group)
+                for channel in self.channels:
+                    addressed = defaultdict(list)
+                    for r in group:
+                        # Already got through before a rate-limited retry.
+                        if channel.name in r.sent_channels:
+                            continue
+                        for recipient in channel.recipients(r, prepared[channel]):
+                            addressed[recipient].append(r.pk)
+                    for recipient, pks in addressed.items():
+                        outgoing[channel].append(Message(tuple(pks), recipient, subject, body))
+
+        # Spread each channel's messages over the pool, a chunk per connection.
+        futures = {}
+        pending = Counter()
+        for channel, messages in outgoing.items():
+            size = max(1, min(self.chunk_size, -(-len(messages) // self.workers)))
+            for start in range(0, len(messages), size):
+                chunk = messages[start:start + size]
+                futures[pool.submit(channel.send_many, chunk)] = channel
+                pending.update(pk for m in chunk for pk in m.keys)
+
+        results = defaultdict(list)
+        self.settle([(by_pk[pk], []) for pk in by_pk.keys() - pending.keys()], stats)
+
+        # Reminders are settled together as the chunk that completes them
+        # finishes.
+        for future in as_completed(futures):
+            channel = futures[future]
+            done = []
+            for keys, outcome in future.result():
+                if outcome == SENT:
+                    stats.sent[channel.name] += 1
+                elif outcome != DEFERRED:
+                    stats.failures += 1
+                for pk in keys:
+                    results[pk].append((channel.name, outcome))
+                    pending[pk] -= 1
+                    if not pending[pk]:
+                        done.append((by_pk[pk], results.pop(pk)))
+            self.settle(done, stats)
+
+        for channel in self.channels:
+            channel.batch_done()
+
+    def settle(self, items, stats):
+        """
+        Finish the (reminder, results) pairs of one chunk in a single short
+        transaction: one commit per chunk, with the write lock taken by the
+        first statement and held only for these updates.
+        """
+        if not items:
+            return
+        changed = set()
+        with transaction.atomic():
+            for reminder, results in items:
+                changed.update(self.finish(reminder, results, stats))
+        invalidate_dashboard(changed)
+
+    def finish(self, reminder, results, stats):
+        """
+        Settle one claimed reminder. If a channel was rate limited it is
+        released to try again shortly, remembering the channels that got
+        through, without using up an attempt. Otherwise it is delivered if
+        any channel got through (or there was none to try), and released
+        for a backed-off retry if all failed. Updates are conditional on
+        still holding the claim of an undelivered row, so a worker whose
+        lease ran out cannot undo the work of the one that took over, nor
+        count a dose the user acknowledged meanwhile. Runs inside ``settle``'s
+        transaction; returns the users whose dashboards changed, to be
+        invalidated once it has committed.
+        """
+        # An ack while claimed delivers the row without releasing it; that
+        # counts as settled, and the ack has already counted the dose.
+        mine = Reminder.objects.filter(pk=reminder.pk, claimed_by=self.worker_id, delivered=False)
+        user_ids = [reminder.user_id] if reminder.user_id else []
+        sent = reminder.sent_channels + [name for name, outcome in results if outcome == SENT]
+
+        if any(outcome == DEFERRED for _, outcome in results):
+            retry_at = timezone.now() + defer_delay()
+            if mine.update(claimed_by="", claim_expires=retry_at, attempts=F("attempts") - 1,
+                           sent_channels=sent):
+                stats.deferred += 1
+                stats.retries.append((retry_at, reminder.pk))
+        elif not results or sent:
+            if not mine.update(delivered=True, claimed_by="", claim_expires=None, sent_channels=sent):
+                return []
+            record_changes(user_ids, reminders=Reminder.objects.filter(pk=reminder.pk))
+            record_dispatched([
+                Dose(reminder.pk, reminder.user_id, reminder.medicine_id, reminder.reminder_time)
+            ])
+            stats.delivered += 1
+            # Doses pulled forward into a digest go out early, not late.
+            lag = max(0.0, (timezone.now() - reminder.reminder_time).total_seconds())
+            stats.max_lag = max(stats.max_lag, lag)
+            metrics_registry.observe("dispatch", "send_lag_seconds", lag, buckets=BUCKETS_SECONDS)
+            return user_ids
+        elif reminder.attempts >= max_attempts():
+            # Nothing reached the user, but acks treat a delivered reminder
+            # as dispatched, so the dose is counted as due here.
+            if not mine.update(delivered=True, claimed_by="", claim_expires=None):
+                return []
+            record_changes(user_ids, reminders=Reminder.objects.filter(pk=reminder.pk))
+            record_dispatched([
+                Dose(reminder.pk, reminder.user_id, reminder.medicine_id, reminder.reminder_time)
+            ], notified=False)
+            logger.error("Giving up on reminder %s after %s attempts", reminder.pk, reminder.attempts)
+            stats.abandoned += 1
+            return user_ids
+        else:
+            retry_at = timezone.now() + retry_delay(reminder.attempts)
+            if mine.update(claimed_by="", claim_expires=retry_at):
+                stats.retried += 1
+                stats.retries.append((retry_at, reminder.pk))
+        return []
+
+    def mark_delivered(self, pks, user_ids=()):
+        with transaction.atomic():
+            Reminder.objects.filter(pk__in=pks).update(delivered=True, claimed_by="", claim_expires=None)
+            # update() bypasses the post_save signal that records the change.
+            record_changes(user_ids, reminders=Reminder.objects.filter(pk__in=pks))
+        invalidate_dashboard(user_ids)
@@ -1,6 +1,8 @@
+from datetime import datetime
+
 from django import forms
 from django.contrib.auth.models import User
-from .models import Medicine, Reminder
+from .models import Medicine, MedicineSchedule, Reminder
 
 
 # -------------------- Signup Form --------------------
@@ -51,6 +53,68 @@ class ReminderForm(forms.ModelForm):
             )
         }
 
+    def __init__(self, *args, user=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields["reminder_time"].input_formats = ['%Y-%m-%dT%H:%M']
+        if user is not None:
+            # Only the user's own medicines, in the dropdown and as valid choices.
+            self.fields["medicine"].queryset = Medicine.objects.filter(owner=user).order_by("name")
+
+
+# -------------------- Schedule Form --------------------
+class MedicineScheduleForm(forms.ModelForm):
+    times_of_day = forms.CharField(
+        help_text="Comma-separated 24h times, e.g. 08:00, 14:00, 20:00",
+        widget=forms.TextInput(attrs={"class": "w-full p-2 border rounded", "placeholder": "08:00, 20:00"}),
+    )
+    weekdays = forms.TypedMultipleChoiceField(
+        choices=MedicineSchedule.WEEKDAY_CHOICES,
+        coerce=int,
+        required=False,
+        help_text="Leave empty for every day.",
+        widget=forms.CheckboxSelectMultiple,
+    )
+    whole_course = forms.BooleanField(
+        required=False,
+        label="Create reminders for the whole course now",
+        help_text="Otherwise they are added a day ahead as the course goes on.",
+    )
+
+    class Meta:
+        model = MedicineSchedule
+        fields = ["times_of_day", "interval_days", "weekdays"]
+        widgets = {
+            "interval_days": forms.NumberInput(attrs={"class": "w-full p-2 border rounded", "min": 1}),
+        }
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.fields["reminder_time"].input_formats = ['%Y-%m-%dT%H:%M']
\ No newline at end of file
+        if self.instance.pk:
+            self.initial["times_of_day"] = ", ".join(self.instance.times_of_day)
+            self.initial["weekdays"] = [
+                bit for bit, _ in MedicineSchedule.WEEKDAY_CHOICES if self.instance.weekdays & bit
+            ]
+
+    def clean_times_of_day(self):
+        times = set()
+        for value in self.cleaned_data["times_of_day"].split(","):
+            value = value.strip()
+            if not value:
+                continue
+            try:
+                parsed = datetime.strptime(value, "%H:%M")
+            except ValueError:
+                raise forms.ValidationError(f"'{value}' is not a valid HH:MM time.")
+            times.add(parsed.strftime("%H:%M"))
+        if not times:
+            raise forms.ValidationError("Enter at least one time.")
+        return sorted(times)
+
+    def clean_interval_days(self):
+        interval = self.cleaned_data["interval_days"]
+        if interval < 1:
+            raise forms.ValidationError("Interval must be at least one day.")
+        return interval
+
+    def clean_weekdays(self):
+        return sum(self.cleaned_data["weekdays"])
@@ -0,0 +1,49 @@
+# core/management/commands/archive_reminders.py
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from core.archive import DEFAULT_BATCH_SIZE, archive_delivered, retention_period
+
+
+class Command(BaseCommand):
+    help = (
+        "Move delivered reminders older than the retention period "
+        "(REMINDER_RETENTION_DAYS) into the archive table, in batches. "
+        "Safe to interrupt and re-run."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--older-than", type=int, metavar="DAYS",
+                            help="Retention in days; defaults to REMINDER_RETENTION_DAYS.")
+        parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+        parser.add_argument("--dry-run", action="store_true",
+                            help="Only report how many reminders would be archived.")
+
+    def handle(self, *args, **options):
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size must be at least 1.")
+        days = options["older_than"]
+        if days is not None and days < 0:
+            raise CommandError("--older-than cannot be negative.")
+
+        period = retention_period() if days is None else timedelta(days=days)
+        before = timezone.now() - period
+
+        def progress(result):
+            self.stdout.write(f"Batch {result.batches}: {result.archived} archived so far")
+
+        result = archive_delivered(
+            before, options["batch_size"], dry_run=options["dry_run"],
+            progress=progress if options["verbosity"] > 1 else None,
+        )
+        if options["dry_run"]:
+            self.stdout.write(
+                f"Would archive {result.archived} reminders due before {before:%Y-%m-%d %H:%M} "
+                f"in {result.batches} batches."
+            )
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                f"Archived {result.archived} reminders in {result.batches} batches."
+            ))
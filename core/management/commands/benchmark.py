@@ -0,0 +1,62 @@
+# core/management/commands/benchmark.py
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from core.benchmarks import compare, run_benchmarks, seed
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the dashboard, reminder pages, polling API and dispatcher "
+        "against a synthetic dataset in a throwaway test database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=10)
+        parser.add_argument("--medicines-per-user", type=int, default=5)
+        parser.add_argument("--reminders-per-medicine", type=int, default=20)
+        parser.add_argument("--due", type=int, default=500,
+                            help="Past-due reminders for the dispatcher benchmark.")
+        parser.add_argument("--repeat", type=int, default=50, help="Requests per endpoint.")
+        parser.add_argument("--workers", type=int, default=8)
+        parser.add_argument("--output", help="Write results as JSON to this file.")
+        parser.add_argument("--baseline", help="JSON results of an earlier run to compare against.")
+        parser.add_argument("--threshold", type=float, default=0.2,
+                            help="Allowed slowdown as a fraction of the baseline (default 0.2).")
+
+    def handle(self, *args, **options):
+        config = {
+            key: options[key]
+            for key in ("users", "medicines_per_user", "reminders_per_medicine", "due", "repeat", "workers")
+        }
+
+        # Never touch the real database: build a test one, like the test runner.
+        setup_test_environment()
+        old_name = connection.settings_dict["NAME"]
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            self.stdout.write("Seeding {users} users x {medicines_per_user} medicines x "
+                              "{reminders_per_medicine} reminders...".format(**config))
+            user = seed(options["users"], options["medicines_per_user"],
+                        options["reminders_per_medicine"], options["due"])
+            results = run_benchmarks(user, options["repeat"], options["workers"])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        report = json.dumps({"config": config, "results": results}, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                f.write(report + "\n")
+        self.stdout.write(report)
+
+        if options["baseline"]:
+            with open(options["baseline"]) as f:
+                baseline = json.load(f)["results"]
+            regressions = compare(results, baseline, options["threshold"])
+            if regressions:
+                raise CommandError("Performance regressions:\n  " + "\n  ".join(regressions))
+            self.stdout.write(self.style.SUCCESS("No regressions against baseline."))
@@ -0,0 +1,46 @@
+# core/management/commands/import_data.py
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from core.bulk import (
+    DEFAULT_CHUNK_SIZE,
+    FORMATS,
+    guess_format,
+    import_medicines,
+    import_reminders,
+    iter_rows,
+)
+
+
+class Command(BaseCommand):
+    help = "Bulk import medicines or reminders from a CSV or JSON Lines file."
+
+    def add_arguments(self, parser):
+        parser.add_argument("kind", choices=["medicines", "reminders"])
+        parser.add_argument("path")
+        parser.add_argument("--format", choices=FORMATS, help="Defaults to the file extension.")
+        parser.add_argument("--user", required=True,
+                            help="Username that the imported rows belong to.")
+        parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        fmt = options["format"] or guess_format(options["path"])
+
+        try:
+            user = User.objects.get(username=options["user"])
+        except User.DoesNotExist:
+            raise CommandError(f"Unknown user {options['user']!r}.")
+
+        with open(options["path"], newline="", encoding="utf-8") as f:
+            rows = iter_rows(f, fmt)
+            if options["kind"] == "medicines":
+                result = import_medicines(rows, user, options["chunk_size"])
+            else:
+                result = import_reminders(rows, user, options["chunk_size"])
+
+        for error in result.errors:
+            self.stderr.write(f"Row {error['row']}: {error['errors']}")
+        summary = f"Imported {result.created} {options['kind']}, {result.failed} rows rejected."
+        if result.parse_error:
+            raise CommandError(f"{summary} Stopped at a parse error: {result.parse_error}")
+        self.stdout.write(self.style.SUCCESS(summary))
@@ -0,0 +1,35 @@
+# core/management/commands/run_scheduler.py
+from django.core.management.base import BaseCommand
+
+from core.delivery import (
+    DEFAULT_BATCH_SIZE,
+    DEFAULT_WORKERS,
+    ReminderDispatcher,
+)
+from core.scheduler import DEFAULT_POLL_INTERVAL, ReminderScheduler
+
+
+class Command(BaseCommand):
+    help = "Run the reminder scheduler: dispatch each reminder the moment it becomes due."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--poll-interval", type=float, default=DEFAULT_POLL_INTERVAL,
+            help="Seconds between polls for reminders changed by other processes.",
+        )
+        parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+        parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+
+    def handle(self, *args, **options):
+        dispatcher = ReminderDispatcher(
+            batch_size=options["batch_size"],
+            workers=options["workers"],
+        )
+        scheduler = ReminderScheduler(dispatcher, poll_interval=options["poll_interval"])
+
+        self.stdout.write("Reminder scheduler started. Press Ctrl+C to stop.")
+        try:
+            scheduler.run_forever()
+        except KeyboardInterrupt:
+            scheduler.stop()
+        self.stdout.write("Reminder scheduler stopped.")
@@ -0,0 +1,264 @@
+# core/metrics.py
+import bisect
+import contextvars
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.template import TemplateDoesNotExist
+from django.template.backends.django import DjangoTemplates, Template, reraise
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds, in milliseconds, of the histogram buckets.
+BUCKETS_MS = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+# Bounds for metrics in seconds, such as how late reminders go out.
+BUCKETS_SECONDS = (1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600)
+# Bounds for counts, such as queries per request.
+BUCKETS_COUNT = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+# SQL kept per request for the slow-request log.
+MAX_LOGGED_QUERIES = 50
+# The rolling window is kept as this many slices, which expire one at a time.
+WINDOW_SLICES = 5
+
+# Timings of the request being handled, if instrumentation is on.
+_current = contextvars.ContextVar("medcia_request_timings", default=None)
+
+
+def window_seconds():
+    """How far back the quantiles of ``MetricsRegistry.snapshot()`` look."""
+    return getattr(settings, "PERF_METRICS_WINDOW_SECONDS", 300)
+
+
+def _quantile(buckets, counts, q):
+    """Upper bound of the bucket holding the q-th quantile of ``counts``."""
+    count = sum(counts)
+    if not count:
+        return None
+    rank = q * count
+    seen = 0
+    for bound, n in zip(buckets + (float("inf"),), counts):
+        seen += n
+        if seen >= rank:
+            return bound
+    return float("inf")
+
+
+class Histogram:
+    """
+    Bucketed observations, kept twice: ``counts``, ``total`` and ``count``
+    run from process start, as Prometheus expects of a histogram, and
+    ``summary()`` only covers the last ``window`` seconds, so its quantiles
+    follow current behaviour rather than the whole uptime.
+    """
+    __slots__ = ("buckets", "counts", "total", "count", "slice_seconds", "slices", "clock")
+
+    def __init__(self, buckets=BUCKETS_MS, window=300, clock=time.monotonic):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+        self.slice_seconds = window / WINDOW_SLICES
+        # [slice number, counts, total] for the slices still in the window.
+        self.slices = deque()
+        self.clock = clock
+
+    def _expire(self, current):
+        while self.slices and self.slices[0][0] <= current - WINDOW_SLICES:
+            self.slices.popleft()
+
+    def observe(self, value):
+        bucket = bisect.bisect_left(self.buckets, value)
+        self.counts[bucket] += 1
+        self.total += value
+        self.count += 1
+
+        current = int(self.clock() // self.slice_seconds)
+        self._expire(current)
+        if not self.slices or self.slices[-1][0] != current:
+            self.slices.append([current, [0] * len(self.counts), 0.0])
+        self.slices[-1][1][bucket] += 1
+        self.slices[-1][2] += value
+
+    def summary(self):
+        self._expire(int(self.clock() // self.slice_seconds))
+        counts = [0] * len(self.counts)
+        total = 0.0
+        for _, slice_counts, slice_total in self.slices:
+            counts = [a + b for a, b in zip(counts, slice_counts)]
+            total += slice_total
+        count = sum(counts)
+        return {
+            "count": count,
+            "sum": round(total, 3),
+            "mean": round(total / count, 3) if count else None,
+            "p50": _quantile(self.buckets, counts, 0.5),
+            "p95": _quantile(self.buckets, counts, 0.95),
+            "p99": _quantile(self.buckets, counts, 0.99),
+        }
+
+
+class MetricsRegistry:
+    """
+    Process-local histograms and gauges keyed by (name, metric), where name
+    is a view name or a component such as "dispatch". ``snapshot()`` reports
+    the last ``window_seconds()``; ``prometheus()`` the running totals.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._gauges = {}
+
+    def observe(self, name, metric, value, buckets=BUCKETS_MS):
+        with self._lock:
+            histogram = self._histograms.get((name, metric))
+            if histogram is None:
+                histogram = self._histograms[(name, metric)] = Histogram(buckets, window_seconds())
+            histogram.observe(value)
+
+    def set_gauge(self, name, metric, value):
+        with self._lock:
+            self._gauges[(name, metric)] = value
+
+    def snapshot(self):
+        with self._lock:
+            result = {}
+            for (name, metric), histogram in sorted(self._histograms.items()):
+                result.setdefault(name, {})[metric] = histogram.summary()
+            for (name, metric), value in sorted(self._gauges.items()):
+                result.setdefault(name, {})[metric] = value
+            return result
+
+    def prometheus(self):
+        lines = []
+        with self._lock:
+            metrics = sorted({metric for _, metric in self._histograms})
+            for metric in metrics:
+                family = f"medcia_{metric}"
+                lines.append(f"# TYPE {family} histogram")
+                for (name, m), histogram in sorted(self._histograms.items()):
+                    if m != metric:
+                        continue
+                    cumulative = 0
+                    for bound, n in zip(histogram.buckets + ("+Inf",), histogram.counts):
+                        cumulative += n
+                        lines.append(f'{family}_bucket{{view="{name}",le="{bound}"}} {cumulative}')
+                    lines.append(f'{family}_sum{{view="{name}"}} {histogram.total:.3f}')
+                    lines.append(f'{family}_count{{view="{name}"}} {histogram.count}')
+            for metric in sorted({metric for _, metric in self._gauges}):
+                family = f"medcia_{metric}"
+                lines.append(f"# TYPE {family} gauge")
+                for (name, m), value in sorted(self._gauges.items()):
+                    if m == metric:
+                        lines.append(f'{family}{{view="{name}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._gauges.clear()
+
+
+registry = MetricsRegistry()
+
+
+class RequestTimings:
+    __slots__ = ("queries", "db_ms", "template_ms", "sql")
+
+    def __init__(self, keep_sql):
+        self.queries = 0
+        self.db_ms = 0.0
+        self.template_ms = 0.0
+        self.sql = [] if keep_sql else None
+
+    def __call__(self, execute, sql, params, many, context):
+        # connection.execute_wrapper hook.
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = (time.perf_counter() - started) * 1000
+            self.queries += 1
+            self.db_ms += elapsed
+            if self.sql is not None and len(self.sql) < MAX_LOGGED_QUERIES:
+                self.sql.append((round(elapsed, 3), sql))
+
+
+class InstrumentedTemplate(Template):
+    def render(self, context=None, request=None):
+        timings = _current.get()
+        if timings is None:
+            return super().render(context, request)
+        started = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            timings.template_ms += (time.perf_counter() - started) * 1000
+
+
+class InstrumentedDjangoTemplates(DjangoTemplates):
+    """The Django template backend, timing renders for PerformanceMiddleware."""
+
+    def from_string(self, template_code):
+        return InstrumentedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return InstrumentedTemplate(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            reraise(exc, self)
+
+
+class PerformanceMiddleware:
+    """
+    Records wall time, query count, DB time and template time per URL name
+    into ``registry`` and reports them in a Server-Timing header. Enabled by
+    PERF_METRICS_ENABLED; requests slower than PERF_SLOW_REQUEST_MS (if set)
+    are logged with their SQL.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, "PERF_METRICS_ENABLED", False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.slow_ms = getattr(settings, "PERF_SLOW_REQUEST_MS", None)
+
+    def __call__(self, request):
+        timings = RequestTimings(keep_sql=self.slow_ms is not None)
+        token = _current.set(timings)
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for conn in connections.all():
+                    stack.enter_context(conn.execute_wrapper(timings))
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        wall_ms = (time.perf_counter() - started) * 1000
+
+        match = request.resolver_match
+        name = (match.url_name or match.route) if match else "unmatched"
+        registry.observe(name, "request_ms", wall_ms)
+        registry.observe(name, "db_ms", timings.db_ms)
+        registry.observe(name, "db_queries", timings.queries, buckets=BUCKETS_COUNT)
+        registry.observe(name, "template_ms", timings.template_ms)
+
+        response["Server-Timing"] = (
+            f'total;dur={wall_ms:.1f}, '
+            f'db;dur={timings.db_ms:.1f};desc="{timings.queries} queries", '
+            f'tpl;dur={timings.template_ms:.1f}'
+        )
+
+        if self.slow_ms is not None and wall_ms >= self.slow_ms:
+            logger.warning(
+                "Slow request %s %s (%s): %.1f ms, %s queries in %.1f ms\n%s",
+                request.method, request.path, name, wall_ms, timings.queries, timings.db_ms,
+                "\n".join(f"  {ms} ms  {sql}" for ms, sql in timings.sql),
+            )
+        return response
@@ -0,0 +1,20 @@
+# Generated by Django 4.2 on 2026-10-18 09:12
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_alter_medicine_id_alter_reminder_id_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reminder',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+    ]
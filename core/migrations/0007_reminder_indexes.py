@@ -0,0 +1,25 @@
+# Generated by Django 4.2.30 on 2026-10-18 18:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_reminder_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='reminder',
+            index=models.Index(condition=models.Q(('delivered', False)), fields=['user', 'reminder_time'], name='reminder_user_pending_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reminder',
+            index=models.Index(condition=models.Q(('delivered', True)), fields=['user', 'reminder_time'], name='reminder_user_history_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reminder',
+            index=models.Index(condition=models.Q(('delivered', False)), fields=['reminder_time'], name='reminder_pending_time_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-18 18:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_reminder_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='reminders_version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 4.2.30 on 2026-10-18 18:57
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('core', '0008_userprofile_reminders_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MedicineSchedule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('times_of_day', models.JSONField(default=list)),
+                ('interval_days', models.PositiveSmallIntegerField(default=1)),
+                ('weekdays', models.PositiveSmallIntegerField(default=0)),
+                ('medicine', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='schedule', to='core.medicine')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='reminder',
+            name='schedule',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='core.medicineschedule'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.30 on 2026-10-18 19:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_medicineschedule'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reminder',
+            name='acknowledged_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='reminder',
+            name='status',
+            field=models.CharField(blank=True, choices=[('taken', 'Taken'), ('skipped', 'Skipped')], max_length=10),
+        ),
+    ]
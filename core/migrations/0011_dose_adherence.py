@@ -0,0 +1,52 @@
+# Generated by Django 4.2.30 on 2026-10-18 19:04
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('core', '0010_reminder_acknowledgement'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DoseEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scheduled_at', models.DateTimeField()),
+                ('acked_at', models.DateTimeField(blank=True, null=True)),
+                ('status', models.CharField(choices=[('notified', 'Notified'), ('taken', 'Taken'), ('skipped', 'Skipped')], max_length=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('medicine', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.medicine')),
+                ('reminder', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='core.reminder')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'scheduled_at'], name='doseevent_user_time_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyAdherence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('due', models.PositiveIntegerField(default=0)),
+                ('taken', models.PositiveIntegerField(default=0)),
+                ('taken_on_time', models.PositiveIntegerField(default=0)),
+                ('skipped', models.PositiveIntegerField(default=0)),
+                ('medicine', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.medicine')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'day'], name='dailyadherence_user_day_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='dailyadherence',
+            constraint=models.UniqueConstraint(fields=('user', 'medicine', 'day'), name='dailyadherence_unique_day'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.2.30 on 2026-10-18 19:07
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('core', '0011_dose_adherence'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='medicine',
+            name='owner',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='medicines', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='medicine',
+            index=models.Index(fields=['owner', 'name'], name='medicine_owner_name_idx'),
+        ),
+    ]
@@ -0,0 +1,45 @@
+from django.db import migrations
+from django.db.models import F, OuterRef, Subquery
+
+
+def assign_owners(apps, schema_editor):
+    """
+    Give each existing medicine to the user of its earliest reminder. Until
+    now medicines were shared, so every other user with reminders on one
+    gets their own copy, and their reminders, schedule and adherence
+    history move to it.
+    """
+    Medicine = apps.get_model('core', 'Medicine')
+    Reminder = apps.get_model('core', 'Reminder')
+    MedicineSchedule = apps.get_model('core', 'MedicineSchedule')
+    DoseEvent = apps.get_model('core', 'DoseEvent')
+    DailyAdherence = apps.get_model('core', 'DailyAdherence')
+
+    first_user = Reminder.objects.filter(
+        medicine=OuterRef('pk'), user__isnull=False
+    ).order_by('reminder_time', 'pk').values('user')[:1]
+    Medicine.objects.filter(owner__isnull=True).update(owner=Subquery(first_user))
+
+    shared = list(Reminder.objects.filter(user__isnull=False).exclude(
+        user=F('medicine__owner')
+    ).values_list('medicine_id', 'user_id').distinct())
+    medicines = Medicine.objects.in_bulk({medicine_id for medicine_id, _ in shared})
+    for medicine_id, user_id in shared:
+        medicine = medicines[medicine_id]
+        copy = Medicine.objects.create(
+            owner_id=user_id, name=medicine.name, dosage=medicine.dosage,
+            frequency=medicine.frequency, start_date=medicine.start_date, end_date=medicine.end_date,
+        )
+        for model in (Reminder, MedicineSchedule, DoseEvent, DailyAdherence):
+            model.objects.filter(medicine_id=medicine_id, user_id=user_id).update(medicine=copy)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_medicine_owner'),
+    ]
+
+    operations = [
+        migrations.RunPython(assign_owners, migrations.RunPython.noop),
+    ]
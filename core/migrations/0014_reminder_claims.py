@@ -0,0 +1,28 @@
+# Generated by Django 4.2.30 on 2026-10-18 19:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_assign_medicine_owners'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reminder',
+            name='attempts',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='reminder',
+            name='claim_expires',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='reminder',
+            name='claimed_by',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-18 19:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_pushsubscription'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reminder',
+            name='sent_channels',
+            field=models.JSONField(blank=True, default=list),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 4.2.30 on 2026-10-18 19:36
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('core', '0017_change_seq_tombstones'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedReminder',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('reminder_time', models.DateTimeField()),
+                ('status', models.CharField(blank=True, choices=[('taken', 'Taken'), ('skipped', 'Skipped')], max_length=10)),
+                ('acknowledged_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='reminder',
+            index=models.Index(condition=models.Q(('delivered', True)), fields=['reminder_time', 'id'], name='reminder_delivered_time_idx'),
+        ),
+        migrations.AddField(
+            model_name='archivedreminder',
+            name='medicine',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.medicine'),
+        ),
+        migrations.AddField(
+            model_name='archivedreminder',
+            name='user',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='archivedreminder',
+            index=models.Index(fields=['user', 'reminder_time'], name='archivedreminder_user_time_idx'),
+        ),
+    ]
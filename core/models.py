@@ -5,25 +5,230 @@ from django.contrib.auth.models import User
 #from django.db import models
 
 class Medicine(models.Model):
+    # Indexed through medicine_owner_name_idx below.
+    owner = models.ForeignKey(
+        User, on_delete=models.CASCADE, null=True, blank=True,
+        related_name="medicines", db_index=False,
+    )
     name = models.CharField(max_length=100)
     dosage = models.CharField(max_length=50)  # e.g., "500 mg"
     frequency = models.CharField(max_length=50)
     start_date = models.DateField()
     end_date = models.DateField()
+    # The owner's change sequence when this row last changed (core.changes).
+    change_seq = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            # The medicines list: one owner's rows in name order.
+            models.Index(fields=["owner", "name"], name="medicine_owner_name_idx"),
+            # Delta sync: one owner's rows changed after a cursor.
+            models.Index(fields=["owner", "change_seq"], name="medicine_owner_seq_idx"),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # The course as stored, so a save can tell whether it moved.
+        instance._saved_course = (instance.__dict__.get("start_date"), instance.__dict__.get("end_date"))
+        return instance
+
+    def course_changed(self):
+        """Whether the course dates differ from the stored ones; True if unknown."""
+        return getattr(self, "_saved_course", None) != (self.start_date, self.end_date)
 
     def __str__(self):
         return self.name
+class MedicineSchedule(models.Model):
+    """
+    When a medicine is taken: at each of ``times_of_day`` (local "HH:MM"),
+    every ``interval_days`` days from the course start, optionally limited to
+    some ``weekdays`` (bitmask, Monday = 1; 0 means every day).
+
+    Occurrences are expanded lazily by ``core.schedules.iter_occurrences``;
+    only a rolling window of them is ever stored as Reminder rows.
+    """
+    WEEKDAY_CHOICES = [
+        (1, "Mon"), (2, "Tue"), (4, "Wed"), (8, "Thu"),
+        (16, "Fri"), (32, "Sat"), (64, "Sun"),
+    ]
+
+    medicine = models.OneToOneField(Medicine, on_delete=models.CASCADE, related_name="schedule")
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    times_of_day = models.JSONField(default=list)
+    interval_days = models.PositiveSmallIntegerField(default=1)
+    weekdays = models.PositiveSmallIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.medicine.name} at {', '.join(self.times_of_day)}"
 class Reminder(models.Model):
+    STATUS_TAKEN = "taken"
+    STATUS_SKIPPED = "skipped"
+    STATUS_CHOICES = [
+        (STATUS_TAKEN, "Taken"),
+        (STATUS_SKIPPED, "Skipped"),
+    ]
+
     medicine = models.ForeignKey(Medicine, on_delete=models.CASCADE)
     reminder_time = models.DateTimeField()
     user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True)
     delivered = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+    # Filled in when the user acknowledges the reminder.
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, blank=True)
+    acknowledged_at = models.DateTimeField(null=True, blank=True)
+    # Set on reminders materialised from a recurring schedule.
+    schedule = models.ForeignKey(MedicineSchedule, on_delete=models.SET_NULL, null=True, blank=True)
+    # Dispatcher lease (see core.delivery): which worker holds the reminder
+    # and until when. After a failed send claim_expires is the earliest
+    # retry instead, with claimed_by cleared.
+    claimed_by = models.CharField(max_length=64, blank=True, default="")
+    claim_expires = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    # Channels that already got through while others were rate limited;
+    # the deferred retry skips them.
+    sent_channels = models.JSONField(default=list, blank=True)
+    # The user's change sequence when this row last changed (core.changes).
+    change_seq = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            # Per-user lists: reminders page, polling API, dashboard. These are
+            # partial rather than keyed on delivered because boolean lookups
+            # compile to a bare "NOT delivered", which SQLite won't match
+            # against a key column.
+            models.Index(fields=["user", "reminder_time"], condition=models.Q(delivered=False), name="reminder_user_pending_idx"),
+            models.Index(fields=["user", "reminder_time"], condition=models.Q(delivered=True), name="reminder_user_history_idx"),
+            # Dispatcher scan over pending reminders only.
+            models.Index(fields=["reminder_time"], condition=models.Q(delivered=False), name="reminder_pending_time_idx"),
+            # Delta sync: one user's rows changed after a cursor.
+            models.Index(fields=["user", "change_seq"], name="reminder_user_seq_idx"),
+            # Archival scan over delivered reminders, oldest first.
+            models.Index(fields=["reminder_time", "id"], condition=models.Q(delivered=True), name="reminder_delivered_time_idx"),
+        ]
 
     def __str__(self):
         return f"{self.medicine.name} at {self.reminder_time}"
+class ArchivedReminder(models.Model):
+    """
+    A delivered reminder moved out of core_reminder by archive_reminders,
+    keeping only what the history views show. The id is the reminder's own,
+    so history cursors work across both tables.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    medicine = models.ForeignKey(Medicine, on_delete=models.CASCADE)
+    # Indexed through archivedreminder_user_time_idx below.
+    user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True, db_index=False)
+    reminder_time = models.DateTimeField()
+    status = models.CharField(max_length=10, choices=Reminder.STATUS_CHOICES, blank=True)
+    acknowledged_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["user", "reminder_time"], name="archivedreminder_user_time_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.medicine.name} at {self.reminder_time} (archived)"
+class DoseEvent(models.Model):
+    """Append-only log of what happened to each scheduled dose."""
+    NOTIFIED = "notified"
+    TAKEN = "taken"
+    SKIPPED = "skipped"
+    STATUS_CHOICES = [
+        (NOTIFIED, "Notified"),
+        (TAKEN, "Taken"),
+        (SKIPPED, "Skipped"),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    medicine = models.ForeignKey(Medicine, on_delete=models.CASCADE)
+    reminder = models.ForeignKey(Reminder, on_delete=models.SET_NULL, null=True, blank=True)
+    scheduled_at = models.DateTimeField()
+    acked_at = models.DateTimeField(null=True, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["user", "scheduled_at"], name="doseevent_user_time_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.medicine.name} {self.status} ({self.scheduled_at})"
+class DailyAdherence(models.Model):
+    """
+    Per-user, per-medicine, per-day counters kept up to date as dose events
+    are written, so adherence over any window reads one row per day.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    medicine = models.ForeignKey(Medicine, on_delete=models.CASCADE)
+    day = models.DateField()
+    due = models.PositiveIntegerField(default=0)
+    taken = models.PositiveIntegerField(default=0)
+    taken_on_time = models.PositiveIntegerField(default=0)
+    skipped = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user", "medicine", "day"], name="dailyadherence_unique_day"),
+        ]
+        indexes = [
+            models.Index(fields=["user", "day"], name="dailyadherence_user_day_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.user} {self.medicine.name} {self.day}"
 class UserProfile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     phone = models.CharField(max_length=20, blank=True, null=True)
+    # Bumped whenever any of the user's reminders or medicines change; used
+    # as the ETag of the polling API so unchanged polls never touch the
+    # reminder rows, and as the change sequence of delta sync.
+    reminders_version = models.PositiveIntegerField(default=0)
+
+    @classmethod
+    def bump_reminders_version(cls, user_ids):
+        cls.objects.filter(user_id__in=user_ids).update(
+            reminders_version=models.F("reminders_version") + 1
+        )
 
     def __str__(self):
         return self.user.username
+class PushSubscription(models.Model):
+    """A browser's Web Push subscription: one per device the user enabled."""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="push_subscriptions")
+    endpoint = models.URLField(max_length=500, unique=True)
+    # Keys from PushSubscription.toJSON(), used to encrypt payloads.
+    p256dh = models.CharField(max_length=200)
+    auth = models.CharField(max_length=100)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def info(self):
+        """The subscription in the shape the browser and pywebpush use."""
+        return {"endpoint": self.endpoint, "keys": {"p256dh": self.p256dh, "auth": self.auth}}
+
+    def __str__(self):
+        return f"{self.user} {self.endpoint[:40]}"
+class Tombstone(models.Model):
+    """A deleted reminder or medicine, kept so delta sync can report it."""
+    MEDICINE = "medicine"
+    REMINDER = "reminder"
+    KIND_CHOICES = [
+        (MEDICINE, "Medicine"),
+        (REMINDER, "Reminder"),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    object_id = models.PositiveIntegerField()
+    change_seq = models.PositiveIntegerField()
+    deleted_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["user", "change_seq"], name="tombstone_user_seq_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} {self.object_id} deleted"
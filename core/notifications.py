@@ -0,0 +1,473 @@
+# core/notifications.py
+import http.client
+import json
+import logging
+import smtplib
+import threading
+import time
+from collections import namedtuple
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.mail import EmailMessage, get_connection
+from django.utils.module_loading import import_string
+
+try:
+    from twilio.rest import Client as TwilioClient
+    TWILIO_AVAILABLE = True
+except Exception:
+    TWILIO_AVAILABLE = False
+
+try:
+    import requests
+    from pywebpush import WebPushException, webpush
+    WEBPUSH_AVAILABLE = True
+except Exception:
+    WEBPUSH_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# One outgoing notification. ``keys`` are the pks of the reminders it
+# covers: several when doses due together are sent as a digest.
+Message = namedtuple("Message", "keys recipient subject body")
+
+# Outcome of sending one message.
+SENT = "sent"
+FAILED = "failed"
+# Not sent because of rate limiting; the reminders are retried later
+# without counting as a failed attempt.
+DEFERRED = "deferred"
+
+# SMTP replies meaning "too many messages, try again later".
+SMTP_THROTTLE_CODES = {421, 450, 451, 452}
+
+DEFAULT_CHANNELS = {
+    "email": {"BACKEND": "core.notifications.EmailChannel"},
+    "sms": {"BACKEND": "core.notifications.TwilioSMSChannel"},
+    "push": {"BACKEND": "core.notifications.WebPushChannel"},
+}
+
+
+class Throttled(Exception):
+    """Raised by ``send()`` when the provider refuses a message as over its rate limit."""
+
+
+class TokenBucket:
+    """
+    Allows ``rate`` sends per second with bursts of up to ``burst``. A
+    caller reserves a token and sleeps until it is due, so concurrent
+    threads queue in arrival order; a reservation further away than
+    ``max_wait`` seconds is refused instead.
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.burst = float(burst or rate)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, max_wait):
+        """Take a token and return the seconds until it is due, or None if refused."""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            wait = max(0.0, (1 - self.tokens) / self.rate)
+            if wait > max_wait:
+                return None
+            self.tokens -= 1
+        return wait
+
+    def refund(self):
+        """Give back a reserved token that was not used."""
+        with self._lock:
+            self.tokens = min(self.burst, self.tokens + 1)
+
+    def acquire(self, max_wait):
+        wait = self.reserve(max_wait)
+        if wait is None:
+            return False
+        if wait:
+            time.sleep(wait)
+        return True
+
+
+# Buckets shared by every channel using a provider, e.g. SMS and WhatsApp
+# through one Twilio account.
+_provider_buckets = {}
+_provider_lock = threading.Lock()
+
+
+def provider_bucket(provider):
+    limits = getattr(settings, "NOTIFICATION_PROVIDER_LIMITS", {}).get(provider)
+    if not limits:
+        return None
+    with _provider_lock:
+        bucket = _provider_buckets.get(provider)
+        if bucket is None:
+            bucket = _provider_buckets[provider] = TokenBucket(limits["rate"], limits.get("burst"))
+        return bucket
+
+
+def rate_limit_max_wait():
+    """Longest a send waits for a token before its reminders are deferred."""
+    return getattr(settings, "DISPATCH_RATE_LIMIT_MAX_WAIT", 30)
+
+
+class ChannelBackend:
+    """
+    A way of notifying a user. ``recipient()`` picks the address for a
+    reminder (None to skip it), and ``send_many()`` sends a list of messages
+    over one connection from ``open()``, returning (keys, outcome) per
+    message.
+    Backends are shared between dispatcher threads, so per-call state lives
+    in the connection rather than on the instance.
+
+    Channels that address several devices per user override ``prepare()``,
+    which loads what a batch needs in one query, and ``recipients()``.
+    ``prepare()``, ``recipients()`` and ``batch_done()`` run on the
+    dispatcher's main thread and may use the database; sending may not.
+
+    Each send first takes a token from every bucket in ``limiters``; a
+    message that cannot get one in time, or that the provider throttles
+    (``send()`` raises Throttled), is reported DEFERRED rather than FAILED.
+    """
+
+    default_name = ""
+
+    def __init__(self, name=None, **options):
+        self.name = name or self.default_name
+        self.limiters = []
+
+    def is_available(self):
+        return True
+
+    def prepare(self, reminders):
+        return None
+
+    def recipient(self, reminder):
+        raise NotImplementedError
+
+    def recipients(self, reminder, prepared=None):
+        recipient = self.recipient(reminder)
+        return [recipient] if recipient else []
+
+    def batch_done(self):
+        pass
+
+    def open(self):
+        return None
+
+    def close(self, connection):
+        pass
+
+    def send(self, connection, message):
+        raise NotImplementedError
+
+    def acquire(self):
+        # Reserve from every bucket before sleeping, and give the tokens
+        # back if a later one refuses, so a send that is deferred anyway
+        # neither waits nor uses up the channel's own quota.
+        max_wait = rate_limit_max_wait()
+        reserved = []
+        for bucket in self.limiters:
+            wait = bucket.reserve(max_wait)
+            if wait is None:
+                for taken, _ in reserved:
+                    taken.refund()
+                return False
+            reserved.append((bucket, wait))
+        wait = max((wait for _, wait in reserved), default=0)
+        if wait:
+            time.sleep(wait)
+        return True
+
+    def send_many(self, messages):
+        # A provider that cannot be reached fails the whole chunk, which
+        # then takes the usual backoff and retry path.
+        try:
+            connection = self.open()
+        except Throttled as e:
+            logger.info("%s throttled on connect: %s", self.name, e)
+            return [(message.keys, DEFERRED) for message in messages]
+        except Exception as e:
+            logger.warning("Could not connect to %s: %s", self.name, e)
+            return [(message.keys, FAILED) for message in messages]
+
+        results = []
+        try:
+            for message in messages:
+                if not self.acquire():
+                    results.append((message.keys, DEFERRED))
+                    continue
+                try:
+                    self.send(connection, message)
+                    results.append((message.keys, SENT))
+                except Throttled as e:
+                    logger.info("%s throttled for reminders %s: %s", self.name, message.keys, e)
+                    results.append((message.keys, DEFERRED))
+                except Exception as e:
+                    logger.warning("Failed to send %s for reminders %s: %s", self.name, message.keys, e)
+                    results.append((message.keys, FAILED))
+        finally:
+            self.close(connection)
+        return results
+
+
+class EmailChannel(ChannelBackend):
+    """Email through Django's mail backend, one connection per ``send_many``."""
+
+    default_name = "email"
+
+    def __init__(self, name=None, backend=None, from_email=None, **options):
+        super().__init__(name)
+        self.backend = backend
+        self.from_email = from_email or getattr(settings, "DEFAULT_FROM_EMAIL", "no-reply@localhost")
+
+    def recipient(self, reminder):
+        return reminder.user.email if reminder.user else None
+
+    def open(self):
+        connection = get_connection(self.backend, fail_silently=False)
+        try:
+            connection.open()
+        except smtplib.SMTPResponseException as e:
+            if e.smtp_code in SMTP_THROTTLE_CODES:
+                raise Throttled(e.smtp_error) from e
+            raise
+        return connection
+
+    def close(self, connection):
+        connection.close()
+
+    def send(self, connection, message):
+        try:
+            connection.send_messages([
+                EmailMessage(message.subject, message.body, self.from_email, [message.recipient],
+                             connection=connection)
+            ])
+        except smtplib.SMTPResponseException as e:
+            if e.smtp_code in SMTP_THROTTLE_CODES:
+                raise Throttled(e.smtp_error) from e
+            raise
+
+
+class SMSChannel(ChannelBackend):
+    default_name = "sms"
+
+    def recipient(self, reminder):
+        if not reminder.user:
+            return None
+        try:
+            return reminder.user.userprofile.phone or None
+        except Exception:
+            return None
+
+
+class TwilioSMSChannel(SMSChannel):
+    """SMS through Twilio. The client, and its HTTP session, is built once."""
+
+    def __init__(self, name=None, account_sid=None, auth_token=None, from_number=None, client=None, **options):
+        super().__init__(name)
+        self.account_sid = account_sid or getattr(settings, "TWILIO_ACCOUNT_SID", None)
+        self.auth_token = auth_token or getattr(settings, "TWILIO_AUTH_TOKEN", None)
+        self.from_number = from_number or getattr(settings, "TWILIO_FROM_NUMBER", None)
+        self._client = client
+        self._lock = threading.Lock()
+
+    def is_available(self):
+        if not self.from_number:
+            return False
+        return self._client is not None or bool(TWILIO_AVAILABLE and self.account_sid and self.auth_token)
+
+    def open(self):
+        with self._lock:
+            if self._client is None:
+                self._client = TwilioClient(self.account_sid, self.auth_token)
+            return self._client
+
+    def send(self, client, message):
+        try:
+            client.messages.create(body=message.body, from_=self.from_number, to=message.recipient)
+        except Exception as e:
+            # TwilioRestException carries the HTTP status.
+            if getattr(e, "status", None) == 429:
+                raise Throttled(str(e)) from e
+            raise
+
+
+class WebhookChannel(ChannelBackend):
+    """
+    POSTs each notification as JSON to ``url``, e.g. for a caregiver or
+    hospital integration. Requests in one ``send_many`` share a keep-alive
+    HTTP connection.
+    """
+
+    default_name = "webhook"
+
+    def __init__(self, name=None, url=None, timeout=5, headers=None, **options):
+        super().__init__(name)
+        if not url:
+            raise ImproperlyConfigured("WebhookChannel needs a url option.")
+        self.url = urlsplit(url)
+        self.timeout = timeout
+        self.headers = {"Content-Type": "application/json", **(headers or {})}
+
+    def recipient(self, reminder):
+        return reminder.user_id
+
+    def open(self):
+        cls = http.client.HTTPSConnection if self.url.scheme == "https" else http.client.HTTPConnection
+        return cls(self.url.netloc, timeout=self.timeout)
+
+    def close(self, connection):
+        connection.close()
+
+    def send(self, connection, message):
+        payload = json.dumps({
+            "reminders": list(message.keys), "user": message.recipient,
+            "subject": message.subject, "body": message.body,
+        })
+        path = self.url.path or "/"
+        if self.url.query:
+            path += "?" + self.url.query
+        connection.request("POST", path, body=payload, headers=self.headers)
+        response = connection.getresponse()
+        response.read()
+        if response.status == 429:
+            raise Throttled("webhook returned 429")
+        if response.status >= 400:
+            raise RuntimeError(f"webhook returned {response.status}")
+
+
+class WebPushChannel(ChannelBackend):
+    """
+    Web Push to every browser the user subscribed (``PushSubscription``),
+    encrypted and VAPID-signed by pywebpush. Each device is its own message,
+    so a user's devices are sent to concurrently. Subscriptions the push
+    service reports gone (404/410) are deleted after the batch.
+    """
+
+    default_name = "push"
+
+    def __init__(self, name=None, private_key=None, subject=None, ttl=3600, timeout=10, **options):
+        super().__init__(name)
+        self.private_key = private_key or getattr(settings, "WEBPUSH_VAPID_PRIVATE_KEY", None)
+        self.subject = subject or getattr(settings, "WEBPUSH_VAPID_SUBJECT", None)
+        self.ttl = ttl
+        self.timeout = timeout
+        self._expired = set()
+        self._lock = threading.Lock()
+
+    def is_available(self):
+        return bool(WEBPUSH_AVAILABLE and self.private_key and self.subject)
+
+    def prepare(self, reminders):
+        from .models import PushSubscription
+
+        by_user = {}
+        user_ids = {r.user_id for r in reminders if r.user_id}
+        for subscription in PushSubscription.objects.filter(user_id__in=user_ids):
+            by_user.setdefault(subscription.user_id, []).append(subscription)
+        return by_user
+
+    def recipients(self, reminder, prepared=None):
+        return (prepared or {}).get(reminder.user_id, [])
+
+    def open(self):
+        # Keep-alive connections to the push services for the whole chunk.
+        return requests.Session()
+
+    def close(self, session):
+        session.close()
+
+    def send(self, session, message):
+        payload = json.dumps({"title": message.subject, "body": message.body, "reminders": list(message.keys)})
+        try:
+            webpush(
+                message.recipient.info(), payload,
+                vapid_private_key=self.private_key,
+                # webpush() fills in aud and exp, so each call gets its own dict.
+                vapid_claims={"sub": self.subject},
+                ttl=self.ttl, timeout=self.timeout, requests_session=session,
+            )
+        except WebPushException as e:
+            status = e.response.status_code if e.response is not None else None
+            if status == 429:
+                raise Throttled(str(e)) from e
+            if status in (404, 410):
+                with self._lock:
+                    self._expired.add(message.recipient.pk)
+            raise
+
+    def batch_done(self):
+        from .models import PushSubscription
+
+        with self._lock:
+            expired, self._expired = self._expired, set()
+        if expired:
+            PushSubscription.objects.filter(pk__in=expired).delete()
+
+
+class LocmemChannel(ChannelBackend):
+    """
+    Test backend: keeps sent messages in ``self.sent``, fails for the
+    recipients in ``fail_for`` and throttles those in ``throttle_for``.
+    ``recipient_from`` borrows the addressing of another channel class,
+    e.g. ``recipient_from=SMSChannel``.
+    """
+
+    default_name = "locmem"
+
+    def __init__(self, name=None, recipient_from=SMSChannel, fail_for=(), throttle_for=(), **options):
+        super().__init__(name)
+        self._addressing = recipient_from()
+        self.fail_for = set(fail_for)
+        self.throttle_for = set(throttle_for)
+        self.sent = []
+        self.connections = 0
+        self._lock = threading.Lock()
+
+    def prepare(self, reminders):
+        return self._addressing.prepare(reminders)
+
+    def recipients(self, reminder, prepared=None):
+        return self._addressing.recipients(reminder, prepared)
+
+    def open(self):
+        with self._lock:
+            self.connections += 1
+
+    def send(self, connection, message):
+        if message.recipient in self.fail_for:
+            raise RuntimeError("provider unavailable")
+        if message.recipient in self.throttle_for:
+            raise Throttled("too many requests")
+        with self._lock:
+            self.sent.append(message)
+
+
+def get_channels():
+    """
+    Build the channels in NOTIFICATION_CHANNELS, a dict of name to
+    {"BACKEND": dotted path, "OPTIONS": {...}} like CACHES, optionally with
+    "RATE_LIMIT": {"rate": per second, "burst": n} for the channel and
+    "PROVIDER": a key of NOTIFICATION_PROVIDER_LIMITS whose bucket it
+    shares. Channels that are not configured (e.g. Twilio without
+    credentials) are left out.
+    """
+    config = getattr(settings, "NOTIFICATION_CHANNELS", DEFAULT_CHANNELS)
+    channels = []
+    for name, entry in config.items():
+        backend = import_string(entry["BACKEND"])
+        channel = backend(name=name, **entry.get("OPTIONS", {}))
+        if not channel.is_available():
+            continue
+        if entry.get("RATE_LIMIT"):
+            channel.limiters.append(TokenBucket(entry["RATE_LIMIT"]["rate"], entry["RATE_LIMIT"].get("burst")))
+        if entry.get("PROVIDER") and provider_bucket(entry["PROVIDER"]):
+            channel.limiters.append(provider_bucket(entry["PROVIDER"]))
+        channels.append(channel)
+    return channels
@@ -0,0 +1,175 @@
+# core/scheduler.py
+import heapq
+import logging
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Max
+from django.utils import timezone
+
+from .models import Reminder
+from .schedules import materialise_window, window_size
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_POLL_INTERVAL = 5.0
+# Recurring schedules are materialised ahead in steps of this size.
+MATERIALISE_STEP = timedelta(hours=1)
+
+# The scheduler running in this process, if any. Reminder signals push
+# changes straight into it so edits made in-process are seen immediately.
+_active_scheduler = None
+
+
+def get_active_scheduler():
+    return _active_scheduler
+
+
+def refresh_overlap():
+    """How far before the high-water mark each poll looks again."""
+    return timedelta(seconds=getattr(settings, "SCHEDULER_REFRESH_OVERLAP_SECONDS", 60))
+
+
+def _next_attempt(reminder_time, claim_expires):
+    # A leased or backed-off reminder cannot be dispatched before its
+    # claim expires.
+    if claim_expires is not None and claim_expires > reminder_time:
+        return claim_expires
+    return reminder_time
+
+
+class ReminderScheduler:
+    """
+    Keeps a min-heap of (reminder_time, pk) for every pending reminder and
+    sleeps until the earliest one is due.
+
+    New and edited reminders are picked up incrementally: rows saved in this
+    process arrive through ``push()`` (see ``core.signals``), and rows saved
+    elsewhere are found by polling ``updated_at`` above a high-water mark.
+    Entries are never removed from the heap on edit or delete; the
+    dispatcher re-checks each row when it pops, so stale entries are skipped.
+
+    Recurring schedules are only stored as Reminder rows for a rolling
+    window ahead of now; ``extend_window()`` moves that window forward.
+    """
+
+    def __init__(self, dispatcher, poll_interval=DEFAULT_POLL_INTERVAL):
+        self.dispatcher = dispatcher
+        self.poll_interval = poll_interval
+        self.heap = []
+        self.high_water = None
+        # updated_at of rows pushed within the refresh overlap, by pk.
+        self.recent = {}
+        self.materialised_until = None
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = False
+
+    def load(self):
+        rows = Reminder.objects.filter(delivered=False).values_list("reminder_time", "pk", "claim_expires")
+        with self._lock:
+            self.heap = [(_next_attempt(when, expires), pk) for when, pk, expires in rows]
+            heapq.heapify(self.heap)
+        self.high_water = Reminder.objects.aggregate(m=Max("updated_at"))["m"]
+
+    def refresh(self):
+        """
+        Pull rows created or edited since the last poll into the heap.
+        updated_at is stamped before the row is written, so a save can
+        commit after a later one; each poll re-reads the last
+        ``refresh_overlap()`` before the high-water mark to catch it.
+        """
+        qs = Reminder.objects.filter(delivered=False)
+        overlap = refresh_overlap()
+        if self.high_water is not None:
+            qs = qs.filter(updated_at__gt=self.high_water - overlap)
+
+        rows = qs.values_list("reminder_time", "pk", "updated_at", "claim_expires")
+        for reminder_time, pk, updated_at, claim_expires in rows:
+            # Rows already pushed by an earlier poll are not pushed again.
+            if self.recent.get(pk) != updated_at:
+                self.push(_next_attempt(reminder_time, claim_expires), pk, wake=False)
+                self.recent[pk] = updated_at
+            if self.high_water is None or updated_at > self.high_water:
+                self.high_water = updated_at
+
+        if self.high_water is not None:
+            cutoff = self.high_water - overlap
+            self.recent = {pk: stamp for pk, stamp in self.recent.items() if stamp > cutoff}
+
+    def extend_window(self, now):
+        horizon = now + window_size()
+        if self.materialised_until is not None and horizon - self.materialised_until < MATERIALISE_STEP:
+            return
+        start = self.materialised_until or now
+        for reminder in materialise_window(start, horizon):
+            self.push(reminder.reminder_time, reminder.pk, wake=False)
+        self.materialised_until = horizon
+
+    def push(self, reminder_time, pk, wake=True):
+        with self._lock:
+            heapq.heappush(self.heap, (reminder_time, pk))
+        if wake:
+            self._wakeup.set()
+
+    def pop_due(self, now):
+        due = []
+        with self._lock:
+            while self.heap and self.heap[0][0] <= now:
+                due.append(heapq.heappop(self.heap)[1])
+        return due
+
+    def seconds_until_next(self, now):
+        with self._lock:
+            if not self.heap:
+                return None
+            return max((self.heap[0][0] - now).total_seconds(), 0.0)
+
+    def run_pending(self, now=None):
+        now = now or timezone.now()
+        pks = self.pop_due(now)
+        if not pks:
+            return None
+        # A pk can be in the heap more than once after an edit.
+        stats = self.dispatcher.run(now, pks=set(pks))
+        # Failed sends come back after their backoff.
+        for retry_at, pk in stats.retries:
+            self.push(retry_at, pk, wake=False)
+        # Rows leased by another dispatcher were skipped. Neither the claim
+        # nor its release touches updated_at, so refresh() would never see
+        # them again: look once the lease runs out, in case that worker died.
+        retried = {pk for _, pk in stats.retries}
+        skipped = Reminder.objects.filter(pk__in=set(pks) - retried, delivered=False).values_list(
+            "reminder_time", "pk", "claim_expires"
+        )
+        for reminder_time, pk, claim_expires in skipped:
+            self.push(_next_attempt(reminder_time, claim_expires), pk, wake=False)
+        return stats
+
+    def run_forever(self):
+        global _active_scheduler
+        _active_scheduler = self
+        try:
+            self.load()
+            while not self._stopping:
+                self.extend_window(timezone.now())
+                stats = self.run_pending()
+                if stats is not None and (stats.delivered or stats.deferred):
+                    logger.info(
+                        "Dispatched %s reminders (%s rate limited, worst lag %.0fs)",
+                        stats.delivered, stats.deferred, stats.max_lag,
+                    )
+
+                wait = self.seconds_until_next(timezone.now())
+                if wait is None or wait > self.poll_interval:
+                    wait = self.poll_interval
+                self._wakeup.wait(wait)
+                self._wakeup.clear()
+                self.refresh()
+        finally:
+            _active_scheduler = None
+
+    def stop(self):
+        self._stopping = True
+        self._wakeup.set()
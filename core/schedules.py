@@ -0,0 +1,173 @@
+# core/schedules.py
+import heapq
+from datetime import datetime, time, timedelta
+from itertools import islice
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .dashboard import invalidate_dashboard
+from .changes import next_seqs, record_deletes
+from .db import delete_rows
+from .models import DoseEvent, MedicineSchedule, Reminder, Tombstone
+
+
+# Rows per INSERT when storing occurrences.
+MATERIALISE_BATCH_SIZE = 500
+
+
+def window_size():
+    """How far ahead occurrences are stored as Reminder rows."""
+    return timedelta(hours=getattr(settings, "SCHEDULE_WINDOW_HOURS", 24))
+
+
+def iter_occurrences(schedule, start, end, tz=None):
+    """
+    Lazily yield the aware datetimes of ``schedule`` in ``[start, end)``,
+    clipped to the medicine's course. Days outside the window are never
+    visited, so the cost depends on the window, not the course length.
+    """
+    tz = tz or timezone.get_default_timezone()
+    times = sorted(time.fromisoformat(t) for t in schedule.times_of_day)
+    if not times or start >= end:
+        return
+
+    medicine = schedule.medicine
+    interval = schedule.interval_days or 1
+    mask = schedule.weekdays
+
+    day = max(medicine.start_date, timezone.localtime(start, tz).date())
+    last_day = min(medicine.end_date, timezone.localtime(end, tz).date())
+
+    # Snap to the first day on the interval grid counted from the course start.
+    offset = (day - medicine.start_date).days % interval
+    if offset:
+        day += timedelta(days=interval - offset)
+    step = timedelta(days=interval)
+
+    while day <= last_day:
+        if not mask or mask >> day.weekday() & 1:
+            for t in times:
+                dt = datetime.combine(day, t, tzinfo=tz)
+                if start <= dt < end:
+                    yield dt
+        day += step
+
+
+def upcoming_doses(schedules, start, end, limit=50):
+    """
+    Merge several schedules into one time-ordered list of (time, medicine
+    name). A schedule annotated with ``stored_until``, its latest stored
+    reminder, is only expanded after it, so doses already stored, such as
+    a generated course, are not listed twice.
+    """
+    def begin(schedule):
+        stored_until = getattr(schedule, "stored_until", None)
+        if stored_until is None:
+            return start
+        return max(start, stored_until + timedelta(microseconds=1))
+
+    streams = [
+        ((dt, schedule.medicine.name) for dt in iter_occurrences(schedule, begin(schedule), end))
+        for schedule in schedules
+    ]
+    return list(islice(heapq.merge(*streams), limit))
+
+
+def materialise_window(start, end, schedules=None):
+    """
+    Store the occurrences in ``[start, end)`` as Reminder rows, skipping any
+    that already exist, whether from the schedule or added by hand. Returns
+    the created reminders.
+    """
+    if schedules is None:
+        schedules = MedicineSchedule.objects.filter(
+            medicine__start_date__lte=end.date(),
+            medicine__end_date__gte=start.date(),
+        )
+    schedules = list(schedules.select_related("medicine"))
+    if not schedules:
+        return []
+
+    # Aware datetimes compare and hash by instant, so rows read back in UTC
+    # match occurrences built in local time.
+    existing = set(
+        Reminder.objects.filter(
+            medicine_id__in=[s.medicine_id for s in schedules],
+            reminder_time__gte=start, reminder_time__lt=end,
+        ).values_list("medicine_id", "user_id", "reminder_time")
+    )
+    new = [
+        Reminder(medicine_id=s.medicine_id, user_id=s.user_id, schedule=s, reminder_time=dt)
+        for s in schedules
+        for dt in iter_occurrences(s, start, end)
+        if (s.medicine_id, s.user_id, dt) not in existing
+    ]
+    if not new:
+        return []
+
+    user_ids = {r.user_id for r in new}
+    with transaction.atomic():
+        # bulk_create skips the post_save signals that record changes.
+        seqs = next_seqs(user_ids)
+        for reminder in new:
+            reminder.change_seq = seqs.get(reminder.user_id, 0)
+        created = Reminder.objects.bulk_create(new, batch_size=MATERIALISE_BATCH_SIZE)
+    invalidate_dashboard(user_ids)
+    return created
+
+
+def course_end(medicine, tz=None):
+    """The end of the course's last day, as an exclusive bound."""
+    tz = tz or timezone.get_default_timezone()
+    return datetime.combine(medicine.end_date + timedelta(days=1), time(), tzinfo=tz)
+
+
+def generate_course(schedule, now=None):
+    """
+    Store every remaining dose of the schedule's course as Reminder rows,
+    rather than only the rolling window, skipping doses that already exist.
+    Each occurrence is built at its local wall-clock time, so doses keep
+    their hour across DST changes. Returns the created reminders.
+    """
+    now = now or timezone.now()
+    return materialise_window(
+        now, course_end(schedule.medicine), MedicineSchedule.objects.filter(pk=schedule.pk)
+    )
+
+
+def sync_schedule(schedule, now=None):
+    """
+    Bring the stored doses in line after a schedule or its course changed:
+    the current window, or as far as they already went for a course that
+    was generated in full. Doses still on the schedule are kept, so only
+    the ones that moved are deleted and created again.
+    """
+    now = now or timezone.now()
+    pending = list(
+        Reminder.objects.filter(schedule=schedule, delivered=False, reminder_time__gte=now)
+        .values_list("pk", "user_id", "reminder_time")
+    )
+    end = now + window_size()
+    if pending:
+        tz = timezone.get_default_timezone()
+        latest = max(reminder_time for _, _, reminder_time in pending)
+        last_day = timezone.localtime(latest, tz).date() + timedelta(days=1)
+        end = max(end, datetime.combine(last_day, time(), tzinfo=tz))
+
+    wanted = set(iter_occurrences(schedule, now, end))
+    stale = [
+        (pk, user_id) for pk, user_id, reminder_time in pending
+        if user_id != schedule.user_id or reminder_time not in wanted
+    ]
+    if stale:
+        pks = [pk for pk, _ in stale]
+        with transaction.atomic():
+            # One tombstone per dose but a single counter bump, rather than
+            # delete()'s post_delete for every row.
+            DoseEvent.objects.filter(reminder_id__in=pks).update(reminder=None)
+            delete_rows(Reminder, pks)
+            record_deletes(Tombstone.REMINDER, stale)
+        invalidate_dashboard({user_id for _, user_id in stale})
+    return materialise_window(now, end, MedicineSchedule.objects.filter(pk=schedule.pk))
@@ -1,9 +1,84 @@
 from django.contrib.auth.models import User
-from django.db.models.signals import post_save
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
-from .models import UserProfile
+from .changes import record_changes, record_deletes
+from .dashboard import invalidate_dashboard
+from .db import configure_connection
+from .models import Medicine, MedicineSchedule, Reminder, Tombstone, UserProfile
+from .scheduler import get_active_scheduler
+from .schedules import sync_schedule
+
+@receiver(connection_created)
+def configure_new_connection(sender, connection, **kwargs):
+    configure_connection(connection)
+
 
 @receiver(post_save, sender=User)
 def create_user_profile(sender, instance, created, **kwargs):
     if created:
         UserProfile.objects.create(user=instance)
+
+
+@receiver(post_save, sender=Reminder)
+def schedule_reminder(sender, instance, **kwargs):
+    # Deletes need no handler: the dispatcher skips rows that no longer exist.
+    scheduler = get_active_scheduler()
+    if scheduler is not None and not instance.delivered:
+        scheduler.push(instance.reminder_time, instance.pk)
+
+
+@receiver(post_save, sender=Reminder)
+def reminder_changed(sender, instance, **kwargs):
+    if instance.user_id:
+        record_changes([instance.user_id], reminders=Reminder.objects.filter(pk=instance.pk))
+        invalidate_dashboard([instance.user_id])
+
+
+@receiver(post_delete, sender=Reminder)
+def reminder_deleted(sender, instance, **kwargs):
+    if instance.user_id:
+        record_deletes(Tombstone.REMINDER, [(instance.pk, instance.user_id)])
+        invalidate_dashboard([instance.user_id])
+
+
+@receiver(post_save, sender=Medicine)
+def medicine_changed(sender, instance, created, **kwargs):
+    # The owner's dashboard counts their medicines.
+    if instance.owner_id:
+        invalidate_dashboard([instance.owner_id])
+
+    if created:
+        record_changes([instance.owner_id], medicines=Medicine.objects.filter(pk=instance.pk))
+    else:
+        # Renaming a medicine changes the payload of every reminder that uses it.
+        user_ids = set(
+            Reminder.objects.filter(medicine=instance).values_list("user_id", flat=True)
+        )
+        record_changes(
+            user_ids | {instance.owner_id},
+            medicines=Medicine.objects.filter(pk=instance.pk),
+            reminders=Reminder.objects.filter(medicine=instance, delivered=False),
+        )
+        invalidate_dashboard(user_ids)
+
+        # The course dates bound the schedule's occurrences; other edits
+        # leave the stored doses as they are.
+        if instance.course_changed():
+            schedule = MedicineSchedule.objects.filter(medicine=instance).first()
+            if schedule is not None:
+                schedule.medicine = instance
+                sync_schedule(schedule)
+    instance._saved_course = (instance.start_date, instance.end_date)
+
+
+@receiver(post_delete, sender=Medicine)
+def medicine_deleted(sender, instance, **kwargs):
+    if instance.owner_id:
+        record_deletes(Tombstone.MEDICINE, [(instance.pk, instance.owner_id)])
+        invalidate_dashboard([instance.owner_id])
+
+
+@receiver(post_save, sender=MedicineSchedule)
+def schedule_changed(sender, instance, **kwargs):
+    sync_schedule(instance)
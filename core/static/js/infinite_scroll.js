@@ -0,0 +1,34 @@
+// Infinite scroll for keyset-paginated lists: each ".load-more" sentinel
+// carries the URL of the next page (an HTML fragment) and is replaced by
+// that fragment when it scrolls into view.
+document.addEventListener("DOMContentLoaded", () => {
+  if (!("IntersectionObserver" in window)) return;
+
+  const observer = new IntersectionObserver((entries) => {
+    entries.forEach((entry) => {
+      if (!entry.isIntersecting) return;
+
+      const sentinel = entry.target;
+      observer.unobserve(sentinel);
+
+      fetch(sentinel.dataset.next)
+        .then((res) => {
+          if (!res.ok) throw new Error(`page load failed: ${res.status}`);
+          return res.text();
+        })
+        .then((html) => {
+          const parent = sentinel.parentNode;
+          sentinel.insertAdjacentHTML("afterend", html);
+          sentinel.remove();
+          watch(parent);
+        })
+        .catch((err) => console.error(err));
+    });
+  }, { rootMargin: "200px" });
+
+  function watch(root) {
+    root.querySelectorAll(".load-more").forEach((el) => observer.observe(el));
+  }
+
+  watch(document);
+});
@@ -1,15 +1,47 @@
 document.addEventListener("DOMContentLoaded", () => {
 
   let activeReminderId = null;
+  // The service worker registration once the offline schedule is in use.
+  let offlineWorker = null;
 
   // ================================
   // SERVICE WORKER
   // ================================
-  if ("serviceWorker" in navigator) {
-    navigator.serviceWorker
+  let swRegistration = Promise.resolve(null);
+  if ("serviceWorker" in navigator && "indexedDB" in window) {
+    swRegistration = navigator.serviceWorker
       .register("/static/js/sw.js")
-      .then(() => console.log("SW registered"))
-      .catch((err) => console.error("SW failed", err));
+      .then(whenActive)
+      .then((reg) => {
+        console.log("SW registered");
+        return reg;
+      })
+      .catch((err) => {
+        console.error("SW failed", err);
+        return null;
+      });
+  }
+
+  // The worker's scope (/static/js/) does not cover the pages, so
+  // serviceWorker.ready never settles here; wait for activation directly.
+  function whenActive(reg) {
+    const worker = reg.installing || reg.waiting;
+    if (reg.active || !worker) return reg;
+    return new Promise((resolve) => {
+      worker.addEventListener("statechange", () => {
+        if (worker.state === "activated") resolve(reg);
+        if (worker.state === "redundant") resolve(null);
+      });
+    });
+  }
+
+  // Ask the service worker something and resolve with its answer.
+  function callWorker(reg, message) {
+    return new Promise((resolve) => {
+      const channel = new MessageChannel();
+      channel.port1.onmessage = (event) => resolve(event.data);
+      reg.active.postMessage({ ...message, csrfToken: csrfToken() }, [channel.port2]);
+    });
   }
 
   // ================================
@@ -32,43 +64,264 @@ document.addEventListener("DOMContentLoaded", () => {
   window.closeReminderModal = function () {
     if (activeReminderId === null) return;
 
-    fetch(`/api/mark-delivered/${activeReminderId}/`)
-      .then(() => {
-        document.getElementById("reminderModal").style.display = "none";
-        activeReminderId = null;
-      });
+    queueAck(activeReminderId, "taken");
+    document.getElementById("reminderModal").style.display = "none";
+    activeReminderId = null;
   };
 
+  // ================================
+  // ACKNOWLEDGEMENT QUEUE
+  // ================================
+  // Acks are kept in localStorage and sent together, so doses acknowledged
+  // while offline are delivered in one request once the server is reachable.
+  const ACK_QUEUE_KEY = "medcia.ackQueue";
+  let ackFlushTimer = null;
+
+  function loadAcks() {
+    try {
+      return JSON.parse(localStorage.getItem(ACK_QUEUE_KEY)) || [];
+    } catch (err) {
+      return [];
+    }
+  }
+
+  function saveAcks(acks) {
+    localStorage.setItem(ACK_QUEUE_KEY, JSON.stringify(acks));
+  }
+
+  function isQueued(reminderId) {
+    return loadAcks().some((ack) => ack.id === reminderId);
+  }
+
+  function queueAck(reminderId, status) {
+    if (offlineWorker !== null) {
+      callWorker(offlineWorker, { action: "ack", id: reminderId, status, at: new Date().toISOString() });
+      return;
+    }
+
+    const acks = loadAcks();
+    acks.push({ id: reminderId, status, at: new Date().toISOString() });
+    saveAcks(acks);
+    scheduleAckFlush();
+  }
+
+  function scheduleAckFlush() {
+    if (ackFlushTimer !== null) return;
+    ackFlushTimer = setTimeout(flushAcks, 1000);
+  }
+
+  function csrfToken() {
+    const match = document.cookie.match(/(?:^|;\s*)csrftoken=([^;]+)/);
+    return match ? decodeURIComponent(match[1]) : "";
+  }
+
+  function flushAcks() {
+    ackFlushTimer = null;
+    const acks = loadAcks();
+    if (!acks.length) return;
+
+    fetch("/api/ack-reminders/", {
+      method: "POST",
+      headers: { "Content-Type": "application/json", "X-CSRFToken": csrfToken() },
+      body: JSON.stringify({ acks }),
+    })
+      .then((res) => {
+        if (!res.ok) throw new Error(`ack failed: ${res.status}`);
+        // Keep anything queued while the request was in flight.
+        const sent = new Set(acks.map((ack) => ack.id));
+        saveAcks(loadAcks().filter((ack) => !sent.has(ack.id)));
+      })
+      .catch((err) => console.error(err));
+  }
+
+  window.addEventListener("online", flushAcks);
+  flushAcks();
+
   // ================================
   // REMINDER CHECK
   // ================================
+  // The server answers 304 while the pending list is unchanged, so the
+  // last payload is kept here and re-checked against the clock.
+  let remindersEtag = null;
+  let remindersCache = [];
+
+  function fetchReminders() {
+    const headers = remindersEtag ? { "If-None-Match": remindersEtag } : {};
+
+    return fetch("/api/get-reminders/", { headers, cache: "no-store" })
+      .then((res) => {
+        if (res.status === 304) return remindersCache;
+
+        remindersEtag = res.headers.get("ETag");
+        return res.json().then((data) => {
+          remindersCache = data;
+          return data;
+        });
+      });
+  }
+
+  function notifyReminder(rem) {
+    if (activeReminderId !== null || isQueued(rem.id)) return;
+
+    showReminderModal(
+      `Time to take ${rem.medicine}`,
+      rem.id
+    );
+
+    if (Notification.permission === "granted") {
+      new Notification("Medication Reminder", {
+        body: `Time to take ${rem.medicine}`,
+      });
+    }
+  }
+
   function checkReminders() {
     if (activeReminderId !== null) return;
 
-    fetch("/api/get-reminders/")
-      .then((res) => res.json())
+    fetchReminders()
       .then((data) => {
-        if (!data.length) return;
-
         const now = new Date();
-        const rem = data[0];
+        const rem = data.find((r) => !isQueued(r.id));
+        if (!rem) return;
         const reminderTime = new Date(rem.time);
 
         if (!rem.delivered && reminderTime <= now) {
-          showReminderModal(
-            `Time to take ${rem.medicine}`,
-            rem.id
-          );
-
-          if (Notification.permission === "granted") {
-            new Notification("Medication Reminder", {
-              body: `Time to take ${rem.medicine}`,
-            });
-          }
+          notifyReminder(rem);
         }
       });
   }
 
-  setInterval(checkReminders, 30000);
-  checkReminders();
+  let pollTimer = null;
+
+  function startPolling() {
+    if (pollTimer !== null) return;
+    pollTimer = setInterval(checkReminders, 30000);
+    checkReminders();
+  }
+
+  // ================================
+  // PUSH (Server-Sent Events)
+  // ================================
+  // The server pushes each reminder the moment it is due. EventSource
+  // reconnects by itself after network errors; if the server refuses the
+  // stream (e.g. not running under ASGI) fall back to polling.
+  function startLiveUpdates() {
+    if ("EventSource" in window) {
+      const stream = new EventSource("/api/reminder-stream/");
+
+      stream.addEventListener("reminder", (event) => {
+        notifyReminder(JSON.parse(event.data));
+      });
+
+      stream.onerror = () => {
+        if (stream.readyState === EventSource.CLOSED) startPolling();
+      };
+
+      checkReminders();
+    } else {
+      startPolling();
+    }
+  }
+
+  // ================================
+  // WEB PUSH
+  // ================================
+  // With a push subscription the server notifies this device through the
+  // service worker, even with no tab open, so the page neither streams nor
+  // polls; it only checks once on load for the in-page prompt.
+  function urlBase64ToUint8Array(value) {
+    const padded = (value + "=".repeat((4 - (value.length % 4)) % 4))
+      .replace(/-/g, "+")
+      .replace(/_/g, "/");
+    return Uint8Array.from(atob(padded), (c) => c.charCodeAt(0));
+  }
+
+  function subscribePush() {
+    if (!("PushManager" in window) || !("Notification" in window) || Notification.permission !== "granted") {
+      return Promise.resolve(false);
+    }
+
+    return swRegistration
+      .then((reg) => {
+        if (!reg) return false;
+        return fetch("/api/push-subscriptions/")
+          .then((res) => res.json())
+          .then(({ public_key: publicKey }) => {
+            if (!publicKey) return false;
+            return reg.pushManager
+              .getSubscription()
+              .then((existing) => existing || reg.pushManager.subscribe({
+                userVisibleOnly: true,
+                applicationServerKey: urlBase64ToUint8Array(publicKey),
+              }))
+              .then((subscription) => fetch("/api/push-subscriptions/", {
+                method: "POST",
+                headers: { "Content-Type": "application/json", "X-CSRFToken": csrfToken() },
+                body: JSON.stringify(subscription),
+              }))
+              .then((res) => res.ok);
+          });
+      })
+      .catch((err) => {
+        console.error("Push subscription failed", err);
+        return false;
+      });
+  }
+
+  // ================================
+  // OFFLINE SCHEDULE (service worker)
+  // ================================
+  // The service worker keeps the pending list in IndexedDB and syncs only
+  // changes, so checking for due doses every 30 s never leaves the browser
+  // and keeps working offline. Acks go through its Background Sync queue.
+  // While online the reminder stream still runs, and each of its events
+  // makes the worker sync at once instead of within SYNC_INTERVAL_MS.
+
+  function checkCachedReminders(force) {
+    if (activeReminderId !== null && !force) return;
+
+    callWorker(offlineWorker, { action: "check", force }).then(({ due }) => {
+      const rem = due && due[0];
+      // The service worker has already shown the system notification.
+      if (rem && activeReminderId === null) {
+        showReminderModal(`Time to take ${rem.medicine}`, rem.id);
+      }
+    });
+  }
+
+  function followChanges() {
+    if (!("EventSource" in window)) return;
+    const stream = new EventSource("/api/reminder-stream/");
+    // A reminder that is due, or any other change, may not be cached yet.
+    stream.addEventListener("reminder", () => checkCachedReminders(true));
+    stream.addEventListener("changed", () => checkCachedReminders(true));
+  }
+
+  function startOfflineSchedule(reg) {
+    offlineWorker = reg;
+    if (reg.periodicSync) {
+      reg.periodicSync.register("medcia-schedule", { minInterval: 15 * 60 * 1000 }).catch(() => {});
+    }
+    followChanges();
+    setInterval(() => checkCachedReminders(false), 30000);
+    window.addEventListener("online", () => checkCachedReminders(true));
+    checkCachedReminders(true);
+  }
+
+  swRegistration.then((reg) => {
+    if (reg && reg.active) {
+      startOfflineSchedule(reg);
+      // Push still reaches the device when every tab is closed.
+      subscribePush();
+      return;
+    }
+
+    subscribePush().then((subscribed) => {
+      if (subscribed) {
+        checkReminders();
+      } else {
+        startLiveUpdates();
+      }
+    });
+  });
 });
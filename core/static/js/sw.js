@@ -1,10 +1,261 @@
+// How often the cached schedule is checked against the server. Due doses
+// are found in the local copy, so this only bounds how stale edits made
+// elsewhere can be.
+const SYNC_INTERVAL_MS = 5 * 60 * 1000;
+const ACK_SYNC_TAG = "medcia-acks";
+const SCHEDULE_SYNC_TAG = "medcia-schedule";
 
+self.addEventListener("install", () => self.skipWaiting());
+self.addEventListener("activate", (event) => event.waitUntil(self.clients.claim()));
+
+// ================================
+// INDEXEDDB
+// ================================
+// "reminders": the user's pending reminders, by id.
+// "acks": acknowledgements waiting to be sent, in order.
+// "meta": the sync version, last sync time and CSRF token.
+let dbPromise = null;
+
+function openDb() {
+  if (dbPromise === null) {
+    dbPromise = new Promise((resolve, reject) => {
+      const request = indexedDB.open("medcia", 1);
+      request.onupgradeneeded = () => {
+        const db = request.result;
+        db.createObjectStore("reminders", { keyPath: "id" });
+        db.createObjectStore("acks", { keyPath: "seq", autoIncrement: true });
+        db.createObjectStore("meta");
+      };
+      request.onsuccess = () => resolve(request.result);
+      request.onerror = () => {
+        dbPromise = null;
+        reject(request.error);
+      };
+    });
+  }
+  return dbPromise;
+}
+
+// Run fn(stores) in one transaction and resolve with its result once the
+// transaction has committed.
+function withStores(names, mode, fn) {
+  return openDb().then((db) => new Promise((resolve, reject) => {
+    const tx = db.transaction(names, mode);
+    const stores = {};
+    for (const name of names) stores[name] = tx.objectStore(name);
+    let result;
+    Promise.resolve(fn(stores)).then((value) => { result = value; });
+    tx.oncomplete = () => resolve(result);
+    tx.onerror = () => reject(tx.error);
+    tx.onabort = () => reject(tx.error);
+  }));
+}
+
+function requestValue(request) {
+  return new Promise((resolve, reject) => {
+    request.onsuccess = () => resolve(request.result);
+    request.onerror = () => reject(request.error);
+  });
+}
+
+function getMeta(key) {
+  return withStores(["meta"], "readonly", ({ meta }) => requestValue(meta.get(key)));
+}
+
+function setMeta(key, value) {
+  return withStores(["meta"], "readwrite", ({ meta }) => { meta.put(value, key); });
+}
+
+// ================================
+// SCHEDULE SYNC
+// ================================
+// Deltas from /api/reminder-changes/: pending reminders added or edited
+// since our version, and the ids delivered, acknowledged or deleted since.
+let syncInFlight = null;
+
+function syncSchedule(force) {
+  if (syncInFlight !== null) return syncInFlight;
+
+  syncInFlight = Promise.all([getMeta("version"), getMeta("syncedAt")])
+    .then(([version, syncedAt]) => {
+      if (!force && syncedAt && Date.now() - syncedAt < SYNC_INTERVAL_MS) return;
+
+      const url = version
+        ? `/api/reminder-changes/?since=${encodeURIComponent(version)}`
+        : "/api/reminder-changes/";
+      return fetch(url, { cache: "no-store", redirect: "error" })
+        .then((res) => {
+          if (!res.ok) throw new Error(`sync failed: ${res.status}`);
+          return res.json();
+        })
+        .then((data) => withStores(["reminders", "meta"], "readwrite", ({ reminders, meta }) => {
+          meta.put(Date.now(), "syncedAt");
+          if (!data.changed) return;
+
+          return requestValue(reminders.getAll()).then((cached) => {
+            const known = new Map(cached.map((rem) => [rem.id, rem]));
+            if (data.full) {
+              reminders.clear();
+              known.clear();
+            }
+            for (const id of data.removed) reminders.delete(id);
+            for (const rem of data.reminders) {
+              const previous = known.get(rem.id);
+              // A moved dose rings again at its new time.
+              const notified = previous && previous.time === rem.time ? previous.notified : false;
+              reminders.put({ ...rem, notified });
+            }
+            meta.put(data.version, "version");
+          });
+        }));
+    })
+    .catch((err) => console.error(err))
+    .finally(() => { syncInFlight = null; });
+
+  return syncInFlight;
+}
+
+// Reminders that are due and not yet acknowledged here, soonest first. Each
+// rings once as a system notification; the tag keeps tabs from doubling it.
+function dueReminders() {
+  const now = Date.now();
+  return withStores(["reminders", "acks"], "readwrite", ({ reminders, acks }) =>
+    Promise.all([requestValue(reminders.getAll()), requestValue(acks.getAll())])
+      .then(([cached, queued]) => {
+        const acked = new Set(queued.map((ack) => ack.id));
+        const due = cached
+          .filter((rem) => !acked.has(rem.id) && Date.parse(rem.time) <= now)
+          .sort((a, b) => Date.parse(a.time) - Date.parse(b.time));
+        for (const rem of due) {
+          if (!rem.notified) reminders.put({ ...rem, notified: true });
+        }
+        return due;
+      })
+  ).then((due) => Promise.all(
+    due.filter((rem) => !rem.notified).map((rem) =>
+      self.registration.showNotification("Medication Reminder", {
+        body: `Time to take ${rem.medicine}`,
+        tag: `reminders-${rem.id}`,
+        data: { reminders: [rem.id], url: "/reminders/" },
+        vibrate: [200, 100, 200],
+      })
+    )
+  ).then(() => due));
+}
+
+// ================================
+// ACKNOWLEDGEMENT QUEUE
+// ================================
+// Acks are kept until the server has them; Background Sync retries them
+// when the connection returns, even after every tab is closed.
+function queueAck(ack) {
+  return withStores(["acks"], "readwrite", ({ acks }) => { acks.add(ack); })
+    .then(() => (self.registration.sync
+      ? self.registration.sync.register(ACK_SYNC_TAG).catch(() => flushAcks())
+      : flushAcks()));
+}
+
+function flushAcks() {
+  return Promise.all([
+    withStores(["acks"], "readonly", ({ acks }) => requestValue(acks.getAll())),
+    getMeta("csrfToken"),
+  ]).then(([queued, token]) => {
+    if (!queued.length) return;
+
+    return fetch("/api/ack-reminders/", {
+      method: "POST",
+      headers: { "Content-Type": "application/json", "X-CSRFToken": token || "" },
+      body: JSON.stringify({ acks: queued.map(({ id, status, at }) => ({ id, status, at })) }),
+    }).then((res) => {
+      // Rejecting leaves the acks queued and tells Background Sync to retry.
+      if (!res.ok) throw new Error(`ack failed: ${res.status}`);
+      return withStores(["acks", "reminders"], "readwrite", ({ acks, reminders }) => {
+        for (const ack of queued) {
+          acks.delete(ack.seq);
+          reminders.delete(ack.id);
+        }
+      });
+    });
+  });
+}
+
+self.addEventListener("sync", function (event) {
+  if (event.tag === ACK_SYNC_TAG) {
+    event.waitUntil(flushAcks().then(() => syncSchedule(true)));
+  }
+});
+
+// Where the browser allows it, keep the schedule fresh and ring due doses
+// with no tab open.
+self.addEventListener("periodicsync", function (event) {
+  if (event.tag === SCHEDULE_SYNC_TAG) {
+    event.waitUntil(syncSchedule(true).then(dueReminders));
+  }
+});
+
+// ================================
+// MESSAGES FROM THE PAGE
+// ================================
+// "check" answers on the given port with the due reminders from the cache,
+// syncing first only when the copy is older than SYNC_INTERVAL_MS.
 self.addEventListener("message", function (event) {
-  if (event.data.action === "notify") {
-    self.registration.showNotification(event.data.title, {
-      body: event.data.body,
+  const data = event.data || {};
+  const reply = (value) => {
+    if (event.ports[0]) event.ports[0].postMessage(value);
+  };
+  const saveToken = data.csrfToken ? setMeta("csrfToken", data.csrfToken) : Promise.resolve();
+
+  if (data.action === "notify") {
+    self.registration.showNotification(data.title, {
+      body: data.body,
       // icon: "/static/icon.png", // optional
       vibrate: [200, 100, 200],
     });
+  } else if (data.action === "check") {
+    event.waitUntil(saveToken
+      .then(() => syncSchedule(data.force))
+      .then(dueReminders)
+      .then((due) => reply({ due }))
+      .catch((err) => reply({ due: [], error: String(err) })));
+  } else if (data.action === "ack") {
+    event.waitUntil(saveToken
+      .then(() => queueAck({ id: data.id, status: data.status, at: data.at }))
+      .then(() => reply({ queued: true }))
+      .catch((err) => reply({ queued: false, error: String(err) })));
   }
 });
+
+// Reminders pushed by the server (core.notifications.WebPushChannel), which
+// arrive even when no MedCia tab is open.
+self.addEventListener("push", function (event) {
+  let data = {};
+  try {
+    data = event.data ? event.data.json() : {};
+  } catch (err) {
+    data = { body: event.data.text() };
+  }
+
+  event.waitUntil(
+    self.registration.showNotification(data.title || "Medication Reminder", {
+      body: data.body,
+      // One notification per set of reminders, however many times it is pushed.
+      tag: data.reminders ? `reminders-${data.reminders.join("-")}` : undefined,
+      data: { reminders: data.reminders, url: "/reminders/" },
+      vibrate: [200, 100, 200],
+    }).then(() => syncSchedule(true))
+  );
+});
+
+self.addEventListener("notificationclick", function (event) {
+  event.notification.close();
+  const url = (event.notification.data && event.notification.data.url) || "/";
+
+  event.waitUntil(
+    self.clients.matchAll({ type: "window", includeUncontrolled: true }).then((windows) => {
+      for (const client of windows) {
+        if (new URL(client.url).pathname === url && "focus" in client) return client.focus();
+      }
+      return self.clients.openWindow(url);
+    })
+  );
+});
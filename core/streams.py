@@ -0,0 +1,86 @@
+# core/streams.py
+"""
+Change notifications for the reminder streams (views.api_reminder_stream).
+
+Every open stream in a process shares one check loop: each pass reads the
+reminders_version of all subscribed users in a single query and wakes the
+streams of the users whose version moved, which then re-read their next
+reminder. Between changes a stream only sleeps, so the database load
+depends on the check interval, not on how many tabs are open.
+"""
+import asyncio
+import logging
+from collections import defaultdict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from .models import UserProfile
+
+logger = logging.getLogger(__name__)
+
+
+def recheck_interval():
+    """Seconds between checks for changes, and between stream keep-alives."""
+    return getattr(settings, "REMINDER_STREAM_RECHECK", 5)
+
+
+def _read_versions(user_ids):
+    return dict(
+        UserProfile.objects.filter(user_id__in=user_ids).values_list("user_id", "reminders_version")
+    )
+
+
+class ReminderStreamHub:
+    def __init__(self):
+        self._loop = None
+        self._task = None
+        # user_id -> asyncio.Events of that user's open streams.
+        self._subscribers = defaultdict(set)
+        # Last version seen per subscribed user.
+        self._versions = {}
+
+    def subscribe(self, user_id):
+        """Return an asyncio.Event that is set whenever the user's reminders change."""
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            # Events belong to the loop they were created on; start over.
+            self._loop, self._task = loop, None
+            self._subscribers.clear()
+            self._versions.clear()
+
+        changed = asyncio.Event()
+        self._subscribers[user_id].add(changed)
+        if self._task is None or self._task.done():
+            self._task = loop.create_task(self._run())
+        return changed
+
+    def unsubscribe(self, user_id, changed):
+        events = self._subscribers.get(user_id)
+        if events is None:
+            return
+        events.discard(changed)
+        if not events:
+            del self._subscribers[user_id]
+            self._versions.pop(user_id, None)
+
+    async def _run(self):
+        while self._subscribers:
+            await asyncio.sleep(recheck_interval())
+            if not self._subscribers:
+                break
+            try:
+                versions = await sync_to_async(_read_versions)(list(self._subscribers))
+            except Exception:
+                logger.exception("Checking reminder streams for changes failed")
+                continue
+            # A user seen for the first time is woken too, in case they
+            # changed between their stream's first read and this one.
+            for user_id, version in versions.items():
+                if self._versions.get(user_id) != version:
+                    self._versions[user_id] = version
+                    for changed in self._subscribers.get(user_id, ()):
+                        changed.set()
+
+
+hub = ReminderStreamHub()
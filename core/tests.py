@@ -1,3 +1,1948 @@
-from django.test import TestCase
+import asyncio
+import base64
+import json
+import os
+import shutil
+import smtplib
+import tempfile
+import threading
+import time
+from datetime import date, datetime, timedelta
+from importlib import import_module
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from django.apps import apps as django_apps
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.mail.backends import locmem
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, connections
+from django.db.models import Sum
+from django.db.utils import ConnectionHandler
+from django.test import Client, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from .adherence import adherence_summary
+from .archive import archivable, archive_delivered
+from .benchmarks import compare, run_benchmarks, seed
+from .bulk import import_medicines, import_reminders
+from .dashboard import cache_stats, get_dashboard_summary
+from .delivery import DeliveryStats, ReminderDispatcher
+from .forms import MedicineScheduleForm, ReminderForm
+from .metrics import Histogram, registry as metrics_registry
+from .notifications import (
+    DEFERRED,
+    FAILED,
+    WEBPUSH_AVAILABLE,
+    SENT,
+    EmailChannel,
+    LocmemChannel,
+    Message,
+    TokenBucket,
+    WebhookChannel,
+    WebPushChannel,
+    get_channels,
+)
+from .models import (
+    ArchivedReminder,
+    DailyAdherence,
+    DoseEvent,
+    Medicine,
+    MedicineSchedule,
+    PushSubscription,
+    Reminder,
+    Tombstone,
+    UserProfile,
+)
+from .pagination import keyset_page
+from .scheduler import ReminderScheduler
+from .schedules import course_end, generate_course, iter_occurrences, materialise_window
+from .streams import ReminderStreamHub
+
+
+def make_dispatcher(sms=None, **kwargs):
+    """A dispatcher sending email to the test outbox and SMS to a locmem channel."""
+    return ReminderDispatcher(channels=[EmailChannel(), sms or LocmemChannel("sms")], **kwargs)
+
+
+def make_medicine(name="Paracetamol", owner=None):
+    today = date.today()
+    return Medicine.objects.create(
+        name=name, dosage="500 mg", frequency="Twice a day", owner=owner,
+        start_date=today, end_date=today + timedelta(days=30),
+    )
+
+
+class SendRemindersTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("asha", email="asha@example.com", password="x")
+        self.user.userprofile.phone = "+911234567890"
+        self.user.userprofile.save()
+        self.medicine = make_medicine()
+        self.past = timezone.now() - timedelta(minutes=5)
+
+    def make_reminders(self, count, when=None, spacing=timedelta(minutes=10)):
+        # Spaced beyond the digest window unless asked otherwise.
+        return Reminder.objects.bulk_create([
+            Reminder(medicine=self.medicine, user=self.user, reminder_time=(when or self.past) - spacing * i)
+            for i in range(count)
+        ])
+
+    def test_delivers_in_batches_over_email_and_sms(self):
+        self.make_reminders(5)
+        self.make_reminders(1, when=timezone.now() + timedelta(hours=1))
+        sms = LocmemChannel("sms")
+
+        stats = make_dispatcher(sms, batch_size=2, workers=4).run()
+
+        self.assertEqual(stats.delivered, 5)
+        self.assertEqual(stats.batches, 3)
+        self.assertEqual(len(mail.outbox), 5)
+        self.assertEqual(len(sms.sent), 5)
+        self.assertEqual(Reminder.objects.filter(delivered=False).count(), 1)
+        self.assertGreater(stats.throughput, 0)
+
+    def test_failed_sends_are_counted_and_do_not_stop_the_run(self):
+        self.make_reminders(3)
+        sms = LocmemChannel("sms", fail_for={"+911234567890"})
+
+        stats = make_dispatcher(sms).run()
+
+        self.assertEqual(stats.delivered, 3)
+        self.assertEqual(stats.emails_sent, 3)
+        self.assertEqual(stats.failures, 3)
+
+    def test_doses_due_together_share_one_message(self):
+        self.medicine.name = "Metformin"
+        self.medicine.save()
+        self.make_reminders(1, when=timezone.now() - timedelta(minutes=1))
+        for name in ("Aspirin", "Atorvastatin"):
+            self.medicine = make_medicine(name)
+            self.make_reminders(1, when=timezone.now() - timedelta(minutes=2))
+        # Due in two minutes: pulled forward into the same digest.
+        self.make_reminders(1, when=timezone.now() + timedelta(minutes=2))
+        # Outside the window: sent on its own later.
+        self.make_reminders(1, when=timezone.now() + timedelta(minutes=30))
+        sms = LocmemChannel("sms")
+
+        stats = make_dispatcher(sms).run()
+
+        self.assertEqual(stats.delivered, 4)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].subject, "MedCia reminder: 4 doses due")
+        for name in ("Metformin", "Aspirin", "Atorvastatin"):
+            self.assertIn(name, mail.outbox[0].body)
+        self.assertEqual(len(sms.sent), 1)
+        self.assertEqual(len(sms.sent[0].keys), 4)
+        # Acknowledgement and adherence still work per reminder.
+        self.assertEqual(DoseEvent.objects.filter(status=DoseEvent.NOTIFIED).count(), 4)
+        self.assertEqual(Reminder.objects.filter(delivered=False).count(), 1)
+
+    @override_settings(DIGEST_WINDOW_MINUTES=0)
+    def test_digest_without_lookahead(self):
+        self.make_reminders(3, spacing=timedelta(0))
+        self.make_reminders(1, when=timezone.now() + timedelta(minutes=3))
+
+        stats = make_dispatcher().run()
+
+        self.assertEqual(stats.delivered, 3)
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_command_reports_throughput(self):
+        self.make_reminders(3)
+        out = StringIO()
+
+        call_command("send_reminders", "--batch-size", "2", "--workers", "2", stdout=out)
+
+        self.assertIn("Sent 3 reminders in 2 batches", out.getvalue())
+        self.assertIn("reminders/sec", out.getvalue())
+
+    def test_command_keeps_recurring_schedules_stored_ahead(self):
+        schedule = MedicineSchedule.objects.create(
+            medicine=self.medicine, user=self.user, times_of_day=["08:00", "20:00"],
+        )
+        # As if the window stored when the schedule was saved had run out.
+        Reminder.objects.filter(schedule=schedule).delete()
+
+        call_command("send_reminders", stdout=StringIO())
+
+        self.assertEqual(Reminder.objects.filter(schedule=schedule, delivered=False).count(), 2)
+
+    def test_command_without_due_reminders(self):
+        out = StringIO()
+        call_command("send_reminders", stdout=out)
+        self.assertIn("No due reminders.", out.getvalue())
+
+
+class DispatcherCrash(BaseException):
+    pass
+
+
+class CountingEmailBackend(locmem.EmailBackend):
+    opened = 0
+
+    def open(self):
+        CountingEmailBackend.opened += 1
+        return super().open()
+
+
+class UnreachableEmailBackend(locmem.EmailBackend):
+    def open(self):
+        raise ConnectionRefusedError("connection refused")
+
+
+class ThrottledEmailBackend(locmem.EmailBackend):
+    def open(self):
+        raise smtplib.SMTPConnectError(421, b"too many connections")
+
+
+class WebhookHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    connections = 0
+    received = []
+
+    def setup(self):
+        super().setup()
+        WebhookHandler.connections += 1
+
+    def do_POST(self):
+        WebhookHandler.received.append(json.loads(self.rfile.read(int(self.headers["Content-Length"]))))
+        self.send_response(204)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class NotificationChannelTests(TestCase):
+    def messages(self, count, recipient="a@example.com"):
+        return [Message((i,), recipient, "Subject", "Body") for i in range(count)]
+
+    def test_email_batch_shares_one_connection(self):
+        CountingEmailBackend.opened = 0
+        channel = EmailChannel(backend="core.tests.CountingEmailBackend")
+
+        results = channel.send_many(self.messages(25))
+
+        self.assertEqual(CountingEmailBackend.opened, 1)
+        self.assertEqual(len(mail.outbox), 25)
+        self.assertTrue(all(outcome == SENT for _, outcome in results))
+
+    def test_webhook_reuses_its_connection(self):
+        WebhookHandler.connections, WebhookHandler.received = 0, []
+        server = ThreadingHTTPServer(("127.0.0.1", 0), WebhookHandler)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+
+        channel = WebhookChannel(url=f"http://127.0.0.1:{server.server_port}/hook")
+        results = channel.send_many(self.messages(5, recipient=7))
+
+        self.assertEqual([outcome for _, outcome in results], [SENT] * 5)
+        self.assertEqual(WebhookHandler.connections, 1)
+        self.assertEqual(WebhookHandler.received[0]["user"], 7)
+
+    @override_settings(NOTIFICATION_CHANNELS={
+        "email": {"BACKEND": "core.notifications.EmailChannel"},
+        "pager": {"BACKEND": "core.notifications.LocmemChannel"},
+        "sms": {"BACKEND": "core.notifications.TwilioSMSChannel"},
+    })
+    def test_channels_come_from_settings(self):
+        # Twilio is left out without credentials.
+        self.assertEqual([c.name for c in get_channels()], ["email", "pager"])
+
+    def test_unreachable_provider_fails_the_chunk(self):
+        self.assertEqual(
+            EmailChannel(backend="core.tests.UnreachableEmailBackend").send_many(self.messages(2)),
+            [((0,), FAILED), ((1,), FAILED)],
+        )
+        self.assertEqual(
+            EmailChannel(backend="core.tests.ThrottledEmailBackend").send_many(self.messages(1)),
+            [((0,), DEFERRED)],
+        )
+
+    def test_dispatcher_survives_a_provider_outage(self):
+        user = User.objects.create_user("elan", email="elan@example.com", password="x")
+        user.userprofile.phone = "+915553334444"
+        user.userprofile.save()
+        reminder = Reminder.objects.create(
+            medicine=make_medicine(), user=user, reminder_time=timezone.now() - timedelta(minutes=1),
+        )
+        sms = LocmemChannel("sms")
+        email = EmailChannel(backend="core.tests.UnreachableEmailBackend")
+
+        stats = ReminderDispatcher(channels=[email, sms]).run()
+
+        # SMS got through, so the reminder is settled and not sent again.
+        self.assertEqual((stats.delivered, stats.failures), (1, 1))
+        reminder.refresh_from_db()
+        self.assertTrue(reminder.delivered)
+        self.assertEqual(reminder.claimed_by, "")
+
+        retried = Reminder.objects.create(
+            medicine=reminder.medicine, user=user, reminder_time=timezone.now() - timedelta(minutes=1),
+        )
+        stats = ReminderDispatcher(channels=[email]).run()
+        self.assertEqual(stats.retried, 1)
+        retried.refresh_from_db()
+        self.assertFalse(retried.delivered)
+
+    def test_dispatcher_opens_a_connection_per_chunk(self):
+        user = User.objects.create_user("dev", email="dev@example.com", password="x")
+        user.userprofile.phone = "+915551112222"
+        user.userprofile.save()
+        medicine = make_medicine()
+        # Far enough apart that each gets its own message.
+        Reminder.objects.bulk_create([
+            Reminder(medicine=medicine, user=user, reminder_time=timezone.now() - timedelta(minutes=10 * i))
+            for i in range(40)
+        ])
+        sms = LocmemChannel("sms")
+
+        stats = make_dispatcher(sms, workers=4).run()
+
+        self.assertEqual(stats.delivered, 40)
+        self.assertEqual(len(sms.sent), 40)
+        self.assertEqual(sms.connections, 4)
+
+
+class RateLimitTests(TestCase):
+    def setUp(self):
+        metrics_registry.reset()
+        self.user = User.objects.create_user("isha", email="isha@example.com", password="x")
+        self.user.userprofile.phone = "+915553334444"
+        self.user.userprofile.save()
+        self.medicine = make_medicine()
+
+    def make_reminders(self, count):
+        # Spaced beyond the digest window so each is its own message.
+        now = timezone.now()
+        return Reminder.objects.bulk_create([
+            Reminder(medicine=self.medicine, user=self.user, reminder_time=now - timedelta(minutes=10 * (i + 1)))
+            for i in range(count)
+        ])
+
+    def test_token_bucket(self):
+        bucket = TokenBucket(rate=50, burst=2)
+        self.assertTrue(bucket.acquire(0))
+        self.assertTrue(bucket.acquire(0))
+        # Empty: a token is 20 ms away.
+        self.assertFalse(bucket.acquire(0))
+        started = time.monotonic()
+        self.assertTrue(bucket.acquire(1))
+        self.assertGreater(time.monotonic() - started, 0.01)
+
+    @override_settings(DISPATCH_RATE_LIMIT_MAX_WAIT=0)
+    def test_refused_send_keeps_the_other_buckets_tokens(self):
+        sms = LocmemChannel("sms")
+        own, provider = TokenBucket(rate=0.001, burst=1), TokenBucket(rate=0.001, burst=1)
+        sms.limiters.extend([own, provider])
+        provider.acquire(0)
+
+        self.assertFalse(sms.acquire())
+        # The provider refused, so the channel's own token is still there.
+        self.assertTrue(own.acquire(0))
+
+    @override_settings(DISPATCH_RATE_LIMIT_MAX_WAIT=0)
+    def test_over_the_limit_is_deferred_not_dropped(self):
+        self.make_reminders(5)
+        sms = LocmemChannel("sms")
+        sms.limiters.append(TokenBucket(rate=0.001, burst=2))
+
+        stats = make_dispatcher(sms, workers=1).run()
+
+        self.assertEqual(stats.delivered, 2)
+        self.assertEqual(stats.deferred, 3)
+        self.assertEqual(stats.failures, 0)
+        self.assertEqual(len(sms.sent), 2)
+        self.assertEqual(len(mail.outbox), 5)
+        deferred = Reminder.objects.filter(delivered=False)
+        self.assertEqual(deferred.count(), 3)
+        # Email already went out; deferral does not use up an attempt.
+        self.assertEqual([(r.sent_channels, r.attempts) for r in deferred], [(["email"], 0)] * 3)
+
+        sms.limiters.clear()
+        stats = make_dispatcher(sms).run(timezone.now() + timedelta(minutes=1))
+
+        self.assertEqual(stats.delivered, 3)
+        self.assertEqual(len(sms.sent), 5)
+        self.assertEqual(len(mail.outbox), 5)
+
+    def test_provider_throttling_is_deferred(self):
+        self.make_reminders(2)
+
+        stats = make_dispatcher(LocmemChannel("sms", throttle_for={"+915553334444"})).run()
+
+        self.assertEqual(stats.deferred, 2)
+        self.assertFalse(Reminder.objects.filter(delivered=True).exists())
+
+    @override_settings(
+        NOTIFICATION_CHANNELS={
+            "sms": {"BACKEND": "core.notifications.LocmemChannel", "PROVIDER": "twilio"},
+            "whatsapp": {"BACKEND": "core.notifications.LocmemChannel", "PROVIDER": "twilio",
+                         "RATE_LIMIT": {"rate": 5}},
+        },
+        NOTIFICATION_PROVIDER_LIMITS={"twilio": {"rate": 10, "burst": 20}},
+    )
+    def test_channels_share_their_provider_bucket(self):
+        sms, whatsapp = get_channels()
+        self.assertEqual(len(sms.limiters), 1)
+        self.assertEqual(len(whatsapp.limiters), 2)
+        self.assertIs(sms.limiters[0], whatsapp.limiters[1])
+
+    def test_queue_depth_and_lag_metrics(self):
+        self.make_reminders(3)
+
+        make_dispatcher().run()
+
+        snapshot = metrics_registry.snapshot()["dispatch"]
+        self.assertEqual(snapshot["queue_depth"], 0)
+        self.assertEqual(snapshot["send_lag_seconds"]["count"], 3)
+        self.assertEqual(snapshot["send_lag_seconds"]["p50"], 1800)
+        self.assertIn('medcia_queue_depth{view="dispatch"} 0', metrics_registry.prometheus())
+
+
+class PushStandIn(BaseHTTPRequestHandler):
+    """Local stand-in for a browser push service."""
+    protocol_version = "HTTP/1.1"
+    received = []
+    gone = set()
+
+    def do_POST(self):
+        PushStandIn.received.append((self.path, self.headers, self.rfile.read(int(self.headers["Content-Length"]))))
+        self.send_response(410 if self.path in PushStandIn.gone else 201)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class WebPushTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("gita", email="", password="x")
+        self.client.force_login(self.user)
+
+    def subscribe(self, endpoint, user=None):
+        return PushSubscription.objects.create(
+            user=user or self.user, endpoint=endpoint, p256dh="client-key", auth="client-secret",
+        )
+
+    def test_subscription_api(self):
+        subscription = {"endpoint": "https://push.example.com/send/abc", "keys": {"p256dh": "key", "auth": "secret"}}
+
+        with override_settings(WEBPUSH_VAPID_PUBLIC_KEY="BPublic"):
+            self.assertEqual(self.client.get("/api/push-subscriptions/").json(), {"public_key": "BPublic"})
+
+        response = self.client.post("/api/push-subscriptions/", subscription, content_type="application/json")
+        self.assertEqual(response.status_code, 201)
+        subscription["keys"]["auth"] = "rotated"
+        response = self.client.post("/api/push-subscriptions/", subscription, content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(PushSubscription.objects.get().auth, "rotated")
+
+        bad = self.client.post("/api/push-subscriptions/", {"endpoint": "nope"}, content_type="application/json")
+        self.assertEqual(bad.status_code, 400)
+
+        response = self.client.delete(
+            "/api/push-subscriptions/", {"endpoint": subscription["endpoint"]}, content_type="application/json"
+        )
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(PushSubscription.objects.exists())
+
+    def test_dispatch_fans_out_to_every_device(self):
+        self.subscribe("https://push.example.com/phone")
+        self.subscribe("https://push.example.com/laptop")
+        other = User.objects.create_user("hari", password="x")
+        self.subscribe("https://push.example.com/other", user=other)
+        medicine = make_medicine()
+        past = timezone.now() - timedelta(minutes=1)
+        Reminder.objects.bulk_create([
+            Reminder(medicine=medicine, user=user, reminder_time=past) for user in (self.user, self.user, other)
+        ])
+        push = LocmemChannel("push", recipient_from=WebPushChannel)
+
+        stats = ReminderDispatcher(channels=[push], workers=4).run()
+
+        self.assertEqual(stats.delivered, 3)
+        # gita's two doses share a message on each of her two devices.
+        self.assertEqual(stats.sent["push"], 3)
+        self.assertEqual(
+            sorted(m.recipient.endpoint for m in push.sent if m.recipient.user_id == other.pk),
+            ["https://push.example.com/other"],
+        )
+
+    @skipUnless(WEBPUSH_AVAILABLE, "pywebpush is not installed")
+    def test_sends_encrypted_payload_to_push_service(self):
+        from cryptography.hazmat.primitives import serialization
+        from cryptography.hazmat.primitives.asymmetric import ec
+        from py_vapid import Vapid
+
+        PushStandIn.received, PushStandIn.gone = [], {"/gone"}
+        server = ThreadingHTTPServer(("127.0.0.1", 0), PushStandIn)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+
+        vapid = Vapid()
+        vapid.generate_keys()
+        browser_key = ec.generate_private_key(ec.SECP256R1()).public_key().public_bytes(
+            serialization.Encoding.X962, serialization.PublicFormat.UncompressedPoint
+        )
+        base = f"http://127.0.0.1:{server.server_port}"
+        for path in ("/device", "/gone"):
+            PushSubscription.objects.create(
+                user=self.user, endpoint=base + path,
+                p256dh=base64.urlsafe_b64encode(browser_key).decode().rstrip("="),
+                auth=base64.urlsafe_b64encode(os.urandom(16)).decode().rstrip("="),
+            )
+        Reminder.objects.create(medicine=make_medicine(), user=self.user,
+                                reminder_time=timezone.now() - timedelta(minutes=1))
+        private_key = vapid.private_pem().decode()
+        channel = WebPushChannel(private_key=private_key, subject="mailto:test@example.com")
+
+        stats = ReminderDispatcher(channels=[channel]).run()
+
+        self.assertEqual(stats.delivered, 1)
+        self.assertEqual(len(PushStandIn.received), 2)
+        path, headers, body = PushStandIn.received[0]
+        self.assertIn("vapid", headers["Authorization"])
+        self.assertNotIn(b"Paracetamol", body)
+        # The push service said the second device is gone.
+        self.assertEqual(list(PushSubscription.objects.values_list("endpoint", flat=True)), [base + "/device"])
+
+
+class ReminderClaimTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("bina", email="", password="x")
+        self.user.userprofile.phone = "+915550000000"
+        self.user.userprofile.save()
+        self.medicine = make_medicine()
+        self.past = timezone.now() - timedelta(minutes=5)
+        # Spread out so each reminder is sent, and settled, on its own.
+        self.reminders = Reminder.objects.bulk_create([
+            Reminder(medicine=self.medicine, user=self.user, reminder_time=self.past - timedelta(minutes=10 * i))
+            for i in range(4)
+        ])
+
+    def test_workers_split_the_due_set(self):
+        first = make_dispatcher(batch_size=2, worker_id="a")
+        candidates, claimed = first.claim_batch(timezone.now())
+        self.assertEqual(len(claimed), 2)
+
+        sms = LocmemChannel("sms")
+        stats = make_dispatcher(sms, worker_id="b").run()
+
+        # The second worker leaves the first one's lease alone.
+        self.assertEqual(stats.delivered, 2)
+        self.assertEqual(Reminder.objects.filter(claimed_by="a", delivered=False).count(), 2)
+
+        # Once the lease runs out the rows are up for grabs again.
+        later = timezone.now() + timedelta(minutes=10)
+        stats = make_dispatcher(sms, worker_id="b").run(later)
+        self.assertEqual(stats.delivered, 2)
+        self.assertEqual(len(sms.sent), 4)
+        self.assertEqual(DoseEvent.objects.count(), 4)
+
+    def test_failed_sends_back_off_then_give_up(self):
+        sms = LocmemChannel("sms", fail_for={"+915550000000"})
+        dispatcher = make_dispatcher(sms, worker_id="a")
+
+        with override_settings(DISPATCH_MAX_ATTEMPTS=2, DISPATCH_RETRY_BASE_SECONDS=60):
+            stats = dispatcher.run()
+            self.assertEqual(stats.retried, 4)
+            reminder = Reminder.objects.get(pk=self.reminders[0].pk)
+            self.assertFalse(reminder.delivered)
+            self.assertEqual(reminder.attempts, 1)
+            self.assertEqual(reminder.claimed_by, "")
+            self.assertGreater(reminder.claim_expires, timezone.now() + timedelta(seconds=50))
+
+            # Not retried before the backoff has passed.
+            self.assertEqual(dispatcher.run().batches, 0)
+
+            stats = dispatcher.run(timezone.now() + timedelta(minutes=2))
+            self.assertEqual(stats.abandoned, 4)
+            self.assertFalse(Reminder.objects.filter(delivered=False).exists())
+            self.assertFalse(DoseEvent.objects.exists())
+
+        # Still counted as due, once, when acknowledged afterwards.
+        self.client.force_login(self.user)
+        self.client.get(f"/api/mark-delivered/{self.reminders[0].pk}/")
+        totals = DailyAdherence.objects.aggregate(due=Sum("due"), taken=Sum("taken"))
+        self.assertEqual(totals, {"due": 4, "taken": 1})
+
+    def test_ack_while_claimed_counts_the_dose_once(self):
+        dispatcher = make_dispatcher(worker_id="a")
+        _, batch = dispatcher.claim_batch(timezone.now())
+        reminder = batch[0]
+        self.client.force_login(self.user)
+        self.client.get(f"/api/mark-delivered/{reminder.pk}/")
+
+        stats = DeliveryStats()
+        dispatcher.settle([(reminder, [("sms", SENT)])], stats)
+
+        self.assertEqual(stats.delivered, 0)
+        totals = DailyAdherence.objects.aggregate(due=Sum("due"), taken=Sum("taken"))
+        self.assertEqual(totals, {"due": 1, "taken": 1})
+
+    def test_crash_keeps_messages_already_committed(self):
+        class CrashingChannel(LocmemChannel):
+            def send(self, connection, message):
+                if len(self.sent) == 2:
+                    raise DispatcherCrash
+                super().send(connection, message)
+
+        dispatcher = make_dispatcher(CrashingChannel("sms"), workers=1, chunk_size=1, worker_id="a")
+        with self.assertRaises(DispatcherCrash):
+            dispatcher.run()
+
+        self.assertEqual(Reminder.objects.filter(delivered=True).count(), 2)
+        sms = LocmemChannel("sms")
+        stats = make_dispatcher(sms, worker_id="b").run(
+            timezone.now() + timedelta(minutes=10)
+        )
+        self.assertEqual(stats.delivered, 2)
+        self.assertEqual(len(sms.sent), 2)
+
+
+class ReminderSchedulerTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("ravi", email="ravi@example.com", password="x")
+        self.medicine = make_medicine()
+        self.now = timezone.now()
+        self.scheduler = ReminderScheduler(ReminderDispatcher(workers=1))
+
+    def add(self, minutes):
+        return Reminder.objects.create(
+            medicine=self.medicine, user=self.user,
+            reminder_time=self.now + timedelta(minutes=minutes),
+        )
+
+    def test_sleeps_until_earliest_reminder(self):
+        self.add(10)
+        self.add(3)
+        self.scheduler.load()
+
+        self.assertAlmostEqual(self.scheduler.seconds_until_next(self.now), 180, delta=1)
+
+    def test_dispatches_only_due_items(self):
+        due = self.add(-1)
+        later = self.add(30)
+        self.scheduler.load()
+
+        stats = self.scheduler.run_pending(self.now)
+
+        self.assertEqual(stats.delivered, 1)
+        due.refresh_from_db()
+        later.refresh_from_db()
+        self.assertTrue(due.delivered)
+        self.assertFalse(later.delivered)
+        self.assertIsNone(self.scheduler.run_pending(self.now))
+
+    def test_refresh_picks_up_new_and_edited_reminders(self):
+        edited = self.add(60)
+        self.scheduler.load()
+
+        edited.reminder_time = self.now - timedelta(minutes=1)
+        edited.save()
+        self.add(-2)
+        self.scheduler.refresh()
+
+        self.assertEqual(self.scheduler.run_pending(self.now).delivered, 2)
+
+    def test_refresh_catches_saves_that_commit_out_of_order(self):
+        self.scheduler.load()
+        later = self.add(-2)
+        self.scheduler.refresh()
+        # Stamped before ``later`` but committed after the poll saw it.
+        earlier = self.add(-1)
+        Reminder.objects.filter(pk=earlier.pk).update(updated_at=later.updated_at - timedelta(seconds=1))
+
+        self.scheduler.refresh()
+        self.scheduler.refresh()
+
+        self.assertEqual(sorted(pk for _, pk in self.scheduler.heap), sorted([later.pk, earlier.pk]))
+        self.assertEqual(self.scheduler.run_pending(self.now).delivered, 2)
+
+    def test_leased_reminder_is_retried_when_the_lease_runs_out(self):
+        reminder = self.add(-1)
+        self.scheduler.load()
+        # Another worker claims it and dies without settling.
+        ReminderDispatcher(workers=1, worker_id="other").claim_batch(self.now)
+
+        self.assertEqual(self.scheduler.run_pending(self.now).delivered, 0)
+        expires = Reminder.objects.get(pk=reminder.pk).claim_expires
+        self.assertAlmostEqual(self.scheduler.seconds_until_next(self.now), (expires - self.now).total_seconds(), delta=1)
+
+        self.assertEqual(self.scheduler.run_pending(expires).delivered, 1)
+
+    def test_signal_pushes_into_active_scheduler(self):
+        self.scheduler.load()
+        with mock.patch("core.signals.get_active_scheduler", return_value=self.scheduler):
+            self.add(-1)
+
+        self.assertEqual(self.scheduler.run_pending(self.now).delivered, 1)
+
+
+class ReminderIndexTests(TestCase):
+    """Guard the hot reminder queries against losing their indexes."""
+
+    def query_plan(self, qs):
+        sql, params = qs.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute("EXPLAIN QUERY PLAN " + sql, params)
+            return " ".join(str(row[-1]) for row in cursor.fetchall())
+
+    def test_per_user_lists_use_partial_indexes(self):
+        user = User.objects.create_user("meera", password="x")
+        cases = (
+            (False, "reminder_time", "reminder_user_pending_idx"),
+            (True, "-reminder_time", "reminder_user_history_idx"),
+        )
+        for delivered, order, index in cases:
+            qs = Reminder.objects.filter(user=user, delivered=delivered).order_by(order)
+            plan = self.query_plan(qs)
+            self.assertIn(index, plan)
+            self.assertNotIn("TEMP B-TREE", plan)
+
+    def test_dispatcher_scan_uses_partial_index(self):
+        qs = Reminder.objects.filter(delivered=False, reminder_time__lte=timezone.now()).order_by("reminder_time")
+        plan = self.query_plan(qs)
+        self.assertIn("reminder_pending_time_idx", plan)
+        self.assertNotIn("TEMP B-TREE", plan)
+
+    def test_delta_sync_uses_change_seq_index(self):
+        user = User.objects.create_user("meera", password="x")
+        plan = self.query_plan(Reminder.objects.filter(user=user, change_seq__gt=3))
+        self.assertIn("reminder_user_seq_idx", plan)
+
+
+class QueryCountTests(TestCase):
+    """Each page costs the same number of queries however many rows it shows."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user("nila", password="x")
+        self.client.force_login(self.user)
+
+    def seed(self, count):
+        now = timezone.now()
+        for i in range(count):
+            medicine = make_medicine(f"Medicine {i}", owner=self.user)
+            Reminder.objects.create(medicine=medicine, user=self.user, reminder_time=now + timedelta(hours=i))
+            Reminder.objects.create(medicine=medicine, user=self.user, reminder_time=now - timedelta(hours=i), delivered=True)
+
+    def assertQueriesConstant(self, url, num):
+        for count in (1, 10):
+            self.seed(count)
+            with self.assertNumQueries(num):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+
+    def test_reminders(self):
+        # History is read from both the live and the archive table.
+        self.assertQueriesConstant("/reminders/", 6)
+
+    def test_api_get_reminders(self):
+        self.assertQueriesConstant("/api/get-reminders/", 4)
+
+    def test_dashboard(self):
+        self.assertQueriesConstant("/", 5)
+
+    def test_medicines_list(self):
+        self.assertQueriesConstant("/medicines/", 3)
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("kiran", password="x")
+        self.client.force_login(self.user)
+        self.medicine = make_medicine()
+        Reminder.objects.create(medicine=self.medicine, user=self.user, reminder_time=timezone.now())
+
+    def test_unchanged_list_returns_304_without_reading_reminders(self):
+        etag = self.client.get("/api/get-reminders/")["ETag"]
+
+        # Session, user and the version lookup; the reminder rows are not read.
+        with self.assertNumQueries(3):
+            response = self.client.get("/api/get-reminders/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_etag_changes_when_reminders_change(self):
+        etag = self.client.get("/api/get-reminders/")["ETag"]
+
+        reminder = Reminder.objects.create(medicine=self.medicine, user=self.user, reminder_time=timezone.now())
+        response = self.client.get("/api/get-reminders/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), 2)
+
+        etag = response["ETag"]
+        ReminderDispatcher(workers=1).mark_delivered([reminder.pk], {self.user.pk})
+        response = self.client.get("/api/get-reminders/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), 1)
+
+    def test_renaming_medicine_changes_etag(self):
+        etag = self.client.get("/api/get-reminders/")["ETag"]
+
+        self.medicine.name = "Ibuprofen"
+        self.medicine.save()
+
+        response = self.client.get("/api/get-reminders/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.json()[0]["medicine"], "Ibuprofen")
+
+
+class ReminderChangesTests(TestCase):
+    """The service worker's delta sync of the pending list."""
+
+    def setUp(self):
+        self.user = User.objects.create_user("meera", password="x")
+        self.client.force_login(self.user)
+        self.medicine = make_medicine(owner=self.user)
+        now = timezone.now()
+        self.first, self.second = (
+            Reminder.objects.create(medicine=self.medicine, user=self.user, reminder_time=now + timedelta(hours=i))
+            for i in (1, 2)
+        )
+
+    def sync(self, version=None):
+        url = "/api/reminder-changes/" + (f"?since={version}" if version else "")
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_first_sync_sends_everything(self):
+        data = self.sync()
+        self.assertTrue(data["full"])
+        self.assertEqual([r["id"] for r in data["reminders"]], [self.first.pk, self.second.pk])
+        self.assertEqual(data["reminders"][0]["medicine"], "Paracetamol")
+
+    def test_unchanged_schedule_reads_only_the_version(self):
+        version = self.sync()["version"]
+
+        # Session, user and the version lookup.
+        with self.assertNumQueries(3):
+            data = self.sync(version)
+        self.assertEqual(data, {"changed": False, "version": version})
+
+    def test_sends_only_what_changed(self):
+        version = self.sync()["version"]
+
+        self.second.reminder_time += timedelta(minutes=30)
+        self.second.save()
+        first_pk = self.first.pk
+        self.first.delete()
+        data = self.sync(version)
+        self.assertFalse(data["full"])
+        self.assertEqual([r["id"] for r in data["reminders"]], [self.second.pk])
+        self.assertEqual(data["removed"], [first_pk])
+
+        version = data["version"]
+        ReminderDispatcher(workers=1).mark_delivered([self.second.pk], {self.user.pk})
+        data = self.sync(version)
+        self.assertEqual((data["reminders"], data["removed"]), ([], [self.second.pk]))
+
+        version = data["version"]
+        self.first = Reminder.objects.create(medicine=self.medicine, user=self.user, reminder_time=timezone.now())
+        self.medicine.name = "Ibuprofen"
+        self.medicine.save()
+        data = self.sync(version)
+        self.assertEqual(data["reminders"][0]["medicine"], "Ibuprofen")
+
+    def test_version_of_another_user_gets_full_list(self):
+        version = self.sync()["version"]
+        other = User.objects.create_user("arun", password="x")
+        self.client.force_login(other)
+        data = self.sync(version)
+        self.assertTrue(data["full"])
+        self.assertEqual(data["reminders"], [])
+
+
+class DeltaSyncTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("devi", password="x")
+        self.client.force_login(self.user)
+        self.medicine = make_medicine(owner=self.user)
+        self.reminder = Reminder.objects.create(medicine=self.medicine, user=self.user, reminder_time=timezone.now())
+
+    def sync(self, cursor=None):
+        response = self.client.get("/api/sync/", {"cursor": cursor} if cursor is not None else {})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def rows(self, table):
+        return [dict(zip(table["fields"], row)) for row in table["rows"]]
+
+    def test_full_then_deltas(self):
+        data = self.sync()
+        self.assertTrue(data["full"])
+        self.assertEqual(self.rows(data["medicines"])[0]["name"], "Paracetamol")
+        self.assertEqual(self.rows(data["reminders"])[0]["medicine"], self.medicine.pk)
+        self.assertEqual(self.sync(data["cursor"]), {"changed": False, "cursor": data["cursor"]})
+
+        cursor = data["cursor"]
+        other = make_medicine("Ibuprofen", owner=self.user)
+        self.client.post("/api/ack-reminders/", json.dumps({"acks": [{"id": self.reminder.pk}]}),
+                         content_type="application/json")
+        data = self.sync(cursor)
+        self.assertFalse(data["full"])
+        self.assertEqual([m["id"] for m in self.rows(data["medicines"])], [other.pk])
+        self.assertEqual(self.rows(data["reminders"])[0]["status"], "taken")
+
+        cursor, medicine_pk = data["cursor"], self.medicine.pk
+        self.medicine.delete()
+        data = self.sync(cursor)
+        self.assertEqual(data["deleted"], {"medicines": [medicine_pk], "reminders": [self.reminder.pk]})
+        self.assertEqual(data["reminders"]["rows"], [])
+
+    def test_bulk_writes_are_stamped(self):
+        cursor = self.sync()["cursor"]
+        rows = [{"medicine": self.medicine.pk, "reminder_time": "2026-05-01 08:00"}]
+        import_reminders(rows, self.user)
+        import_medicines(
+            [{"name": "Zinc", "dosage": "1", "frequency": "Daily",
+              "start_date": "2026-05-01", "end_date": "2026-05-02"}], self.user,
+        )
+
+        data = self.sync(cursor)
+        self.assertEqual([m["name"] for m in self.rows(data["medicines"])], ["Zinc"])
+        self.assertEqual(len(data["reminders"]["rows"]), 1)
+
+    def test_other_users_rows_are_not_sent(self):
+        other = User.objects.create_user("esha", password="x")
+        make_medicine("Theirs", owner=other)
+        data = self.sync()
+        self.assertEqual([m["name"] for m in self.rows(data["medicines"])], ["Paracetamol"])
+
+    def test_unusable_cursor_sends_everything(self):
+        seq = int(self.sync()["cursor"].split(":")[1])
+        other = User.objects.create_user("esha", password="x")
+        # A bare number, or another user's cursor from a shared cache.
+        for cursor in (str(seq), f"{other.pk}:{seq}", "soon"):
+            data = self.sync(cursor)
+            self.assertTrue(data["full"])
+            self.assertEqual(data["cursor"], f"{self.user.pk}:{seq}")
+
+
+@override_settings(REMINDER_STREAM_RECHECK=0.05, REMINDER_STREAM_MAX_AGE=2)
+@override_settings(REMINDER_STREAM_RECHECK=0.05)
+class ReminderStreamTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("devi", password="x")
+        self.async_client.force_login(self.user)
+        self.medicine = make_medicine()
+
+    async def read_events(self, response, count):
+        events = []
+        async for chunk in response.streaming_content:
+            chunk = chunk.decode()
+            if chunk.startswith("id:"):
+                events.append(chunk)
+                if len(events) == count:
+                    break
+        return events
+
+    async def test_pushes_reminder_when_due(self):
+        reminder = await Reminder.objects.acreate(
+            medicine=self.medicine, user=self.user,
+            reminder_time=timezone.now() + timedelta(milliseconds=200),
+        )
+
+        response = await self.async_client.get("/api/reminder-stream/")
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+
+        events = await self.read_events(response, 1)
+        self.assertIn(f"id: {reminder.pk}", events[0])
+        self.assertIn("event: reminder", events[0])
+        self.assertIn('"medicine": "Paracetamol"', events[0])
+        self.assertLessEqual(reminder.reminder_time, timezone.now())
+
+    async def test_next_reminder_follows_acknowledgement(self):
+        past = timezone.now() - timedelta(minutes=1)
+        first = await Reminder.objects.acreate(medicine=self.medicine, user=self.user, reminder_time=past)
+        second = await Reminder.objects.acreate(medicine=self.medicine, user=self.user, reminder_time=past)
+
+        response = await self.async_client.get("/api/reminder-stream/")
+        await self.read_events(response, 1)
+        first.delivered = True
+        await first.asave()
+
+        events = await self.read_events(response, 1)
+        self.assertIn(f"id: {second.pk}", events[0])
+
+    async def test_announces_changes(self):
+        response = await self.async_client.get("/api/reminder-stream/")
+        chunks = response.streaming_content
+
+        async def next_change():
+            async for chunk in chunks:
+                if chunk.decode().startswith("event: changed"):
+                    return
+
+        # The first check wakes the stream once; then every bump does.
+        await asyncio.wait_for(next_change(), 1)
+        await sync_to_async(UserProfile.bump_reminders_version)([self.user.pk])
+        await asyncio.wait_for(next_change(), 1)
+
+    def test_streams_share_one_check_per_pass(self):
+        other = User.objects.create_user("esha", password="x")
+        hub = ReminderStreamHub()
+
+        async def scenario():
+            mine = [hub.subscribe(self.user.pk) for _ in range(3)]
+            theirs = hub.subscribe(other.pk)
+            # Every stream is woken once when its user is first seen.
+            await asyncio.wait_for(asyncio.gather(*(e.wait() for e in mine + [theirs])), 1)
+            for event in mine + [theirs]:
+                event.clear()
+
+            await sync_to_async(UserProfile.bump_reminders_version)([self.user.pk])
+            await asyncio.wait_for(asyncio.gather(*(e.wait() for e in mine)), 1)
+            self.assertFalse(theirs.is_set())
+
+            for event in mine:
+                hub.unsubscribe(self.user.pk, event)
+            hub.unsubscribe(other.pk, theirs)
+            await asyncio.sleep(0.1)
+
+        with CaptureQueriesContext(connection) as ctx:
+            async_to_sync(scenario)()
+        checks = [q["sql"] for q in ctx.captured_queries if q["sql"].startswith("SELECT")]
+        self.assertTrue(checks)
+        # One query per pass for every stream, and no reminder reads.
+        self.assertTrue(all('FROM "core_userprofile"' in sql and "IN (" in sql for sql in checks))
+
+    async def test_requires_login(self):
+        await sync_to_async(self.async_client.logout)()
+        response = await self.async_client.get("/api/reminder-stream/")
+        self.assertEqual(response.status_code, 403)
+
+    def test_wsgi_requests_fall_back_to_polling(self):
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get("/api/reminder-stream/").status_code, 204)
+
+
+class DashboardCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user("tara", password="x")
+        self.other = User.objects.create_user("uma", password="x")
+        self.medicine = make_medicine(owner=self.user)
+        self.soon = timezone.now() + timedelta(hours=1)
+        Reminder.objects.create(medicine=self.medicine, user=self.user, reminder_time=self.soon)
+        Reminder.objects.create(
+            medicine=make_medicine("Other", owner=self.other), user=self.other, reminder_time=self.soon
+        )
+
+    def test_summary_is_per_user(self):
+        summary = get_dashboard_summary(self.user)
+        self.assertEqual(summary["total_medicines"], 1)
+        self.assertEqual(summary["total_reminders"], 1)
+        self.assertEqual(summary["next_dose_medicine"], "Paracetamol")
+        self.assertEqual(summary["next_dose_time"], self.soon)
+
+    def test_hit_costs_no_queries(self):
+        before = cache_stats()
+        get_dashboard_summary(self.user)
+        with self.assertNumQueries(0):
+            get_dashboard_summary(self.user)
+
+        after = cache_stats()
+        self.assertEqual(after["misses"] - before["misses"], 1)
+        self.assertEqual(after["hits"] - before["hits"], 1)
+
+    def test_invalidated_on_change(self):
+        get_dashboard_summary(self.user)
+
+        reminder = Reminder.objects.create(
+            medicine=make_medicine("Ibuprofen"), user=self.user,
+            reminder_time=timezone.now() + timedelta(minutes=5),
+        )
+        self.assertEqual(get_dashboard_summary(self.user)["next_dose_medicine"], "Ibuprofen")
+
+        reminder.medicine.name = "Ibuprofen 400"
+        reminder.medicine.save()
+        self.assertEqual(get_dashboard_summary(self.user)["next_dose_medicine"], "Ibuprofen 400")
+
+        ReminderDispatcher(workers=1).mark_delivered([reminder.pk], {self.user.pk})
+        self.assertEqual(get_dashboard_summary(self.user)["total_reminders"], 1)
+
+        Reminder.objects.filter(user=self.user).delete()
+        self.assertEqual(get_dashboard_summary(self.user)["total_reminders"], 0)
+
+    def test_invalidated_by_dispatch(self):
+        due = Reminder.objects.create(
+            medicine=self.medicine, user=self.user, reminder_time=timezone.now() - timedelta(minutes=1),
+        )
+        self.assertEqual(get_dashboard_summary(self.user)["next_dose_time"], due.reminder_time)
+
+        make_dispatcher().run()
+
+        summary = get_dashboard_summary(self.user)
+        self.assertEqual(summary["total_reminders"], 1)
+        self.assertEqual(summary["next_dose_time"], self.soon)
+
+
+class MedicineScheduleTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("zara", password="x")
+        self.tz = timezone.get_default_timezone()
+        self.medicine = Medicine.objects.create(
+            name="Amoxicillin", dosage="250 mg", frequency="4x a day", owner=self.user,
+            start_date=date(2026, 1, 5), end_date=date(2026, 4, 4),
+        )
+
+    def make_schedule(self, **kwargs):
+        kwargs.setdefault("times_of_day", ["08:00", "12:00", "16:00", "20:00"])
+        return MedicineSchedule(medicine=self.medicine, user=self.user, **kwargs)
+
+    def at(self, *args):
+        return timezone.make_aware(datetime(*args), self.tz)
+
+    def test_expands_whole_course(self):
+        schedule = self.make_schedule()
+        occurrences = list(iter_occurrences(schedule, self.at(2025, 1, 1), self.at(2027, 1, 1)))
+
+        self.assertEqual(len(occurrences), 90 * 4)
+        self.assertEqual(occurrences[0], self.at(2026, 1, 5, 8))
+        self.assertEqual(occurrences[-1], self.at(2026, 4, 4, 20))
+
+    def test_window_interval_and_weekdays(self):
+        # Every other day from Monday 5 Jan, only on Mondays and Wednesdays.
+        schedule = self.make_schedule(times_of_day=["09:00"], interval_days=2, weekdays=1 | 4)
+        occurrences = list(iter_occurrences(schedule, self.at(2026, 1, 6), self.at(2026, 1, 20)))
+
+        self.assertEqual(occurrences, [
+            self.at(2026, 1, 7, 9),
+            self.at(2026, 1, 19, 9),
+        ])
+
+    def test_is_lazy(self):
+        schedule = self.make_schedule()
+        occurrences = iter_occurrences(schedule, self.at(2026, 1, 1), self.at(2026, 12, 31))
+        self.assertEqual(next(occurrences), self.at(2026, 1, 5, 8))
+
+    def test_materialise_window_skips_existing(self):
+        schedule = self.make_schedule()
+        schedule.save()
+        start, end = self.at(2026, 2, 1), self.at(2026, 2, 2)
+
+        created = materialise_window(start, end)
+        self.assertEqual(len(created), 4)
+        self.assertEqual(materialise_window(start, end), [])
+        self.assertEqual(Reminder.objects.filter(schedule=schedule).count(), 4)
+
+    def test_saving_schedule_materialises_current_window(self):
+        self.medicine.start_date = date.today()
+        self.medicine.end_date = date.today() + timedelta(days=30)
+        self.medicine.save()
+
+        self.make_schedule(times_of_day=["00:00", "06:00", "12:00", "18:00"]).save()
+
+        pending = Reminder.objects.filter(user=self.user, delivered=False)
+        self.assertTrue(0 < pending.count() <= 5)
+        self.assertLessEqual(pending.latest("reminder_time").reminder_time, timezone.now() + timedelta(hours=24))
+
+    def test_form_parses_times_and_weekdays(self):
+        form = MedicineScheduleForm({"times_of_day": "20:00, 8:00", "interval_days": 1, "weekdays": ["1", "16"]})
+
+        self.assertTrue(form.is_valid(), form.errors)
+        self.assertEqual(form.cleaned_data["times_of_day"], ["08:00", "20:00"])
+        self.assertEqual(form.cleaned_data["weekdays"], 17)
+        self.assertFalse(MedicineScheduleForm({"times_of_day": "25:00", "interval_days": 1}).is_valid())
+
+    def test_edit_schedule_view(self):
+        self.client.force_login(self.user)
+        url = f"/medicines/{self.medicine.pk}/schedule/"
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+        response = self.client.post(url, {"times_of_day": "08:00", "interval_days": 1})
+        self.assertRedirects(response, "/reminders/")
+        self.assertEqual(self.medicine.schedule.times_of_day, ["08:00"])
+        self.assertEqual(self.client.get("/reminders/").status_code, 200)
+
+
+class CourseGenerationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("ines", password="x")
+        self.client.force_login(self.user)
+        today = timezone.localdate()
+        self.medicine = Medicine.objects.create(
+            name="Metformin", dosage="500 mg", frequency="3x a day", owner=self.user,
+            start_date=today, end_date=today + timedelta(days=364),
+        )
+
+    def generate(self, **payload):
+        payload.setdefault("times_of_day", ["08:00", "14:00", "20:00"])
+        return self.client.post(
+            f"/api/medicines/{self.medicine.pk}/generate/", json.dumps(payload), content_type="application/json"
+        )
+
+    def test_year_of_doses_in_a_few_queries(self):
+        schedule = MedicineSchedule.objects.create(
+            medicine=self.medicine, user=self.user, times_of_day=["08:00", "14:00", "20:00"],
+        )
+        now = timezone.now()
+        expected = len(list(iter_occurrences(schedule, now, course_end(self.medicine))))
+
+        with CaptureQueriesContext(connection) as ctx:
+            created = generate_course(schedule, now)
+        self.assertGreater(expected, 1000)
+        # One lookup of existing doses and multi-row INSERTs (SQLite's bound
+        # parameter limit keeps each to about 70 rows), never one per dose.
+        inserts = [q for q in ctx.captured_queries if q["sql"].startswith("INSERT")]
+        self.assertLessEqual(len(inserts), expected // 60)
+        self.assertLessEqual(len(ctx.captured_queries) - len(inserts), 6)
+        self.assertEqual(Reminder.objects.filter(schedule=schedule, reminder_time__gte=now).count(), expected)
+        self.assertLessEqual(len(created), expected)
+
+    def test_api_skips_existing_doses(self):
+        tomorrow = timezone.localdate() + timedelta(days=1)
+        by_hand = Reminder.objects.create(
+            medicine=self.medicine, user=self.user,
+            reminder_time=timezone.make_aware(datetime.combine(tomorrow, datetime.min.time().replace(hour=8))),
+        )
+
+        response = self.generate(times_of_day=["08:00"])
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(
+            Reminder.objects.filter(medicine=self.medicine, reminder_time=by_hand.reminder_time).count(), 1
+        )
+        self.assertEqual(self.generate(times_of_day=["08:00"]).json()["created"], 0)
+        self.assertEqual(self.generate(times_of_day="08:00").status_code, 400)
+        self.assertEqual(self.generate(times_of_day=["8 am"]).status_code, 400)
+
+    def test_reminders_page_lists_generated_doses_once(self):
+        self.generate(times_of_day=["08:00"])
+        stored = set(Reminder.objects.filter(medicine=self.medicine).values_list("reminder_time", flat=True))
+
+        scheduled = self.client.get("/reminders/").context["scheduled"]
+        # The whole course is stored, so nothing is left to expand.
+        self.assertFalse([dose_time for dose_time, _ in scheduled if dose_time in stored])
+        self.assertEqual(scheduled, [])
+
+    def test_editing_schedule_keeps_generated_course(self):
+        self.generate(times_of_day=["08:00"])
+        response = self.client.post(f"/medicines/{self.medicine.pk}/schedule/", {
+            "times_of_day": "09:00", "interval_days": 1,
+        })
+        self.assertRedirects(response, "/reminders/")
+
+        pending = Reminder.objects.filter(medicine=self.medicine, delivered=False)
+        last = timezone.localtime(pending.latest("reminder_time").reminder_time)
+        self.assertEqual((last.date(), last.hour), (self.medicine.end_date, 9))
+        self.assertFalse(pending.filter(reminder_time__hour=8).exists())
+
+    def test_editing_medicine_keeps_doses_unless_the_course_moves(self):
+        self.generate()
+        pending = Reminder.objects.filter(medicine=self.medicine, delivered=False)
+        doses = pending.count()
+        medicine = Medicine.objects.get(pk=self.medicine.pk)
+
+        medicine.name = "Metformin XR"
+        # The save, the counter bump and the change stamps only.
+        with self.assertNumQueries(7):
+            medicine.save()
+        self.assertEqual(pending.count(), doses)
+        self.assertFalse(Tombstone.objects.exists())
+
+        # Shortening the course deletes the doses past its new end, with a
+        # single bump of the change counter.
+        self.user.userprofile.refresh_from_db()
+        version = self.user.userprofile.reminders_version
+        medicine.end_date -= timedelta(days=7)
+        medicine.save()
+        self.assertEqual(pending.count(), doses - 21)
+        self.assertEqual(Tombstone.objects.count(), 21)
+        self.assertEqual(set(Tombstone.objects.values_list("change_seq", flat=True)), {version + 2})
+
+    def test_schedule_form_can_generate_course(self):
+        now = timezone.now()
+        self.client.post(f"/medicines/{self.medicine.pk}/schedule/", {
+            "times_of_day": "08:00", "interval_days": 7, "whole_course": "on",
+        })
+        doses = iter_occurrences(self.medicine.schedule, now, course_end(self.medicine))
+        self.assertEqual(Reminder.objects.filter(medicine=self.medicine).count(), len(list(doses)))
+        self.assertGreaterEqual(Reminder.objects.filter(medicine=self.medicine).count(), 52)
+
+    @override_settings(TIME_ZONE="Europe/London")
+    def test_doses_keep_their_local_time_across_dst(self):
+        self.medicine.start_date, self.medicine.end_date = date(2027, 3, 26), date(2027, 3, 29)
+        self.medicine.save()
+        schedule = MedicineSchedule(medicine=self.medicine, user=self.user, times_of_day=["08:00"])
+        now = timezone.make_aware(datetime(2027, 3, 25))
+        with mock.patch("core.schedules.timezone.now", return_value=now):
+            schedule.save()
+        generate_course(schedule, now)
+
+        times = Reminder.objects.filter(schedule=schedule).order_by("reminder_time").values_list("reminder_time", flat=True)
+        self.assertEqual([timezone.localtime(t).hour for t in times], [8, 8, 8, 8])
+        self.assertEqual([t.hour for t in times], [8, 8, 7, 7])
+
+
+class BulkImportExportTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user("leela", password="x")
+        self.client.force_login(self.user)
+        self.medicine = make_medicine(owner=self.user)
+
+    def test_command_imports_medicines_in_chunks(self):
+        path = self.write_file("medicines.csv", "name,dosage,frequency,start_date,end_date\n" + "".join(
+            f"Med {i},10 mg,Daily,2026-01-01,2026-02-01\n" for i in range(7)
+        ) + "Broken,10 mg,Daily,not-a-date,2026-02-01\n")
+        out, err = StringIO(), StringIO()
+
+        # The user lookup, then per chunk of three one transaction (savepoint
+        # here) that bumps and reads the owner's change sequence and INSERTs.
+        with self.assertNumQueries(16):
+            call_command("import_data", "medicines", path, "--chunk-size", "3", "--user", "leela",
+                         stdout=out, stderr=err)
+
+        self.assertIn("Imported 7 medicines, 1 rows rejected.", out.getvalue())
+        self.assertIn("Row 8", err.getvalue())
+        self.assertEqual(Medicine.objects.filter(name__startswith="Med ", owner=self.user).count(), 7)
+
+    def test_upload_imports_reminders_from_json_lines(self):
+        lines = [
+            {"medicine": self.medicine.pk, "reminder_time": "2026-03-01T08:00"},
+            {"medicine": self.medicine.pk, "reminder_time": "2026-03-01 20:00"},
+            {"medicine": 99999, "reminder_time": "2026-03-02T08:00"},
+        ]
+        upload = SimpleUploadedFile("r.jsonl", "\n".join(json.dumps(line) for line in lines).encode())
+
+        response = self.client.post("/api/import/", {"kind": "reminders", "file": upload})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["created"], 2)
+        self.assertEqual(response.json()["failed"], 1)
+        self.assertEqual(Reminder.objects.filter(user=self.user).count(), 2)
+        self.assertTrue(timezone.is_aware(Reminder.objects.filter(user=self.user).first().reminder_time))
+
+    def test_rows_that_are_not_objects_are_rejected(self):
+        body = f'[1]\n5\n{{"medicine": {self.medicine.pk}, "reminder_time": "2026-03-01T08:00"}}\n'
+        upload = SimpleUploadedFile("r.jsonl", body.encode())
+
+        response = self.client.post("/api/import/", {"kind": "reminders", "file": upload})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["created"], 1)
+        self.assertEqual([error["row"] for error in response.json()["errors"]], [1, 2])
+
+    def test_parse_error_reports_what_was_imported(self):
+        row = {"name": "Med", "dosage": "10 mg", "frequency": "Daily",
+               "start_date": "2026-01-01", "end_date": "2026-02-01"}
+        body = json.dumps(row) + "\n" + json.dumps(row) + "\n{not json\n" + json.dumps(row) + "\n"
+        upload = SimpleUploadedFile("m.jsonl", body.encode())
+
+        response = self.client.post("/api/import/", {"kind": "medicines", "file": upload})
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()["created"], 2)
+        self.assertIn("Row 3", response.json()["error"])
+        self.assertEqual(Medicine.objects.filter(name="Med", owner=self.user).count(), 2)
+
+    def test_export_streams_reminders(self):
+        Reminder.objects.create(medicine=self.medicine, user=self.user, reminder_time=timezone.now())
+
+        response = self.client.get("/api/export/reminders/?format=jsonl")
+
+        self.assertTrue(response.streaming)
+        rows = [json.loads(line) for line in b"".join(response.streaming_content).decode().splitlines()]
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]["medicine_name"], "Paracetamol")
+
+        response = self.client.get("/api/export/medicines/")
+        content = b"".join(response.streaming_content).decode()
+        self.assertTrue(content.startswith("id,name,dosage,frequency,start_date,end_date"))
+
+    def write_file(self, name, content):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, name)
+        with open(path, "w") as f:
+            f.write(content)
+        return path
+
+
+class ArchiveTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("hema", password="x")
+        self.medicine = make_medicine(owner=self.user)
+        now = timezone.now()
+        self.old = Reminder.objects.bulk_create([
+            Reminder(medicine=self.medicine, user=self.user, delivered=True, status="taken",
+                     reminder_time=now - timedelta(days=200 - i))
+            for i in range(5)
+        ])
+        self.recent = Reminder.objects.create(
+            medicine=self.medicine, user=self.user, delivered=True, reminder_time=now - timedelta(days=1),
+        )
+        self.overdue = Reminder.objects.create(
+            medicine=self.medicine, user=self.user, reminder_time=now - timedelta(days=200),
+        )
+        self.event = DoseEvent.objects.create(
+            user=self.user, medicine=self.medicine, reminder=self.old[0],
+            scheduled_at=self.old[0].reminder_time, status=DoseEvent.TAKEN,
+        )
+
+    def test_dry_run_changes_nothing(self):
+        out = StringIO()
+        call_command("archive_reminders", "--dry-run", "--batch-size", "2", stdout=out)
+        self.assertIn("Would archive 5 reminders", out.getvalue())
+        self.assertIn("in 3 batches", out.getvalue())
+        self.assertFalse(ArchivedReminder.objects.exists())
+
+    def test_moves_old_delivered_reminders_in_batches(self):
+        out = StringIO()
+        call_command("archive_reminders", "--batch-size", "2", stdout=out)
+
+        self.assertIn("Archived 5 reminders in 3 batches.", out.getvalue())
+        self.assertEqual(
+            set(Reminder.objects.values_list("pk", flat=True)), {self.recent.pk, self.overdue.pk}
+        )
+        archived = ArchivedReminder.objects.get(pk=self.old[0].pk)
+        self.assertEqual((archived.status, archived.reminder_time), ("taken", self.old[0].reminder_time))
+        self.event.refresh_from_db()
+        self.assertIsNone(self.event.reminder_id)
+        # History is not reported to sync clients as deleted.
+        self.assertFalse(Tombstone.objects.exists())
+
+    def test_interrupted_run_resumes(self):
+        def stop(result):
+            raise DispatcherCrash
+
+        with self.assertRaises(DispatcherCrash):
+            archive_delivered(timezone.now() - timedelta(days=90), batch_size=2, progress=stop)
+        self.assertEqual(ArchivedReminder.objects.count(), 2)
+        self.assertEqual(Reminder.objects.count(), 5)
+
+        result = archive_delivered(timezone.now() - timedelta(days=90), batch_size=2)
+        self.assertEqual((result.archived, result.batches), (3, 2))
+        self.assertEqual(ArchivedReminder.objects.count(), 5)
+
+    def test_history_continues_into_the_archive(self):
+        archive_delivered(timezone.now() - timedelta(days=90))
+        self.client.force_login(self.user)
+
+        seen, cursor = [], None
+        while True:
+            params = {"status": "delivered", "limit": 2}
+            if cursor:
+                params["cursor"] = cursor
+            data = self.client.get("/api/reminders/", params).json()
+            seen += [row["id"] for row in data["results"]]
+            cursor = data["next"]
+            if not cursor:
+                break
+        self.assertEqual(seen, [self.recent.pk] + [r.pk for r in reversed(self.old)])
+
+        # The overdue reminder, then the live and archived history.
+        response = self.client.get("/reminders/")
+        self.assertContains(response, "Paracetamol", count=7)
+
+    def test_archival_scan_uses_index(self):
+        qs = archivable(timezone.now()).order_by("reminder_time", "id").values_list("id")
+        sql, params = qs.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute("EXPLAIN QUERY PLAN " + sql, params)
+            plan = " ".join(str(row[-1]) for row in cursor.fetchall())
+        self.assertIn("reminder_delivered_time_idx", plan)
+        self.assertNotIn("TEMP B-TREE", plan)
+
+
+class SQLiteTuningTests(SimpleTestCase):
+    """Concurrency on a real database file, set up by the connection hook."""
+
+    def setUp(self):
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path)
+        # Each thread gets its own connection from the handler.
+        self.connections = ConnectionHandler({
+            "default": {"ENGINE": "django.db.backends.sqlite3", "NAME": os.path.join(path, "stress.sqlite3")},
+        })
+        self.addCleanup(self.connections.close_all)
+        with self.connections["default"].cursor() as cursor:
+            cursor.execute("CREATE TABLE dose (id INTEGER PRIMARY KEY, taken INTEGER NOT NULL DEFAULT 0)")
+            cursor.executemany("INSERT INTO dose (taken) VALUES (?)", [(0,)] * 200)
+
+    def in_thread(self, target, errors):
+        def run():
+            try:
+                target(self.connections["default"])
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                self.connections["default"].close()
+        thread = threading.Thread(target=run)
+        thread.start()
+        return thread
+
+    def test_pragmas_applied(self):
+        with self.connections["default"].cursor() as cursor:
+            values = {}
+            for name in ("journal_mode", "synchronous", "busy_timeout"):
+                cursor.execute(f"PRAGMA {name}")
+                values[name] = cursor.fetchone()[0]
+        self.assertEqual(values, {"journal_mode": "wal", "synchronous": 1, "busy_timeout": 5000})
+
+    def test_readers_are_not_blocked_by_an_open_write(self):
+        writing, done = threading.Event(), threading.Event()
+        errors = []
+
+        def dispatcher(conn):
+            with conn.cursor() as cursor:
+                cursor.execute("BEGIN IMMEDIATE")
+                cursor.execute("UPDATE dose SET taken = 1")
+                writing.set()
+                done.wait(5)
+                cursor.execute("COMMIT")
+
+        writer = self.in_thread(dispatcher, errors)
+        self.assertTrue(writing.wait(5))
+        with self.connections["default"].cursor() as cursor:
+            started = time.monotonic()
+            cursor.execute("SELECT count(*) FROM dose WHERE taken = 1")
+            self.assertEqual(cursor.fetchone()[0], 0)
+            self.assertLess(time.monotonic() - started, 0.5)
+        done.set()
+        writer.join()
+        self.assertEqual(errors, [])
+
+
+class DispatcherConcurrencyTests(SimpleTestCase):
+    """
+    The real dispatcher, ack views and read paths running at once on a
+    migrated database file, as in production.
+    """
+
+    def setUp(self):
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path)
+        # Point "default" at the file for every thread; the in-memory test
+        # database is kept open and put back afterwards.
+        saved_settings, saved_connection = connections.settings["default"], connections["default"]
+        connections.settings["default"] = {**saved_settings, "NAME": os.path.join(path, "stress.sqlite3")}
+        del connections["default"]
+
+        def restore():
+            connections["default"].close()
+            connections.settings["default"] = saved_settings
+            connections["default"] = saved_connection
+        self.addCleanup(restore)
+
+        call_command("migrate", verbosity=0)
+        self.user = User.objects.create_user("vani", email="vani@example.com", password="x")
+        self.user.userprofile.phone = "+915551112222"
+        self.user.userprofile.save()
+        medicine = make_medicine(owner=self.user)
+        past = timezone.now() - timedelta(minutes=5)
+        self.reminders = Reminder.objects.bulk_create([
+            Reminder(medicine=medicine, user=self.user, reminder_time=past - timedelta(minutes=10 * i))
+            for i in range(120)
+        ])
+
+    def in_thread(self, target, errors):
+        def run():
+            try:
+                target()
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                connections.close_all()
+        thread = threading.Thread(target=run)
+        thread.start()
+        return thread
+
+    def test_no_lock_errors_while_dispatching(self):
+        errors, read_times, statuses = [], [], []
+        sms = LocmemChannel("sms")
+        pks = [r.pk for r in self.reminders]
+
+        def dispatch():
+            ReminderDispatcher(channels=[sms], batch_size=40, workers=4, chunk_size=5).run(
+                timezone.now() + timedelta(minutes=1)
+            )
+
+        def acks(offset):
+            client = Client()
+            client.force_login(self.user)
+            for start in range(offset, len(pks), 20):
+                response = client.post(
+                    "/api/ack-reminders/", json.dumps({"acks": [{"id": pks[start]}]}),
+                    content_type="application/json",
+                )
+                statuses.append(response.status_code)
+                statuses.append(client.get(f"/api/mark-delivered/{pks[start + 1]}/").status_code)
+
+        def reads():
+            client = Client()
+            client.force_login(self.user)
+            for _ in range(20):
+                started = time.monotonic()
+                statuses.append(client.get("/api/reminders/").status_code)
+                get_dashboard_summary(self.user)
+                read_times.append(time.monotonic() - started)
+
+        threads = [self.in_thread(dispatch, errors)]
+        threads += [self.in_thread(lambda offset=offset: acks(offset), errors) for offset in (0, 10)]
+        threads += [self.in_thread(reads, errors) for _ in range(3)]
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(set(statuses), {200})
+        self.assertEqual(len(read_times), 60)
+        self.assertFalse(Reminder.objects.filter(delivered=False).exists())
+        # Readers never wait for a dispatcher transaction to commit.
+        self.assertLess(max(read_times), 1.0)
+
+
+class BenchmarkTests(TestCase):
+    def test_seed_and_run(self):
+        cache.clear()
+        user = seed(users=2, medicines_per_user=2, reminders_per_medicine=4, due=3)
+        self.assertEqual(Reminder.objects.count(), 2 * 2 * 4 + 3)
+
+        results = run_benchmarks(user, repeat=3, workers=2)
+
+        self.assertEqual(
+            set(results),
+            {"dashboard", "reminders", "api_get_reminders", "api_mark_delivered", "send_reminders",
+             "generate_course"},
+        )
+        self.assertGreater(results["generate_course"]["created"], 1000)
+        self.assertGreaterEqual(results["send_reminders"]["delivered"], 3)
+
+    def test_compare_flags_regressions(self):
+        baseline = {
+            "dashboard": {"p95_ms": 10.0, "queries": 3},
+            "send_reminders": {"reminders_per_sec": 1000.0},
+        }
+        current = {
+            "dashboard": {"p95_ms": 11.0, "queries": 4},
+            "send_reminders": {"reminders_per_sec": 700.0},
+        }
+
+        self.assertEqual(compare(current, baseline, 0.2), [
+            "dashboard.queries: 3 -> 4",
+            "send_reminders.reminders_per_sec: 1000.0 -> 700.0",
+        ])
+
+
+class BatchAckTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user("farah", password="x")
+        self.client.force_login(self.user)
+        medicine = make_medicine()
+        now = timezone.now()
+        self.mine = [
+            Reminder.objects.create(medicine=medicine, user=self.user, reminder_time=now) for _ in range(3)
+        ]
+        other = User.objects.create_user("gita", password="x")
+        self.theirs = Reminder.objects.create(medicine=medicine, user=other, reminder_time=now)
+
+    def post(self, payload):
+        return self.client.post("/api/ack-reminders/", json.dumps(payload), content_type="application/json")
+
+    def test_applies_batch_in_one_update(self):
+        taken, skipped, default = self.mine
+        acks = [
+            {"id": taken.pk, "status": "taken", "at": "2026-03-01T08:05:00+05:30"},
+            {"id": skipped.pk, "status": "skipped"},
+            {"id": default.pk},
+            {"id": self.theirs.pk},
+            {"id": 424242, "status": "lost"},
+        ]
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.post({"acks": acks})
+        updates = [q for q in ctx.captured_queries if q["sql"].startswith('UPDATE "core_reminder"')]
+        self.assertEqual(len(updates), 1)
+
+        self.assertEqual(response.json()["results"], {
+            str(taken.pk): "ok",
+            str(skipped.pk): "ok",
+            str(default.pk): "ok",
+            str(self.theirs.pk): "not_found",
+            "424242": "invalid",
+        })
+        taken.refresh_from_db()
+        skipped.refresh_from_db()
+        default.refresh_from_db()
+        self.assertTrue(taken.delivered)
+        self.assertEqual(taken.status, "taken")
+        self.assertEqual(taken.acknowledged_at.isoformat(), "2026-03-01T02:35:00+00:00")
+        self.assertEqual(skipped.status, "skipped")
+        self.assertEqual(default.status, "taken")
+        self.assertIsNotNone(default.acknowledged_at)
+        self.theirs.refresh_from_db()
+        self.assertFalse(self.theirs.delivered)
+
+    def test_rejects_malformed_body(self):
+        self.assertEqual(self.post({"ids": [1]}).status_code, 400)
+        self.assertEqual(self.client.get("/api/ack-reminders/").status_code, 405)
+
+    def test_invalid_ack_values(self):
+        first, second, _ = self.mine
+        response = self.post({"acks": [
+            {"id": first.pk, "at": "2026-13-45T10:00:00"},
+            {"id": second.pk, "status": ["taken"]},
+        ]})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["results"], {str(first.pk): "invalid", str(second.pk): "invalid"})
+        self.assertFalse(Reminder.objects.filter(user=self.user, delivered=True).exists())
+
+
+@override_settings(PERF_METRICS_ENABLED=True, PERF_SLOW_REQUEST_MS=0)
+class PerformanceMiddlewareTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        metrics_registry.reset()
+        self.user = User.objects.create_user("hema", password="x", is_staff=True)
+        self.client.force_login(self.user)
+
+    def test_records_timings_per_url_name(self):
+        with self.assertLogs("core.metrics", "WARNING") as logs:
+            response = self.client.get("/reminders/")
+
+        self.assertRegex(response["Server-Timing"], r'total;dur=[\d.]+, db;dur=[\d.]+;desc="\d+ queries", tpl;dur=[\d.]+')
+        self.assertIn("SELECT", logs.output[0])
+
+        snapshot = self.client.get("/metrics/").json()
+        self.assertEqual(snapshot["reminders"]["request_ms"]["count"], 1)
+        self.assertGreater(snapshot["reminders"]["db_queries"]["sum"], 0)
+        self.assertGreater(snapshot["reminders"]["template_ms"]["sum"], 0)
+
+    def test_quantiles_cover_a_rolling_window(self):
+        now = [0.0]
+        histogram = Histogram(window=300, clock=lambda: now[0])
+        for _ in range(100):
+            histogram.observe(2000)
+        now[0] = 240
+        histogram.observe(3)
+        self.assertEqual(histogram.summary()["p99"], 2500)
+
+        # The slow start has rolled out of the window, not out of the totals.
+        now[0] = 330
+        summary = histogram.summary()
+        self.assertEqual((summary["count"], summary["p99"]), (1, 5))
+        self.assertEqual(histogram.count, 101)
+
+        now[0] = 600
+        self.assertEqual(histogram.summary()["count"], 0)
+        self.assertIsNone(histogram.summary()["p50"])
+
+    def test_query_counts_use_count_buckets(self):
+        self.client.get("/api/get-reminders/")
+        text = self.client.get("/metrics/?format=prometheus").content.decode()
+
+        self.assertIn('medcia_db_queries_bucket{view="api_get_reminders",le="2"}', text)
+        self.assertNotIn('medcia_db_queries_bucket{view="api_get_reminders",le="2.5"}', text)
+
+    def test_prometheus_format(self):
+        self.client.get("/api/get-reminders/")
+        text = self.client.get("/metrics/?format=prometheus").content.decode()
+
+        self.assertIn("# TYPE medcia_request_ms histogram", text)
+        self.assertIn('medcia_request_ms_count{view="api_get_reminders"} 1', text)
+
+    def test_metrics_are_staff_only(self):
+        self.client.force_login(User.objects.create_user("ira", password="x"))
+        self.assertEqual(self.client.get("/metrics/").status_code, 302)
+
+    @override_settings(PERF_METRICS_ENABLED=False)
+    def test_disabled_by_default(self):
+        self.assertNotIn("Server-Timing", self.client.get("/reminders/"))
+
+
+class AdherenceTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user("joy", email="joy@example.com", password="x")
+        self.client.force_login(self.user)
+        self.medicine = make_medicine()
+
+    def reminder(self, minutes_ago, delivered=False):
+        return Reminder.objects.create(
+            medicine=self.medicine, user=self.user, delivered=delivered,
+            reminder_time=timezone.now() - timedelta(minutes=minutes_ago),
+        )
+
+    def ack(self, *acks):
+        return self.client.post(
+            "/api/ack-reminders/", json.dumps({"acks": list(acks)}), content_type="application/json"
+        )
+
+    def test_dispatch_and_acks_update_log_and_rollups(self):
+        on_time, late, skipped, missed = (self.reminder(m) for m in (10, 200, 5, 3))
+        ReminderDispatcher(workers=1).run()
+
+        self.client.get(f"/api/mark-delivered/{on_time.pk}/")
+        self.client.get(f"/api/mark-delivered/{late.pk}/")
+        self.ack({"id": skipped.pk, "status": "skipped"})
+
+        self.assertEqual(DoseEvent.objects.filter(status=DoseEvent.NOTIFIED).count(), 4)
+        self.assertEqual(DoseEvent.objects.filter(status=DoseEvent.TAKEN).count(), 2)
+        self.assertEqual(DoseEvent.objects.filter(status=DoseEvent.SKIPPED).count(), 1)
+
+        rollups = DailyAdherence.objects.filter(user=self.user).aggregate(
+            due=Sum("due"), taken=Sum("taken"), on_time=Sum("taken_on_time"), skipped=Sum("skipped"),
+        )
+        self.assertEqual(rollups, {"due": 4, "taken": 2, "on_time": 1, "skipped": 1})
+        self.assertEqual(adherence_summary(self.user)[0]["windows"], {30: 25.0, 90: 25.0, 365: 25.0})
+
+    def test_acks_count_once(self):
+        reminder = self.reminder(1)
+        self.ack({"id": reminder.pk})
+        response = self.ack({"id": reminder.pk, "status": "skipped"})
+        self.client.get(f"/api/mark-delivered/{reminder.pk}/")
+
+        self.assertEqual(response.json()["results"], {str(reminder.pk): "duplicate"})
+        self.assertEqual(DoseEvent.objects.count(), 1)
+        row = DailyAdherence.objects.get(user=self.user)
+        self.assertEqual((row.due, row.taken, row.taken_on_time), (1, 1, 1))
+
+    def test_summary_reads_rollups_by_window(self):
+        today = timezone.localdate()
+        for days_ago, due, on_time in ((1, 4, 4), (60, 4, 2), (200, 4, 0), (400, 4, 4)):
+            DailyAdherence.objects.create(
+                user=self.user, medicine=self.medicine, day=today - timedelta(days=days_ago),
+                due=due, taken=on_time, taken_on_time=on_time,
+            )
+
+        with self.assertNumQueries(1):
+            summary = adherence_summary(self.user, today)
+
+        self.assertEqual(summary, [{"medicine": "Paracetamol", "windows": {30: 100.0, 90: 75.0, 365: 50.0}}])
+        self.assertContains(self.client.get("/adherence/"), "75.0%")
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("kavya", password="x")
+        self.client.force_login(self.user)
+        medicine = make_medicine(owner=self.user)
+        base = timezone.now() - timedelta(days=1)
+        # Pairs of reminders share a time, so ordering relies on the id tie-break.
+        Reminder.objects.bulk_create([
+            Reminder(medicine=medicine, user=self.user, delivered=True,
+                     reminder_time=base - timedelta(minutes=i // 2))
+            for i in range(45)
+        ])
+
+    def test_api_walks_every_row_once(self):
+        seen, cursor, pages = [], None, 0
+        while True:
+            params = {"status": "delivered", "limit": 10}
+            if cursor:
+                params["cursor"] = cursor
+            data = self.client.get("/api/reminders/", params).json()
+            seen += [row["id"] for row in data["results"]]
+            pages += 1
+            cursor = data["next"]
+            if cursor is None:
+                break
+
+        expected = list(
+            Reminder.objects.filter(user=self.user).order_by("-reminder_time", "-id").values_list("id", flat=True)
+        )
+        self.assertEqual(seen, expected)
+        self.assertEqual(pages, 5)
+
+    def test_web_view_serves_next_page_as_fragment(self):
+        response = self.client.get("/reminders/")
+        self.assertEqual(len(response.context["past"]), 20)
+        cursor = response.context["past_next"]
+        self.assertContains(response, f"section=past&cursor={cursor}")
+
+        fragment = self.client.get("/reminders/", {"section": "past", "cursor": cursor})
+        self.assertTemplateUsed(fragment, "reminder_rows.html")
+        self.assertTemplateNotUsed(fragment, "base.html")
+        self.assertEqual(len(fragment.context["rows"]), 20)
+
+    def test_medicines_list_pages(self):
+        for i in range(30):
+            make_medicine(f"Drug {i:02}", owner=self.user)
+        response = self.client.get("/medicines/")
+        self.assertEqual(len(response.context["medicines"]), 24)
+
+        response = self.client.get("/medicines/", {"cursor": response.context["next_cursor"]})
+        self.assertTemplateUsed(response, "medicine_cards.html")
+        self.assertEqual(len(response.context["medicines"]), 7)
+        self.assertIsNone(response.context["next_cursor"])
+
+    def test_invalid_cursor(self):
+        self.assertEqual(self.client.get("/api/reminders/", {"cursor": "nope"}).status_code, 400)
+        self.assertEqual(self.client.get("/reminders/", {"section": "past", "cursor": "!!"}).status_code, 400)
+
+    def test_later_pages_seek_the_index(self):
+        cursor = self.client.get("/api/reminders/", {"status": "delivered"}).json()["next"]
+        qs = Reminder.objects.filter(user=self.user, delivered=True)
+        with CaptureQueriesContext(connection) as ctx:
+            keyset_page(qs, ("-reminder_time", "-id"), cursor)
+        with connection.cursor() as c:
+            c.execute("EXPLAIN QUERY PLAN " + ctx.captured_queries[0]["sql"])
+            plan = " ".join(str(row[-1]) for row in c.fetchall())
+        self.assertIn("reminder_user_history_idx (user_id=? AND reminder_time<?)", plan)
+        self.assertNotIn("TEMP B-TREE", plan)
+
+
+class MedicineOwnershipTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("meera", password="x")
+        self.other = User.objects.create_user("neha", password="x")
+        self.client.force_login(self.user)
+        self.mine = make_medicine("Mine", owner=self.user)
+        self.theirs = make_medicine("Theirs", owner=self.other)
+
+    def test_views_only_see_own_medicines(self):
+        response = self.client.get("/medicines/")
+        self.assertEqual([m.name for m in response.context["medicines"]], ["Mine"])
+
+        for url in (f"/medicines/{self.theirs.pk}/edit/", f"/medicines/{self.theirs.pk}/delete/"):
+            self.assertEqual(self.client.get(url).status_code, 404)
+        self.assertEqual(self.client.get(f"/medicines/{self.mine.pk}/edit/").status_code, 200)
+
+    def test_added_medicine_is_owned(self):
+        self.client.post("/add-medicine/", {
+            "name": "New", "dosage": "5 mg", "frequency": "Daily",
+            "start_date": "2026-01-01", "end_date": "2026-02-01",
+        })
+        self.assertEqual(Medicine.objects.get(name="New").owner, self.user)
+
+    def test_reminder_form_offers_own_medicines_only(self):
+        form = ReminderForm(user=self.user)
+        self.assertEqual(list(form.fields["medicine"].queryset), [self.mine])
+
+        form = ReminderForm({"medicine": self.theirs.pk, "reminder_time": "2026-03-01T08:00"}, user=self.user)
+        self.assertIn("medicine", form.errors)
+
+    def test_migration_assigns_owner_from_earliest_reminder(self):
+        legacy = make_medicine("Legacy")
+        now = timezone.now()
+        theirs = Reminder.objects.create(medicine=legacy, user=self.other, reminder_time=now)
+        Reminder.objects.create(medicine=legacy, user=self.user, reminder_time=now - timedelta(days=1))
+        orphan = make_medicine("Orphan")
+
+        import_module("core.migrations.0013_assign_medicine_owners").assign_owners(django_apps, None)
+
+        legacy.refresh_from_db()
+        orphan.refresh_from_db()
+        self.assertEqual(legacy.owner, self.user)
+        self.assertIsNone(orphan.owner)
+
+        # The other user keeps their reminder, on their own copy.
+        theirs.refresh_from_db()
+        self.assertNotEqual(theirs.medicine_id, legacy.pk)
+        self.assertEqual((theirs.medicine.owner, theirs.medicine.name), (self.other, "Legacy"))
@@ -12,6 +12,7 @@ urlpatterns = [
     path('medicines/', views.medicines_list, name='medicines_list'),
     path('medicines/<int:pk>/edit/', views.edit_medicine, name='edit_medicine'),
     path('medicines/<int:pk>/delete/', views.delete_medicine, name='delete_medicine'),
+    path('medicines/<int:pk>/schedule/', views.edit_schedule, name='edit_schedule'),
 
     # Reminders
     path('reminders/', views.reminders, name='reminders'),
@@ -19,6 +20,8 @@ urlpatterns = [
     path("reminders/<int:pk>/edit/", views.edit_reminder, name="edit_reminder"),
     path("reminders/<int:pk>/delete/", views.delete_reminder, name="delete_reminder"),
 
+    path('adherence/', views.adherence, name='adherence'),
+
     # Profile & auth
     path('profile/', views.profile, name='profile'),
     path('profile/edit/', views.profile_edit, name='profile_edit'),
@@ -41,7 +44,21 @@ urlpatterns = [
 
     # path("api/reminders/", reminders_api, name="reminders_api"),
 
-    path("api/get-reminders/", views.api_get_reminders),
-    path("api/mark-delivered/<int:pk>/", views.api_mark_delivered),
+    path("api/get-reminders/", views.api_get_reminders, name="api_get_reminders"),
+    path("api/reminders/", views.api_reminders, name="api_reminders"),
+    path("api/reminder-changes/", views.api_reminder_changes, name="api_reminder_changes"),
+    path("api/sync/", views.api_sync, name="api_sync"),
+    path("api/reminder-stream/", views.api_reminder_stream, name="api_reminder_stream"),
+    path("api/mark-delivered/<int:pk>/", views.api_mark_delivered, name="api_mark_delivered"),
+    path("api/ack-reminders/", views.api_ack_reminders, name="api_ack_reminders"),
+    path("api/medicines/<int:pk>/generate/", views.api_generate_reminders, name="api_generate_reminders"),
+    path("api/push-subscriptions/", views.api_push_subscriptions, name="api_push_subscriptions"),
+
+    # Bulk import / export
+    path("api/import/", views.api_import, name="api_import"),
+    path("api/export/<str:kind>/", views.api_export, name="api_export"),
+
+    # Staff-only performance metrics (see PERF_METRICS_ENABLED)
+    path("metrics/", views.metrics, name="metrics"),
 
 ]
@@ -1,32 +1,55 @@
+import asyncio
+import io
+import json
 from datetime import datetime, timedelta
 
+from asgiref.sync import sync_to_async
+
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth import login, logout
 from django.contrib.auth.forms import AuthenticationForm
 from django.contrib import messages
-from django.http import JsonResponse
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.handlers.asgi import ASGIRequest
+from django.core.validators import URLValidator
+from django.http import (
+    Http404,
+    HttpResponse,
+    HttpResponseBadRequest,
+    HttpResponseForbidden,
+    JsonResponse,
+    StreamingHttpResponse,
+)
+from django.db import transaction
+from django.db.models import Case, F, Max, Value, When
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition, require_GET, require_http_methods, require_POST
 
-from .models import Medicine, Reminder
-from .forms import SignupForm, MedicineForm, ReminderForm
-
+from .models import Medicine, MedicineSchedule, PushSubscription, Reminder, Tombstone, UserProfile
+from .forms import SignupForm, MedicineForm, MedicineScheduleForm, ReminderForm
+from . import bulk
+from .changes import changes_since, current_seq, next_seqs
+from .adherence import Dose, adherence_summary, record_acks, WINDOWS as ADHERENCE_WINDOWS
+from .archive import HISTORY_ORDERING, history_page
+from .metrics import registry as metrics_registry
+from .pagination import InvalidCursor, keyset_page
+from .dashboard import get_dashboard_summary, invalidate_dashboard
+from .schedules import course_end, generate_course, upcoming_doses, window_size
+from .streams import hub as stream_hub, recheck_interval
 
-def dashboard(request):
-    medicines = Medicine.objects.all()
-    reminders = Reminder.objects.filter(delivered=False)
 
-    total_medicines = medicines.count()
-    total_reminders = reminders.count()
+# How many days of recurring doses the reminders page shows.
+SCHEDULE_DISPLAY_DAYS = 7
 
-    next_reminder = reminders.order_by('reminder_time').first()
 
-    return render(request, "dashboard.html", {
-        "total_medicines": total_medicines,
-        "total_reminders": total_reminders,
-        "next_dose_time": next_reminder.reminder_time if next_reminder else None,
-        "next_dose_medicine": next_reminder.medicine.name if next_reminder else None,
-    })
+@login_required
+def dashboard(request):
+    return render(request, "dashboard.html", get_dashboard_summary(request.user))
 
 
 @login_required
@@ -34,7 +57,9 @@ def add_medicine(request):
     if request.method == "POST":
         form = MedicineForm(request.POST)
         if form.is_valid():
-            form.save()
+            medicine = form.save(commit=False)
+            medicine.owner = request.user
+            medicine.save()
             messages.success(request, "Medicine added.")
             return redirect('medicines_list')
     else:
@@ -42,28 +67,65 @@ def add_medicine(request):
     return render(request, "add_medicine.html", {"form": form})
 
 
+REMINDERS_PAGE_SIZE = 20
+# Keyset orderings of the two reminder lists; "id" breaks ties so cursors
+# are stable.
+REMINDER_ORDERINGS = {
+    "upcoming": ("reminder_time", "id"),
+    "past": HISTORY_ORDERING,
+}
+
+
+def _reminder_page(user, section, cursor=None):
+    # History continues into the archive (see core.archive).
+    if section == "past":
+        return history_page(user, cursor, REMINDERS_PAGE_SIZE)
+    # The template only shows the medicine name and time of each row.
+    rows = Reminder.objects.select_related('medicine').only(
+        'reminder_time', 'medicine__name'
+    ).filter(user=user, delivered=False)
+    return keyset_page(rows, REMINDER_ORDERINGS[section], cursor, REMINDERS_PAGE_SIZE)
+
+
 @login_required
 def reminders(request):
-    upcoming = Reminder.objects.filter(
-        user=request.user,
-        delivered=False
-    ).order_by('reminder_time')
-
-    past = Reminder.objects.filter(
-        user=request.user,
-        delivered=True
-    ).order_by('-reminder_time')
+    # Infinite scroll asks for the next page of one list as an HTML fragment.
+    section = request.GET.get("section")
+    if section in REMINDER_ORDERINGS:
+        try:
+            rows, next_cursor = _reminder_page(request.user, section, request.GET.get("cursor"))
+        except InvalidCursor:
+            return HttpResponseBadRequest("Invalid cursor.")
+        return render(request, "reminder_rows.html", {
+            "rows": rows, "section": section, "next_cursor": next_cursor,
+        })
+
+    upcoming, upcoming_next = _reminder_page(request.user, "upcoming")
+    past, past_next = _reminder_page(request.user, "past")
+
+    # Recurring doses beyond the stored window are expanded on the fly, and
+    # only for the days shown here.
+    now = timezone.now()
+    schedules = MedicineSchedule.objects.filter(user=request.user).select_related('medicine').annotate(
+        stored_until=Max('reminder__reminder_time')
+    )
+    scheduled = upcoming_doses(
+        schedules, now + window_size(), now + timedelta(days=SCHEDULE_DISPLAY_DAYS)
+    )
 
     return render(request, "reminders.html", {
         "upcoming": upcoming,
-        "past": past
+        "upcoming_next": upcoming_next,
+        "scheduled": scheduled,
+        "past": past,
+        "past_next": past_next,
     })
 
 
 @login_required
 def add_reminder(request):
     if request.method == "POST":
-        form = ReminderForm(request.POST)
+        form = ReminderForm(request.POST, user=request.user)
         if form.is_valid():
             reminder = form.save(commit=False)
             reminder.user = request.user
@@ -80,7 +142,7 @@ def add_reminder(request):
             messages.success(request, "Reminder added.")
             return redirect('reminders')
     else:
-        form = ReminderForm()
+        form = ReminderForm(user=request.user)
 
     return render(request, "add_reminder.html", {"form": form})
 
@@ -138,15 +200,34 @@ def logout_view(request):
     return redirect('login')
 
 
+@login_required
+def adherence(request):
+    return render(request, "adherence.html", {
+        "windows": ADHERENCE_WINDOWS,
+        "rows": adherence_summary(request.user),
+    })
+
+
+MEDICINES_PAGE_SIZE = 24
+
+
 @login_required
 def medicines_list(request):
-    medicines = Medicine.objects.all().order_by('name')
-    return render(request, "medicines_list.html", {"medicines": medicines})
+    try:
+        medicines, next_cursor = keyset_page(
+            Medicine.objects.filter(owner=request.user), ("name", "id"), request.GET.get("cursor"), MEDICINES_PAGE_SIZE
+        )
+    except InvalidCursor:
+        return HttpResponseBadRequest("Invalid cursor.")
+
+    # Infinite scroll fetches later pages as a fragment of cards.
+    template = "medicine_cards.html" if request.GET.get("cursor") else "medicines_list.html"
+    return render(request, template, {"medicines": medicines, "next_cursor": next_cursor})
 
 
 @login_required
 def edit_medicine(request, pk):
-    med = get_object_or_404(Medicine, pk=pk)
+    med = get_object_or_404(Medicine, pk=pk, owner=request.user)
     if request.method == "POST":
         form = MedicineForm(request.POST, instance=med)
         if form.is_valid():
@@ -158,9 +239,31 @@ def edit_medicine(request, pk):
     return render(request, "edit_medicine.html", {"form": form, "medicine": med})
 
 
+@login_required
+def edit_schedule(request, pk):
+    med = get_object_or_404(Medicine, pk=pk, owner=request.user)
+    schedule = MedicineSchedule.objects.filter(medicine=med).first()
+    if request.method == "POST":
+        form = MedicineScheduleForm(request.POST, instance=schedule)
+        if form.is_valid():
+            schedule = form.save(commit=False)
+            schedule.medicine = med
+            schedule.user = request.user
+            schedule.save()
+            if form.cleaned_data["whole_course"]:
+                created = generate_course(schedule)
+                messages.success(request, f"Schedule saved; {len(created)} reminders created.")
+            else:
+                messages.success(request, "Schedule saved.")
+            return redirect('reminders')
+    else:
+        form = MedicineScheduleForm(instance=schedule)
+    return render(request, "edit_schedule.html", {"form": form, "medicine": med})
+
+
 @login_required
 def delete_medicine(request, pk):
-    med = get_object_or_404(Medicine, pk=pk)
+    med = get_object_or_404(Medicine, pk=pk, owner=request.user)
     if request.method == "POST":
         med.delete()
         messages.success(request, "Medicine deleted.")
@@ -170,10 +273,10 @@ def delete_medicine(request, pk):
 
 @login_required
 def edit_reminder(request, pk):
-    reminder = get_object_or_404(Reminder, pk=pk)
+    reminder = get_object_or_404(Reminder, pk=pk, user=request.user)
 
     if request.method == "POST":
-        form = ReminderForm(request.POST, instance=reminder)
+        form = ReminderForm(request.POST, instance=reminder, user=request.user)
         if form.is_valid():
             reminder = form.save(commit=False)
 
@@ -187,14 +290,14 @@ def edit_reminder(request, pk):
             messages.success(request, "Reminder updated.")
             return redirect('reminders')
     else:
-        form = ReminderForm(instance=reminder)
+        form = ReminderForm(instance=reminder, user=request.user)
 
     return render(request, "edit_reminder.html", {"form": form, "reminder": reminder})
 
 
 @login_required
 def delete_reminder(request, pk):
-    reminder = get_object_or_404(Reminder, pk=pk)
+    reminder = get_object_or_404(Reminder, pk=pk, user=request.user)
     if request.method == "POST":
         reminder.delete()
         messages.success(request, "Reminder deleted.")
@@ -202,22 +305,455 @@ def delete_reminder(request, pk):
     return render(request, "confirm_delete_reminder.html", {"reminder": reminder})
 
 
+def _reminders_etag(request):
+    version = UserProfile.objects.filter(user=request.user).values_list(
+        'reminders_version', flat=True
+    ).first()
+    if version is None:
+        return None
+    return f"{request.user.pk}-{version}"
+
+
 @login_required
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=_reminders_etag)
 def api_get_reminders(request):
-    reminders = Reminder.objects.filter(user=request.user, delivered=False)
+    reminders = Reminder.objects.filter(
+        user=request.user, delivered=False
+    ).order_by('reminder_time').values_list('id', 'medicine__name', 'reminder_time')
     return JsonResponse([
         {
-            "id": r.id,
-            "medicine": r.medicine.name,
-            "time": r.reminder_time.isoformat(),
-            "delivered": r.delivered
-        } for r in reminders
+            "id": pk,
+            "medicine": medicine_name,
+            "time": reminder_time.isoformat(),
+            "delivered": False
+        } for pk, medicine_name, reminder_time in reminders
     ], safe=False)
 
 
+def _parse_sync_version(value, user):
+    """
+    Split a "<user>:<change seq>" token from a previous sync; tokens of
+    another user (the browser's cache is shared) are ignored.
+    """
+    try:
+        user_id, seq = (int(part) for part in value.split(":"))
+    except (AttributeError, ValueError):
+        return None
+    return seq if user_id == user.pk else None
+
+
+@login_required
+@require_GET
+def api_reminder_changes(request):
+    """
+    Delta sync for the service worker's offline copy of the pending list.
+    ?since=<version> from the previous answer returns {"changed": false}
+    while nothing changed, reading only the user's change sequence.
+    Otherwise the answer holds the pending reminders created or edited
+    since then, the ids that were delivered, acknowledged or deleted, and
+    the version to send next time. Without a usable version the whole
+    list is sent ("full": true) and replaces whatever the client held.
+    """
+    seq = current_seq(request.user)
+    since = _parse_sync_version(request.GET.get("since"), request.user)
+    if since is not None and since >= seq:
+        return JsonResponse({"changed": False, "version": request.GET["since"]})
+
+    rows = Reminder.objects.filter(user=request.user)
+    removed = []
+    if since is None:
+        rows = rows.filter(delivered=False)
+    else:
+        rows = rows.filter(change_seq__gt=since)
+        removed = list(Tombstone.objects.filter(
+            user=request.user, kind=Tombstone.REMINDER, change_seq__gt=since
+        ).values_list('object_id', flat=True))
+
+    pending = []
+    for pk, medicine_name, reminder_time, delivered in rows.order_by('reminder_time').values_list(
+        'id', 'medicine__name', 'reminder_time', 'delivered'
+    ):
+        if delivered:
+            removed.append(pk)
+        else:
+            pending.append({"id": pk, "medicine": medicine_name, "time": reminder_time.isoformat()})
+    return JsonResponse({
+        "changed": True,
+        "version": f"{request.user.pk}:{seq}",
+        "full": since is None,
+        "reminders": pending,
+        "removed": removed,
+    })
+
+
+@login_required
+@require_GET
+def api_sync(request):
+    """
+    Delta sync of the user's medicines and reminders for API clients.
+    ?cursor=<token> from the previous answer returns {"changed": false}
+    while nothing changed, and otherwise only the rows changed and the ids
+    deleted since; without a usable cursor everything is sent. Cursors are
+    "<user>:<change seq>" tokens, as in api_reminder_changes. Rows come as
+    lists under a "fields" header.
+    """
+    cursor = _parse_sync_version(request.GET.get("cursor"), request.user)
+    changes = changes_since(request.user, cursor)
+    if changes is None:
+        return JsonResponse({"changed": False, "cursor": request.GET["cursor"]})
+    changes.update(changed=True, cursor=f"{request.user.pk}:{changes['cursor']}")
+    return JsonResponse(changes, json_dumps_params={"separators": (",", ":")})
+
+
+# Largest page the JSON list API will return.
+API_MAX_PAGE_SIZE = 100
+
+
+@login_required
+@require_GET
+def api_reminders(request):
+    """
+    Cursor-paginated reminders: ?status=pending (soonest first) or
+    ?status=delivered (latest first), plus the "next" cursor from the
+    previous page and an optional limit.
+    """
+    status = request.GET.get("status", "pending")
+    if status not in ("pending", "delivered"):
+        return JsonResponse({"error": "status must be pending or delivered."}, status=400)
+    try:
+        limit = min(int(request.GET.get("limit", REMINDERS_PAGE_SIZE)), API_MAX_PAGE_SIZE)
+    except ValueError:
+        return JsonResponse({"error": "limit must be a number."}, status=400)
+
+    cursor, limit = request.GET.get("cursor"), max(limit, 1)
+    try:
+        if status == "delivered":
+            page, next_cursor = history_page(request.user, cursor, limit)
+        else:
+            rows = Reminder.objects.filter(user=request.user, delivered=False).values(
+                'id', 'reminder_time', 'status', medicine_name=F('medicine__name')
+            )
+            page, next_cursor = keyset_page(rows, REMINDER_ORDERINGS["upcoming"], cursor, limit)
+    except InvalidCursor:
+        return JsonResponse({"error": "Invalid cursor."}, status=400)
+
+    return JsonResponse({
+        "results": [
+            {
+                "id": row['id'],
+                "medicine": row['medicine_name'],
+                "time": row['reminder_time'].isoformat(),
+                "status": row['status'],
+            } for row in page
+        ],
+        "next": next_cursor,
+    })
+
+
 @login_required
 def api_mark_delivered(request, pk):
     reminder = get_object_or_404(Reminder, pk=pk, user=request.user)
+    first_ack = not reminder.status
+    was_dispatched = reminder.delivered
+
     reminder.delivered = True
-    reminder.save()
+    if first_ack:
+        reminder.status = Reminder.STATUS_TAKEN
+        reminder.acknowledged_at = timezone.now()
+    with transaction.atomic():
+        reminder.save()
+        if first_ack:
+            record_acks([(
+                Dose(reminder.pk, reminder.user_id, reminder.medicine_id, reminder.reminder_time),
+                reminder.status, reminder.acknowledged_at, was_dispatched,
+            )])
     return JsonResponse({"status": "ok"})
+
+
+# Upper bound on acknowledgements accepted in one batch request.
+MAX_ACKS_PER_REQUEST = 500
+
+
+@login_required
+@require_POST
+def api_ack_reminders(request):
+    """
+    Acknowledge many reminders in one request, e.g. after the client was
+    offline. Body: {"acks": [{"id": 1, "status": "taken", "at": "<iso>"}]},
+    where status ("taken" or "skipped") and at are optional. All acks are
+    applied with one UPDATE and the response maps each id to its outcome;
+    ids that were already acknowledged are reported as duplicates.
+    """
+    try:
+        acks = json.loads(request.body)["acks"]
+        if not isinstance(acks, list):
+            raise TypeError
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({"error": "Expected a JSON body with an 'acks' list."}, status=400)
+    if len(acks) > MAX_ACKS_PER_REQUEST:
+        return JsonResponse({"error": f"At most {MAX_ACKS_PER_REQUEST} acks per request."}, status=400)
+
+    now = timezone.now()
+    valid_statuses = {value for value, _ in Reminder.STATUS_CHOICES}
+    results = {}
+    parsed = {}
+    for ack in acks:
+        pk = ack.get("id") if isinstance(ack, dict) else None
+        if not isinstance(pk, int):
+            continue
+        status = ack.get("status") or Reminder.STATUS_TAKEN
+        try:
+            at = parse_datetime(ack["at"]) if isinstance(ack.get("at"), str) else now
+        except ValueError:
+            # Well formed but impossible, such as month 13.
+            at = None
+        if not isinstance(status, str) or status not in valid_statuses or at is None:
+            results[pk] = "invalid"
+            continue
+        if timezone.is_naive(at):
+            at = timezone.make_aware(at)
+        parsed[pk] = (status, at)
+
+    # Only the first acknowledgement of a dose counts, so retried batches
+    # from the client's offline queue are harmless.
+    owned = {
+        row[0]: row
+        for row in Reminder.objects.filter(user=request.user, pk__in=parsed).values_list(
+            "pk", "medicine_id", "reminder_time", "delivered", "status"
+        )
+    }
+    fresh = [pk for pk, row in owned.items() if not row[4]]
+    for pk in parsed:
+        if pk not in owned:
+            results[pk] = "not_found"
+        else:
+            results[pk] = "ok" if pk in fresh else "duplicate"
+
+    if fresh:
+        with transaction.atomic():
+            # update() skips the post_save signal that records the change.
+            seq = next_seqs([request.user.pk]).get(request.user.pk, 0)
+            Reminder.objects.filter(user=request.user, pk__in=fresh).update(
+                change_seq=seq,
+                delivered=True,
+                status=Case(*[When(pk=pk, then=Value(parsed[pk][0])) for pk in fresh]),
+                acknowledged_at=Case(*[When(pk=pk, then=Value(parsed[pk][1])) for pk in fresh]),
+            )
+            record_acks([
+                (
+                    Dose(pk, request.user.pk, owned[pk][1], owned[pk][2]),
+                    parsed[pk][0], parsed[pk][1], owned[pk][3],
+                )
+                for pk in fresh
+            ])
+        invalidate_dashboard([request.user.pk])
+
+    return JsonResponse({"results": {str(pk): outcome for pk, outcome in results.items()}})
+
+
+async def _reminder_events(user_id):
+    """
+    Yield an SSE event each time the user's earliest pending reminder becomes
+    due. Sleeps until that reminder's time, re-reading it only when the
+    process's shared check loop (core.streams) reports that the user's
+    reminders changed, which is also passed on as a "changed" event for
+    clients that keep their own copy. Sends a keep-alive every
+    REMINDER_STREAM_RECHECK seconds and closes after REMINDER_STREAM_MAX_AGE
+    seconds so the browser reconnects with a fresh request.
+    """
+    keepalive = recheck_interval()
+    max_age = getattr(settings, "REMINDER_STREAM_MAX_AGE", 300)
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + max_age
+    last_sent = None
+
+    def next_pending():
+        return Reminder.objects.filter(
+            user_id=user_id, delivered=False
+        ).order_by('reminder_time').values_list(
+            'id', 'medicine__name', 'reminder_time'
+        ).afirst()
+
+    yield "retry: 5000\n\n"
+
+    changed = stream_hub.subscribe(user_id)
+    try:
+        row = await next_pending()
+        while loop.time() < deadline:
+            wait = keepalive
+            event = ": keep-alive\n\n"
+            if row is not None:
+                pk, medicine_name, reminder_time = row
+                until_due = (reminder_time - timezone.now()).total_seconds()
+                if until_due > 0:
+                    wait = min(wait, until_due)
+                elif pk != last_sent:
+                    data = json.dumps({
+                        "id": pk,
+                        "medicine": medicine_name,
+                        "time": reminder_time.isoformat(),
+                    })
+                    event = f"id: {pk}\nevent: reminder\ndata: {data}\n\n"
+                    last_sent = pk
+            yield event
+
+            try:
+                await asyncio.wait_for(changed.wait(), max(0, min(wait, deadline - loop.time())))
+            except asyncio.TimeoutError:
+                continue
+            changed.clear()
+            yield "event: changed\ndata: {}\n\n"
+            row = await next_pending()
+    finally:
+        stream_hub.unsubscribe(user_id, changed)
+
+
+async def api_reminder_stream(request):
+    # Holding the connection open is only cheap under ASGI (medcia/asgi.py).
+    # Under WSGI answer 204, which tells EventSource to stop and makes the
+    # client fall back to polling.
+    if not isinstance(request, ASGIRequest):
+        return HttpResponse(status=204)
+
+    user_id = await sync_to_async(
+        lambda: request.user.pk if request.user.is_authenticated else None
+    )()
+    if user_id is None:
+        return HttpResponseForbidden()
+
+    response = StreamingHttpResponse(_reminder_events(user_id), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+@login_required
+@require_POST
+def api_import(request):
+    kind = request.POST.get("kind")
+    upload = request.FILES.get("file")
+    if kind not in ("medicines", "reminders") or upload is None:
+        return JsonResponse({"error": "Send a 'file' and a 'kind' of medicines or reminders."}, status=400)
+
+    fmt = request.POST.get("format") or bulk.guess_format(upload.name)
+    if fmt not in bulk.FORMATS:
+        return JsonResponse({"error": f"Unknown format {fmt!r}."}, status=400)
+
+    # Rows are parsed straight off the uploaded file, one at a time.
+    lines = io.TextIOWrapper(upload.file, encoding="utf-8", newline="")
+    rows = bulk.iter_rows(lines, fmt)
+    if kind == "medicines":
+        result = bulk.import_medicines(rows, request.user)
+    else:
+        result = bulk.import_reminders(rows, request.user)
+
+    data = {"created": result.created, "failed": result.failed, "errors": result.errors}
+    if result.parse_error:
+        # Rows before the error are already imported; say how many, so the
+        # client does not upload them again.
+        data["error"] = f"Could not parse file: {result.parse_error}"
+        return JsonResponse(data, status=400)
+    return JsonResponse(data)
+
+
+@login_required
+@require_GET
+def api_export(request, kind):
+    fmt = request.GET.get("format", "csv")
+    if fmt not in bulk.FORMATS:
+        return JsonResponse({"error": f"Unknown format {fmt!r}."}, status=400)
+
+    if kind == "medicines":
+        content = bulk.export_medicines(request.user, fmt)
+    elif kind == "reminders":
+        content = bulk.export_reminders(request.user, fmt)
+    else:
+        raise Http404("Nothing to export.")
+
+    content_type = "text/csv" if fmt == "csv" else "application/x-ndjson"
+    response = StreamingHttpResponse(content, content_type=content_type)
+    response["Content-Disposition"] = f'attachment; filename="{kind}.{fmt}"'
+    return response
+
+
+@login_required
+@require_http_methods(["GET", "POST", "DELETE"])
+def api_push_subscriptions(request):
+    """
+    GET returns the VAPID public key the browser subscribes with. POST
+    stores the JSON of a browser PushSubscription for this user (re-posting
+    the same endpoint updates it); DELETE with {"endpoint": ...} removes it.
+    """
+    if request.method == "GET":
+        return JsonResponse({"public_key": getattr(settings, "WEBPUSH_VAPID_PUBLIC_KEY", None)})
+
+    try:
+        data = json.loads(request.body)
+        endpoint = data["endpoint"]
+        URLValidator(schemes=["http", "https"])(endpoint)
+    except (ValueError, KeyError, TypeError, ValidationError):
+        return JsonResponse({"error": "Expected a JSON body with a valid 'endpoint'."}, status=400)
+
+    if request.method == "DELETE":
+        PushSubscription.objects.filter(user=request.user, endpoint=endpoint).delete()
+        return HttpResponse(status=204)
+
+    keys = data.get("keys")
+    if not isinstance(keys, dict) or not keys.get("p256dh") or not keys.get("auth"):
+        return JsonResponse({"error": "Subscription keys are missing."}, status=400)
+    _, created = PushSubscription.objects.update_or_create(
+        endpoint=endpoint,
+        defaults={"user": request.user, "p256dh": keys["p256dh"], "auth": keys["auth"]},
+    )
+    return JsonResponse({"ok": True}, status=201 if created else 200)
+
+
+@login_required
+@require_POST
+def api_generate_reminders(request, pk):
+    """
+    Save a medicine's dose schedule and store reminders for the rest of its
+    course in one request. Body: {"times_of_day": ["08:00", "20:00"],
+    "interval_days": 1, "weekdays": [1, 4]}, the last two optional. Doses
+    that already have a reminder are skipped.
+    """
+    med = get_object_or_404(Medicine, pk=pk, owner=request.user)
+    try:
+        payload = json.loads(request.body)
+        times = payload["times_of_day"]
+        if not isinstance(times, list):
+            raise TypeError
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({"error": "Expected a JSON body with a 'times_of_day' list."}, status=400)
+
+    form = MedicineScheduleForm(
+        data={
+            "times_of_day": ",".join(str(t) for t in times),
+            "interval_days": payload.get("interval_days", 1),
+            "weekdays": payload.get("weekdays") or [],
+        },
+        instance=MedicineSchedule.objects.filter(medicine=med).first(),
+    )
+    if not form.is_valid():
+        return JsonResponse({"errors": form.errors.get_json_data()}, status=400)
+
+    schedule = form.save(commit=False)
+    schedule.medicine = med
+    schedule.user = request.user
+    schedule.save()
+    created = generate_course(schedule)
+    return JsonResponse({
+        "created": len(created),
+        "until": course_end(med).isoformat(),
+    }, status=201)
+
+
+@staff_member_required
+@require_GET
+def metrics(request):
+    if request.GET.get("format") == "prometheus":
+        return HttpResponse(
+            metrics_registry.prometheus(), content_type="text/plain; version=0.0.4"
+        )
+    return JsonResponse(metrics_registry.snapshot())
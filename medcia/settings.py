@@ -49,6 +49,8 @@ INSTALLED_APPS = [
 
 
 MIDDLEWARE = [
+    # First, so its timings cover the rest of the stack.
+    'core.metrics.PerformanceMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -58,11 +60,20 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Per-view timing histograms, Server-Timing headers and the /metrics/
+# endpoint. Slow requests are logged with their SQL when
+# PERF_SLOW_REQUEST_MS is set. The JSON metrics cover the last
+# PERF_METRICS_WINDOW_SECONDS; the Prometheus format has running totals.
+PERF_METRICS_ENABLED = os.environ.get('MEDCIA_PERF_METRICS') == '1'
+PERF_SLOW_REQUEST_MS = None
+PERF_METRICS_WINDOW_SECONDS = 300
+
 ROOT_URLCONF = 'medcia.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # Django's backend plus render timing for core.metrics.
+        'BACKEND': 'core.metrics.InstrumentedDjangoTemplates',
         'DIRS': [BASE_DIR / 'templates'],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -86,9 +97,35 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': str(BASE_DIR / 'db.sqlite3'),
+        # Keep each thread's connection (and its pragmas and page cache)
+        # between requests instead of reopening the file every time.
+        'CONN_MAX_AGE': int(os.environ.get('MEDCIA_CONN_MAX_AGE', 600)),
+        'CONN_HEALTH_CHECKS': True,
+    }
+}
+
+# Pragmas run on every new SQLite connection (see core.db): WAL, a 5 s
+# busy timeout, synchronous=NORMAL and a 128 MB mmap. Entries here override
+# them; None drops one.
+SQLITE_PRAGMAS = {}
+
+
+# Cache
+# The dashboard summary is cached per user; point this at a shared backend
+# (Redis, Memcached) when running more than one process.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
     }
 }
 
+DASHBOARD_CACHE_TIMEOUT = 300
+
+# Delivered reminders older than this many days are moved to the archive
+# table by `manage.py archive_reminders` (run it daily from cron).
+REMINDER_RETENTION_DAYS = 90
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
@@ -142,3 +179,25 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # Email backend for development (shows emails in the terminal)
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
 DEFAULT_FROM_EMAIL = 'medcia@example.com'
+
+
+# Reminder delivery channels (see core.notifications). Each entry names a
+# backend class and its OPTIONS; SMS is skipped until Twilio is configured,
+# and Web Push until pywebpush is installed and the VAPID keys below are set.
+NOTIFICATION_CHANNELS = {
+    'email': {'BACKEND': 'core.notifications.EmailChannel'},
+    'sms': {'BACKEND': 'core.notifications.TwilioSMSChannel'},
+    'push': {'BACKEND': 'core.notifications.WebPushChannel'},
+}
+
+# Token-bucket limits (sends per second, burst) shared by the channels that
+# name the provider in "PROVIDER"; a channel can add its own "RATE_LIMIT".
+# Buckets are per process, so divide the provider's quota between the
+# dispatchers you run. Sends that would wait longer than
+# DISPATCH_RATE_LIMIT_MAX_WAIT seconds are deferred and retried.
+NOTIFICATION_PROVIDER_LIMITS = {}
+
+# Generate a key pair with `vapid --gen` (py-vapid, installed with pywebpush).
+WEBPUSH_VAPID_PUBLIC_KEY = os.environ.get('MEDCIA_VAPID_PUBLIC_KEY')
+WEBPUSH_VAPID_PRIVATE_KEY = os.environ.get('MEDCIA_VAPID_PRIVATE_KEY')
+WEBPUSH_VAPID_SUBJECT = 'mailto:medcia@example.com'